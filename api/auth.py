@@ -4,7 +4,7 @@ from google.oauth2 import id_token
 from google.auth.transport import requests
 import jwt, time
 
-from src.neo4j_connector import get_neo4j_driver
+from src.fact_store import get_fact_store
 
 router = APIRouter()
 
@@ -19,7 +19,6 @@ class GoogleLoginRequest(BaseModel):
 
 @router.post("/google-login")
 def google_login(payload: GoogleLoginRequest):
-    driver = None
     try:
         # 1. LOG TOKEN
         print("Received ID Token:", payload.id_token)
@@ -38,17 +37,8 @@ def google_login(payload: GoogleLoginRequest):
         email = idinfo.get("email")
         name = idinfo.get("name")
 
-        # 3. SAVE USER IN NEO4J
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-            session.run(
-                """
-                MERGE (u:User {google_id: $gid})
-                SET u.email = $email,
-                    u.name = $name
-                """,
-                {"gid": google_id, "email": email, "name": name},
-            )
+        # 3. SAVE USER (Neo4j hoặc store local)
+        get_fact_store().upsert_user(google_id, email, name)
 
         jwt_payload = {
             "sub": google_id,
@@ -69,8 +59,4 @@ def google_login(payload: GoogleLoginRequest):
 
     except Exception as e:
         print(f"LỖI XÁC THỰC GOOGLE ID TOKEN CHI TIẾT: {e}")
-        raise HTTPException(status_code=401, detail="Invalid ID Token")
-    
-    finally:
-        if driver:
-            driver.close()
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid ID Token")
\ No newline at end of file
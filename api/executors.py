@@ -0,0 +1,310 @@
+"""
+Executor có giới hạn cho phần việc nặng CPU (OCR, NLP) để không chạy trên event loop.
+
+- OCR  : pool process dựng sẵn, mỗi process 1 EasyOCR Reader (OCR_WORKERS, OCR_TORCH_THREADS)
+- NLP  : ThreadPoolExecutor (trích mã + tra facts, nhanh, phần lớn là I/O nhỏ)
+
+Mỗi executor có:
+  - max_concurrency : số job chạy cùng lúc
+  - max_queue       : số job được chờ thêm; vượt quá -> ExecutorBusy (API trả 503)
+  - timeout         : quá hạn -> ExecutorTimeout (API trả 504); job vẫn giữ slot tới khi
+                      thực sự xong để không đẩy thêm việc vào pool đang kẹt
+  - pool hỏng       : 1 worker chết (OOM, segfault...) làm hỏng cả ProcessPoolExecutor ->
+                      bỏ pool đó, trả ExecutorUnavailable (API trả 503); job sau dựng pool mới
+Cấu hình qua biến môi trường OCR_* / NLP_* bên dưới.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor, Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from src.ocr_module import (
+    OCR_TILING,
+    OCR_WORKERS,
+    create_ocr_worker_pool,
+    extract_text_tiered,
+    merge_tile_results,
+    ocr_tile,
+    prepare_image,
+    split_tiles,
+    text_from_lines,
+)
+
+
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", "8"))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "60"))
+
+NLP_WORKERS = int(os.getenv("NLP_WORKERS", "4"))
+NLP_MAX_QUEUE = int(os.getenv("NLP_MAX_QUEUE", "64"))
+NLP_TIMEOUT = float(os.getenv("NLP_TIMEOUT", "15"))
+
+
+class ExecutorBusy(Exception):
+    """Hàng đợi của executor đã đầy."""
+
+
+class ExecutorTimeout(Exception):
+    """Job chạy quá thời gian cho phép."""
+
+
+class ExecutorUnavailable(Exception):
+    """Pool bị hỏng (worker chết giữa chừng); đã bỏ pool, job sau sẽ dùng pool mới."""
+
+
+class BoundedExecutor:
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[int], Executor],
+        max_concurrency: int,
+        max_queue: int,
+        timeout: Optional[float],
+    ) -> None:
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._factory = factory
+        self._pool: Optional[Executor] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.pool_restarts = 0
+        self.max_queued = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._factory(self.max_concurrency)
+            return self._pool
+
+    def _discard_pool(self, pool: Optional[Executor]) -> None:
+        # nhiều job cùng thấy pool hỏng -> chỉ job đầu tiên bỏ nó; pool mới đã dựng thì giữ nguyên
+        with self._lock:
+            if pool is None or self._pool is not pool:
+                return
+            self._pool = None
+            self.pool_restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def start(self) -> None:
+        """Tạo pool trước (gọi trong lifespan) để request đầu không phải chờ."""
+        self._get_pool()
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """timeout: thời gian còn lại của request (None = self.timeout)."""
+        return (await self._run_job(fn, [args], timeout))[0]
+
+    async def run_many(self, fn: Callable[[Any], Any], items: List[Any], timeout: Optional[float] = None) -> List[Any]:
+        """
+        fn(item) cho từng item, chạy song song trên mọi worker của pool (vd. các ô của 1 ảnh lớn).
+        Cả nhóm tính là 1 job: 1 lượt xét hàng đợi, 1 slot semaphore, chung 1 timeout —
+        nhưng chiếm tới len(items) worker cùng lúc. 1 item lỗi / hết giờ / bị huỷ thì các item
+        chưa chạy bị huỷ; slot chỉ trả lại khi mọi item đã submit thật sự kết thúc.
+        """
+        return await self._run_job(fn, [(it,) for it in items], timeout)
+
+    async def _run_job(
+        self,
+        fn: Callable[..., Any],
+        calls: List[tuple],
+        timeout: Optional[float] = None,
+    ) -> List[Any]:
+        if timeout is None:
+            timeout = self.timeout
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        if self.running >= self.max_concurrency and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.name}: hàng đợi đầy ({self.queued}/{self.max_queue})")
+
+        t_enq = time.perf_counter()
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await self._sem.acquire()
+        finally:
+            self.queued -= 1
+
+        t_start = time.perf_counter()
+        self._wait_total += t_start - t_enq
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        futures: List[Future] = []
+        try:
+            if pool is None:
+                # pool vừa bị bỏ (hoặc chưa tạo): dựng lại ngoài event loop vì OCR warm-up chạy đồng bộ
+                pool = await asyncio.to_thread(self._get_pool)
+            for args in calls:
+                futures.append(pool.submit(fn, *args))
+        except BaseException as e:
+            # các item đã submit vẫn giữ slot tới khi xong; item chưa chạy thì huỷ luôn
+            self._track(loop, futures, t_start, failed=True)
+            if isinstance(e, BrokenExecutor):
+                self._discard_pool(pool)
+                raise ExecutorUnavailable(f"{self.name}: pool worker bị hỏng, đang khởi động lại") from e
+            raise
+
+        self._track(loop, futures, t_start)
+        results = asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+        # lỗi của gather sau khi caller đã bỏ đi (timeout) không cần báo lại
+        results.add_done_callback(lambda g: g.cancelled() or g.exception())
+        try:
+            return await asyncio.wait_for(asyncio.shield(results), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            # timeout hiệu lực của lần gọi này (có thể chỉ là phần còn lại của hạn request)
+            raise ExecutorTimeout(f"{self.name}: quá {timeout:.1f}s")
+        except BrokenExecutor as e:
+            self._discard_pool(pool)
+            raise ExecutorUnavailable(f"{self.name}: pool worker bị hỏng, đang khởi động lại") from e
+        finally:
+            # thành công thì mọi future đã xong, cancel() không làm gì
+            for f in futures:
+                f.cancel()
+
+    def _track(self, loop: asyncio.AbstractEventLoop, futures: List[Future], t_start: float, failed: bool = False) -> None:
+        """Trả slot khi mọi future của job đã kết thúc (kể cả khi caller đã timeout / bị huỷ)."""
+        if failed:
+            for f in futures:
+                f.cancel()
+        left = len(futures)
+
+        def _one_done(f: Future) -> None:
+            nonlocal left, failed
+            left -= 1
+            if f.cancelled() or f.exception() is not None:
+                failed = True
+            if left == 0:
+                _release()
+
+        def _release() -> None:
+            self.running -= 1
+            self._run_total += time.perf_counter() - t_start
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self._sem.release()
+
+        def _from_worker(f: Future) -> None:
+            # callback của concurrent future chạy trên thread của pool -> chuyển về event loop
+            try:
+                loop.call_soon_threadsafe(_one_done, f)
+            except RuntimeError:
+                pass  # loop đã đóng (tắt server)
+
+        if not futures:
+            _release()
+        for f in futures:
+            f.add_done_callback(_from_worker)
+
+    def stats(self) -> Dict[str, Any]:
+        done = self.completed + self.failed
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "timeout_s": self.timeout,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "pool_restarts": self.pool_restarts,
+            "avg_wait_ms": round(self._wait_total / done * 1000, 2) if done else 0.0,
+            "avg_run_ms": round(self._run_total / done * 1000, 2) if done else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+OCR_EXECUTOR = BoundedExecutor(
+    "ocr",
+    # N process dựng sẵn, mỗi process 1 EasyOCR Reader (xem ocr_module.create_ocr_worker_pool)
+    lambda n: create_ocr_worker_pool(n),
+    OCR_WORKERS,
+    OCR_MAX_QUEUE,
+    OCR_TIMEOUT,
+)
+
+NLP_EXECUTOR = BoundedExecutor(
+    "nlp",
+    lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix="nlp"),
+    NLP_WORKERS,
+    NLP_MAX_QUEUE,
+    NLP_TIMEOUT,
+)
+
+
+async def run_ocr(fn: Callable[..., Any], *args: Any) -> Any:
+    return await OCR_EXECUTOR.run(fn, *args)
+
+
+async def run_ocr_image(content: bytes) -> Dict[str, Any]:
+    """
+    OCR 1 ảnh upload: lượt nhanh + lượt đầy đủ trong 1 worker như extract_text_tiered;
+    riêng ảnh lớn cần chia ô thì các ô được nhận dạng song song trên mọi worker OCR
+    rồi ghép + bỏ trùng đường nối ở process API.
+    Cả 2 lượt dùng chung 1 hạn OCR_TIMEOUT: lượt chia ô chỉ được phần thời gian còn lại.
+    """
+    if not OCR_TILING:
+        return await run_ocr(extract_text_tiered, content)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + OCR_TIMEOUT
+    ocr = await run_ocr(extract_text_tiered, content, False)
+    if not ocr.get("needs_tiling"):
+        return ocr
+
+    t0 = time.perf_counter()
+    gray = await asyncio.to_thread(prepare_image, content)
+    tiles = split_tiles(gray)
+    remaining = deadline - loop.time()
+    if remaining <= 0:
+        OCR_EXECUTOR.timeouts += 1
+        raise ExecutorTimeout(f"ocr: quá {OCR_TIMEOUT}s")
+    results = await OCR_EXECUTOR.run_many(ocr_tile, [t for _, _, t in tiles], timeout=remaining)
+    text, conf, region = text_from_lines(merge_tile_results(tiles, results))
+    return {
+        "text": text,
+        "tier": "tiled",
+        "region": region,
+        "confidence": round(conf, 4),
+        "tiles": len(tiles),
+        "fast_ms": ocr.get("fast_ms", 0.0),
+        "full_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+    }
+
+
+async def run_nlp(fn: Callable[..., Any], *args: Any) -> Any:
+    return await NLP_EXECUTOR.run(fn, *args)
+
+
+def start_executors() -> None:
+    NLP_EXECUTOR.start()
+    OCR_EXECUTOR.start()
+
+
+def shutdown_executors() -> None:
+    OCR_EXECUTOR.shutdown()
+    NLP_EXECUTOR.shutdown()
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    return {"ocr": OCR_EXECUTOR.stats(), "nlp": NLP_EXECUTOR.stats()}
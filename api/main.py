@@ -1,17 +1,36 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional, List
+from contextlib import asynccontextmanager
 from datetime import datetime
-import tempfile, os
+import asyncio
 import jwt
 import re
 import base64
 
 from src.analyze_ecode import analyze_ecode
-from src.neo4j_connector import get_neo4j_driver, get_facts_from_neo4j
+from src.ocr_module import sniff_image_type
+from src.ocr_cache import get_ocr_cache, close_ocr_cache, get_ocr_cache_stats, image_key
+from src.fact_store import (
+    get_fact_store,
+    close_fact_store,
+    get_async_fact_store,
+    close_async_fact_store,
+)
+from src.nlp_module import resolve_ins, ins_children, get_prefilter_stats, get_fuzzy_stats
 from src.rule_engine import evaluate_rules
 
 from api.auth import router as auth_router
+from api.executors import (
+    ExecutorBusy,
+    ExecutorTimeout,
+    ExecutorUnavailable,
+    run_ocr_image,
+    run_nlp,
+    start_executors,
+    shutdown_executors,
+    get_executor_stats,
+)
 from api.schemas import (
     AnalysisResult,
     AnalyzeTextInput,
@@ -31,11 +50,14 @@ from api.schemas import (
 def normalize_query(q: Optional[str]) -> Optional[str]:
     """
     Chuẩn hóa query search:
-    - Bỏ prefix 'E', 'INS', '-'
-    - Đưa về lower-case
+    - Nếu là mã (E100, INS 100, 1100(i), l00...) -> ins chuẩn qua bảng alias (1 lần tra dict)
+    - Ngược lại: bỏ prefix 'E', 'INS', '-' và đưa về lower-case
     """
     if not q:
         return q
+    ins = resolve_ins(q)
+    if ins:
+        return ins
     cleaned = re.sub(r"^(E|INS)\s*-?", "", q.strip(), flags=re.IGNORECASE)
     return cleaned.lower()
 
@@ -44,10 +66,33 @@ def normalize_query(q: Optional[str]) -> Optional[str]:
 # FASTAPI CONFIG
 # ============================================================
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # FactStore dùng chung (Neo4j: 1 driver + fact cache; local: SQLite nhúng), đóng khi shutdown
+    # Bản async (AsyncGraphDatabase / to_thread) cho endpoint; bản sync cho analyze_ecode chạy trong thread
+    store = get_fact_store()
+    astore = get_async_fact_store()
+    try:
+        store.warmup()
+        if astore.name == "neo4j":
+            await astore.warmup()
+    except Exception as e:
+        # chưa kết nối được thì request đầu tiên sẽ thử lại
+        print(f"Chưa khởi tạo được FactStore ({store.name}) lúc startup:", e)
+    # pool OCR (process) + NLP (thread) có giới hạn, tạo sẵn lúc startup
+    start_executors()
+    yield
+    shutdown_executors()
+    close_ocr_cache()
+    await close_async_fact_store()
+    close_fact_store()
+
+
 app = FastAPI(
     title="EcodeSafety API",
     description="API phân tích phụ gia từ text hoặc ảnh.",
     version="5.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -122,7 +167,7 @@ app.include_router(auth_router, prefix="/auth", tags=["auth"])
 # SAVE HISTORY
 # ============================================================
 
-def save_history_for_user(
+async def save_history_for_user(
     user: Optional[UserContext],
     source_text: str,
     analysis_results: List[dict],
@@ -130,8 +175,8 @@ def save_history_for_user(
     source_image_b64: Optional[str] = None,
 ):
     """
-    Lưu lịch sử phân tích vào Neo4j:
-      (u:User)-[:ANALYZED]->(h:History {at, ecodes, source_text})
+    Lưu lịch sử phân tích qua FactStore
+    (Neo4j: (u:User)-[:ANALYZED]->(h:History {at, ecodes, source_text})).
     """
     if user is None:
         return
@@ -140,41 +185,18 @@ def save_history_for_user(
     if not ecodes:
         return
 
-    driver = None
     try:
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-            session.run(
-                """
-                MERGE (u:User {google_id: $gid})
-                SET u.email = $email,
-                    u.name  = $name
-
-                CREATE (h:History {
-                    at: datetime(),
-                    ecodes: $ecodes,
-                    source_text: $source_text,
-                    input_type: $input_type,
-                    source_image_b64: $source_image_b64
-                })
-
-                MERGE (u)-[:ANALYZED]->(h)
-                """,
-                {
-                    "gid": user.google_id,
-                    "email": user.email,
-                    "name": user.name,
-                    "ecodes": ecodes,
-                    "source_text": source_text,
-                    "input_type": input_type,
-                    "source_image_b64": source_image_b64,
-                },
-            )
+        await get_async_fact_store().save_history(
+            user.google_id,
+            user.email,
+            user.name,
+            ecodes,
+            source_text,
+            input_type=input_type,
+            source_image_b64=source_image_b64,
+        )
     except Exception as e:
         print("Lỗi khi lưu history:", e)
-    finally:
-        if driver:
-            driver.close()
 
 
 # ============================================================
@@ -232,18 +254,31 @@ async def analyze_product_ingredients_text(
     - Lưu history (User, History(ecodes, source_text))
     """
     try:
-        source_text = input_data.input_text
-        analysis_output = analyze_ecode(source_text)
+        # NLP + tra facts là code đồng bộ -> chạy trong NLP pool, không chặn event loop
+        analysis_output = await run_nlp(analyze_ecode, input_data.input_text)
 
         ecodes = await map_analysis_output_to_schema(analysis_output)
 
-        save_history_for_user(user, source_text, [e.dict() for e in ecodes], input_type="text")
+        # analyze_ecode strip input và tính span trên text đã strip -> trả về (và lưu) đúng text đó
+        source_text = analysis_output.get("source_text", "")
+
+        await save_history_for_user(user, source_text, [e.dict() for e in ecodes], input_type="text")
 
         return AnalysisResult(
             status="SUCCESS",
             ecodes_found=ecodes,
+            source_text=source_text,
+            spans=analysis_output.get("spans", []),
+            input_type="text",
             message="OK",
         )
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ExecutorTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ExecutorUnavailable as e:
+        print("Pool worker hỏng:", repr(e.__cause__))
+        raise HTTPException(status_code=503, detail="Dịch vụ xử lý đang khởi động lại, vui lòng thử lại sau.")
     except Exception as e:
         print("Lỗi /ecode/analyze:", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -260,35 +295,39 @@ async def analyze_product_image(
 ):
     """
     Phân tích ẢNH nhãn:
-    - Lưu vào file tạm
-    - Gọi analyze_ecode(path)
+    - Đọc upload vào RAM, kiểm tra định dạng theo magic bytes (không theo đuôi file)
+    - OCR trực tiếp từ bytes (process pool, không ghi file tạm) rồi analyze_ecode(text) (NLP pool)
+    - OCR 2 tầng: lượt nhanh trước, lượt đầy đủ khi cần; tầng đã trả lời nằm ở ocr_tier
+    - Cache OCR (SHA-256 + dHash): ảnh đã gặp (hoặc gần giống) không phải OCR lại
     - map_analysis_output_to_schema (KHÔNG gọi Gemini)
     - Lưu history
     """
-    temp_file_path = None
     source_image_b64 = None
 
     try:
-        suffix = (
-            f".{image_file.filename.split('.')[-1]}"
-            if image_file.filename and "." in image_file.filename
-            else ".jpg"
-        )
-
         content = await image_file.read()
-        
+        if sniff_image_type(content) is None:
+            raise HTTPException(status_code=415, detail="File tải lên không phải ảnh hợp lệ.")
+
         source_image_b64 = base64.b64encode(content).decode("utf-8")
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            temp_file_path = tmp.name
-            tmp.write(content)
 
-        analysis_output = analyze_ecode(temp_file_path)
+        # OCR trong process pool (giải mã bytes bằng cv2.imdecode), phần trích mã trong NLP pool
+        cache = get_ocr_cache()
+        ocr = None
+        if cache is not None:
+            key = await asyncio.to_thread(image_key, content)
+            ocr = await asyncio.to_thread(cache.get, key)
+        if ocr is None:
+            # ảnh lớn: các ô được OCR song song trên mọi worker (run_ocr_image)
+            ocr = await run_ocr_image(content)
+            if cache is not None:
+                await asyncio.to_thread(cache.put, key, ocr)
+        analysis_output = await run_nlp(analyze_ecode, ocr["text"])
         ecodes = await map_analysis_output_to_schema(analysis_output)
 
         source_text = analysis_output.get("source_text", "")
 
-        save_history_for_user(
+        await save_history_for_user(
             user, 
             source_text, 
             [e.dict() for e in ecodes], 
@@ -300,18 +339,25 @@ async def analyze_product_image(
             status="SUCCESS",
             ecodes_found=ecodes,
             source_text=source_text,
+            spans=analysis_output.get("spans", []),
             input_type="image",
+            ocr_tier=ocr.get("tier"),
             message="OK"
         )
 
+    except HTTPException:
+        raise
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ExecutorTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ExecutorUnavailable as e:
+        print("Pool worker hỏng:", repr(e.__cause__))
+        raise HTTPException(status_code=503, detail="Dịch vụ xử lý đang khởi động lại, vui lòng thử lại sau.")
     except Exception as e:
         print("Lỗi /ecode/analyze_image:", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-
 
 # ============================================================
 # SEARCH ECODES
@@ -328,96 +374,44 @@ async def search_ecodes(
     - Tính luôn rule_risk bằng evaluate_rules()
     - Trả dữ liệu batch để hỗ trợ Infinite Scroll
     """
-    driver = None
-    try:
-        q_norm = normalize_query(q)
-
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-
-            query = """
-            MATCH (a:Additive)
-            OPTIONAL MATCH (a)-[:HAS_FUNCTION]->(f:Function)
-            OPTIONAL MATCH (a)-[:HAS_RISK]->(r:RiskLevel)
-            OPTIONAL MATCH (a)-[:HAS_STATUS]->(s:Status)
-            OPTIONAL MATCH (a)-[:HAS_SOURCE]->(src:Source)
-            WITH a,
-                 collect(DISTINCT f.name) AS functions,
-                 r.level AS level,
-                 s.name AS status_vn,
-                 collect(DISTINCT src.name) AS sources
-            WHERE $q IS NULL
-               OR $q = ""
-               OR a.ins CONTAINS $q
-               OR toLower(a.name) CONTAINS toLower($q)
-               OR toLower(a.name_vn) CONTAINS toLower($q)
-            RETURN a.ins AS ins,
-                   a.name AS name,
-                   a.name_vn AS name_vn,
-                   a.adi AS adi,
-                   a.info AS info,
-                   functions AS functions,
-                   status_vn AS status_vn,
-                   level AS level,
-                   sources[0] AS source
-            ORDER BY ins
-            SKIP $offset
-            LIMIT $limit
-            """
-
-            records = session.run(query, {"q": q_norm, "limit": limit, "offset": offset})
-
-            items = []
-            for r in records:
-                facts = {
-                    "status_vn": r["status_vn"],
-                    "adi": r["adi"],
-                    "info": r["info"],
-                }
-                decision = evaluate_rules(facts)
-
-                items.append(
-                    EcodeSearchItem(
-                        ins=r["ins"],
-                        name=r["name"],
-                        name_vn=r["name_vn"],
-                        functions=r["functions"],
-                        adi=str(r["adi"]) if r["adi"] else None,
-                        info=None,
-                        status_vn=r["status_vn"],
-                        level=r["level"],
-                        source=r["source"],
-
-                        rule_risk=decision["risk"],
-                        rule_reason=decision["reason"],
-                        rule_name=decision["rule"],
-                    )
-                )
+    q_norm = normalize_query(q)
+
+    rows, total = await get_async_fact_store().search(q_norm, limit, offset)
+
+    items = []
+    for r in rows:
+        facts = {
+            "status_vn": r["status_vn"],
+            "adi": r["adi"],
+            "info": r["info"],
+        }
+        decision = evaluate_rules(facts)
+
+        items.append(
+            EcodeSearchItem(
+                ins=r["ins"],
+                name=r["name"],
+                name_vn=r["name_vn"],
+                functions=r["functions"],
+                adi=str(r["adi"]) if r["adi"] else None,
+                info=None,
+                status_vn=r["status_vn"],
+                level=r["level"],
+                source=r["source"],
 
-            total_record = session.run(
-                """
-                MATCH (a:Additive)
-                WHERE $q IS NULL
-                   OR $q = ""
-                   OR a.ins CONTAINS $q
-                   OR toLower(a.name) CONTAINS toLower($q)
-                   OR toLower(a.name_vn) CONTAINS toLower($q)
-                RETURN count(a) AS total
-                """,
-                {"q": q_norm},
-            ).single()
-
-            return SearchResult(
-                query=q,
-                limit=limit,
-                offset=offset,
-                total=total_record["total"] if total_record else 0,
-                items=items,
+                rule_risk=decision["risk"],
+                rule_reason=decision["reason"],
+                rule_name=decision["rule"],
             )
+        )
 
-    finally:
-        if driver:
-            driver.close()
+    return SearchResult(
+        query=q,
+        limit=limit,
+        offset=offset,
+        total=total,
+        items=items,
+    )
 
 
 # ============================================================
@@ -436,71 +430,48 @@ class AdditiveInfoResponse(AdditiveBase):
 async def get_additive_info(ins: str):
     """
     API lấy chi tiết 1 phụ gia:
-      - Lấy data từ Neo4j
+      - Lấy data từ FactStore (Neo4j / local)
       - GỌI GEMINI 1 lần duy nhất sinh `info`
     Dùng cho trang chi tiết (additive_detail.html).
     """
-    driver = get_neo4j_driver()
+    # E160a(iv), INS 100, 1100(i) ... -> đúng khoá ins trong DB
+    ins = resolve_ins(ins) or ins.strip().lower()
+
     try:
-        with driver.session() as session:
-            record = session.run(
-                """
-                MATCH (a:Additive {ins: $ins})
-                OPTIONAL MATCH (a)-[:HAS_FUNCTION]->(f:Function)
-                OPTIONAL MATCH (a)-[:HAS_RISK]->(r:RiskLevel)
-                OPTIONAL MATCH (a)-[:HAS_STATUS]->(s:Status)
-                OPTIONAL MATCH (a)-[:HAS_SOURCE]->(src:Source)
-                WITH a,
-                     collect(DISTINCT f.name) AS functions,
-                     r.level AS risk_level,
-                     s.name AS status_vn,
-                     collect(DISTINCT src.name) AS sources
-                RETURN a.ins AS ins,
-                       a.name AS name,
-                       a.name_vn AS name_vn,
-                       functions AS functions,
-                       a.info AS info,
-                       a.adi AS adi,
-                       status_vn AS status_vn,
-                       risk_level AS level,
-                       sources[0] AS source
-                """,
-                {"ins": ins},
-            ).single()
-
-            if not record:
-                raise HTTPException(status_code=404, detail=f"E-code {ins} không tồn tại")
-
-            facts = {
-                "adi": record["adi"],
-                "status_vn": record["status_vn"],
-                "info": record["info"],
-            }
-            decision = evaluate_rules(facts)
-
-            return {
-                "ins": record["ins"],
-                "name": record["name"],
-                "name_vn": record["name_vn"],
-                "functions": record["functions"],
-                "info": record["info"],
-                "adi": record["adi"],
-                "status_vn": record["status_vn"],
-                "level": record["level"],  # true label từ DB
-                "source": record["source"],
-
-                "rule_risk": decision["risk"],
-                "rule_reason": decision["reason"],
-                "rule_name": decision["rule"],
-            }
+        facts = await get_async_fact_store().get_facts(ins)
+
+        if not facts:
+            subs = ins_children(ins)
+            if subs:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"E-code {ins} không tồn tại, các mã con: {', '.join(subs)}",
+                )
+            raise HTTPException(status_code=404, detail=f"E-code {ins} không tồn tại")
+
+        # rule decision đã được tính sẵn cùng facts
+        sources = facts.get("sources") or []
+        return {
+            "ins": facts["ins"],
+            "name": facts["name"],
+            "name_vn": facts["name_vn"],
+            "functions": facts.get("function") or [],
+            "info": facts["info"],
+            "adi": facts["adi"],
+            "status_vn": facts["status_vn"],
+            "level": facts["level"],  # true label từ DB
+            "source": sources[0] if sources else None,
+
+            "rule_risk": facts["rule_risk"],
+            "rule_reason": facts["rule_reason"],
+            "rule_name": facts["rule_name"],
+        }
 
     except HTTPException:
         raise
     except Exception as e:
         print("Lỗi /ecodes/info:", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        driver.close()
 
 
 # ============================================================
@@ -516,83 +487,73 @@ async def get_my_history(
     """
     Đọc lịch sử phân tích của user:
       - Lấy (History) theo thời gian
-      - Lấy lại facts từ Neo4j (get_facts_from_neo4j) cho từng history
+      - Lấy lại facts (FactStore.get_facts_batch) cho mọi mã của trang, 1 lần gọi
       - KHÔNG gọi Gemini
     """
     if user is None:
         raise HTTPException(status_code=401, detail="User not logged in")
 
-    driver = get_neo4j_driver()
-    try:
-        with driver.session() as session:
-            records = session.run(
-                """
-                MATCH (u:User {google_id: $gid})-[:ANALYZED]->(h:History)
-                RETURN h, h.source_image_b64 AS source_image_b64, h.input_type AS input_type
-                ORDER BY h.at DESC
-                SKIP $offset
-                LIMIT $limit
-                """,
-                {"gid": user.google_id, "offset": offset, "limit": limit},
-            )
-
-            items: List[HistoryItem] = []
-
-            for r in records:
-                h = r["h"]
-                ecodes = h.get("ecodes", [])
-                at = h.get("at")
-                source_text = h.get("source_text")
-                input_type = r.get("input_type") or "text" 
-                source_image_b64 = r.get("source_image_b64")
-
-                if isinstance(at, datetime):
-                    analyzed_at = at
-                else:
-                    analyzed_at = datetime.fromisoformat(str(at))
-
-                additive_list: List[HistoryAdditiveItem] = []
-
-                for code in ecodes:
-                    a = get_facts_from_neo4j(driver,code)
-
-                    if a:
-                        additive_list.append(
-                            HistoryAdditiveItem(
-                                ins=a.get("ins"),
-                                name=a.get("name"),
-                                name_vn=a.get("name_vn"),
-                                functions=a.get("functions") or [],
-                                adi=a.get("adi"),
-                                info=None,
-                                status_vn=a.get("status_vn"),
-                                level=a.get("level"),
-                                rule_risk=a.get("rule_risk"),
-                                rule_reason=a.get("rule_reason"),
-                                rule_name=a.get("rule_name"),
-                                message=a.get("message"),
-                                source=a.get("source"),
-                            )
-                        )
-
-                items.append(
-                    HistoryItem(
-                        ecodes=ecodes,
-                        analyzed_at=analyzed_at,
-                        source_text=source_text,
-                        input_type=input_type,
-                        source_image_b64=source_image_b64,
-                        additives=additive_list,
+    store = get_async_fact_store()
+    records = await store.get_history(user.google_id, limit, offset)
+
+    # tra facts cho mọi mã của trang bằng 1 lần gọi
+    facts_by_code = await store.get_facts_batch(
+        code for r in records for code in (r.get("ecodes") or [])
+    )
+
+    items: List[HistoryItem] = []
+
+    for r in records:
+        ecodes = r.get("ecodes") or []
+        at = r.get("at")
+        source_text = r.get("source_text")
+        input_type = r.get("input_type") or "text" 
+        source_image_b64 = r.get("source_image_b64")
+
+        if isinstance(at, datetime):
+            analyzed_at = at
+        else:
+            analyzed_at = datetime.fromisoformat(str(at))
+
+        additive_list: List[HistoryAdditiveItem] = []
+
+        for code in ecodes:
+            a = facts_by_code.get(code)
+
+            if a:
+                additive_list.append(
+                    HistoryAdditiveItem(
+                        ins=a.get("ins"),
+                        name=a.get("name"),
+                        name_vn=a.get("name_vn"),
+                        functions=a.get("functions") or a.get("function") or [],
+                        adi=a.get("adi"),
+                        info=None,
+                        status_vn=a.get("status_vn"),
+                        level=a.get("level"),
+                        rule_risk=a.get("rule_risk"),
+                        rule_reason=a.get("rule_reason"),
+                        rule_name=a.get("rule_name"),
+                        message=a.get("message"),
+                        source=a.get("source"),
                     )
                 )
 
-        return UserHistoryResponse(
-            user_id=user.google_id,
-            items=items,
+        items.append(
+            HistoryItem(
+                ecodes=ecodes,
+                analyzed_at=analyzed_at,
+                source_text=source_text,
+                input_type=input_type,
+                source_image_b64=source_image_b64,
+                additives=additive_list,
+            )
         )
 
-    finally:
-        driver.close()
+    return UserHistoryResponse(
+        user_id=user.google_id,
+        items=items,
+    )
 
 # ============================================
 # LIST TẤT CẢ E-CODE (PHÂN TRANG)
@@ -603,66 +564,66 @@ async def list_all_ecodes(
     limit: int = 100,
     offset: int = 0,
 ):
-    driver = None
-    try:
-        driver = get_neo4j_driver()
-        with driver.session() as session:
-            query = """
-            MATCH (a:Additive)
-            OPTIONAL MATCH (a)-[:HAS_FUNCTION]->(f:Function)
-            OPTIONAL MATCH (a)-[:HAS_RISK]->(r:RiskLevel)
-            OPTIONAL MATCH (a)-[:HAS_STATUS]->(s:Status)
-            OPTIONAL MATCH (a)-[:HAS_SOURCE]->(src:Source)
-            WITH a, 
-                 collect(DISTINCT f.name) AS functions,
-                 r.level AS risk_level,
-                 s.name AS status_vn,
-                 collect(DISTINCT src.name) AS sources
-            ORDER BY a.ins
-            SKIP $offset
-            LIMIT $limit
-            RETURN a.ins AS ins,
-                   a.name AS name,
-                   a.name_vn AS name_vn,
-                   functions AS functions,
-                   a.adi AS adi,
-                   a.info AS info,
-                   status_vn AS status_vn,
-                   risk_level AS level,
-                   sources[0] AS source
-            """
-
-            records = session.run(query, {"limit": limit, "offset": offset})
-
-            items = []
-            for r in records:
-                items.append(
-                EcodeSearchItem(
-                    ins=r["ins"],
-                    name=r["name"],
-                    name_vn=r["name_vn"],
-                    functions=r["functions"],   
-                    adi=str(r["adi"]) if r["adi"] else None,
-                    info=r["info"],
-                    status_vn=r["status_vn"],
-                    level=r["level"],
-                    source=r["source"],
-                )
-)
-
-            total_query = """
-            MATCH (a:Additive)
-            RETURN count(a) AS total
-            """
-            total = session.run(total_query).single()["total"]
-
-        return SearchResult(
-            query=None,
-            offset=offset,
-            limit=limit,
-            total=total,
-            items=items,
+    rows, total = await get_async_fact_store().list_page(limit, offset)
+
+    items = []
+    for r in rows:
+        items.append(
+            EcodeSearchItem(
+                ins=r["ins"],
+                name=r["name"],
+                name_vn=r["name_vn"],
+                functions=r["functions"],
+                adi=str(r["adi"]) if r["adi"] else None,
+                info=r["info"],
+                status_vn=r["status_vn"],
+                level=r["level"],
+                source=r["source"],
+            )
         )
-    finally:
-        if driver:
-            driver.close()
\ No newline at end of file
+
+    return SearchResult(
+        query=None,
+        offset=offset,
+        limit=limit,
+        total=total,
+        items=items,
+    )
+
+
+# ============================================
+# METRICS NLP (BỘ LỌC NHANH)
+# ============================================
+
+@app.get("/metrics/nlp")
+async def nlp_metrics():
+    return {"prefilter": get_prefilter_stats(), "fuzzy": get_fuzzy_stats()}
+
+
+@app.get("/metrics/facts")
+async def fact_cache_metrics():
+    store = get_fact_store()
+    if store.name != "neo4j":
+        return {"store": store.name}
+    from src.neo4j_connector import get_fact_cache_stats
+    return {"store": store.name, "fact_cache": get_fact_cache_stats()}
+
+
+@app.get("/metrics/ocr")
+async def ocr_cache_metrics():
+    return {"ocr_cache": get_ocr_cache_stats()}
+
+
+# ============================================
+# METRICS TỔNG (EXECUTOR + NLP + FACTS)
+# ============================================
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "executors": get_executor_stats(),
+        "prefilter": get_prefilter_stats(),
+        "fuzzy": get_fuzzy_stats(),
+        "facts": await fact_cache_metrics(),
+        "ocr_cache": get_ocr_cache_stats(),
+    }
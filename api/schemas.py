@@ -56,10 +56,22 @@ class EcodeDetail(AdditiveBase):
     pass
 
 
+class CodeSpanItem(BaseModel):
+    """Vị trí 1 mã trong source_text (dùng để highlight)."""
+    code: str = Field(..., example="160a(iv)")
+    start: int
+    end: int
+    rule: str = Field(..., example="prefixed")
+    norm: str = Field(..., example="e 160a(iv)")
+
+
 class AnalysisResult(BaseModel):
     input_type: Optional[str] = None
     source_text: Optional[str] = None
     ecodes_found: List[EcodeDetail] = []
+    spans: List[CodeSpanItem] = Field(default_factory=list)
+    # ảnh: tầng OCR đã trả lời ("fast" = lượt nhanh, "full" = lượt đầy đủ, "tiled" = lượt đầy đủ chia ô)
+    ocr_tier: Optional[str] = None
 
 
 class AnalyzeTextInput(BaseModel):
@@ -0,0 +1,340 @@
+"""
+============================================================
+E-CODE SAFETY - BENCHMARK TRÍCH XUẤT MÃ (extract_ecodes_from_text)
+============================================================
+Sinh danh sách thành phần giả lập từ ecodes_master.csv (mã có tiền tố, số trần,
+mã con La Mã, tên tiếng Việt, bảng dinh dưỡng gây nhiễu, nhiễu ký tự kiểu OCR),
+đo tốc độ + độ chính xác so với ground truth đã biết và ghi kết quả ra JSON.
+
+    python benchmark_extractor.py --n 2000 --out bench_extractor.json
+    python benchmark_extractor.py --baseline bench_extractor.json   # so với lần chạy trước
+"""
+
+import argparse
+import csv
+import json
+import platform
+import random
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from src import nlp_module
+from src.nlp_module import (
+    DIGITMAP,
+    canonical_ins,
+    extract_ecodes_from_text,
+    get_extractor_index,
+    get_fuzzy_stats,
+    get_prefilter_stats,
+    reset_fuzzy_stats,
+    reset_prefilter_stats,
+)
+from src.utils import save_json, log
+
+
+# --------------------------------------------------------
+# CONFIG
+# --------------------------------------------------------
+ROOT = Path(__file__).resolve().parent
+CSV_PATH = ROOT / "data" / "processed" / "ecodes_master.csv"
+
+# cận trên (không gồm) của các nhóm độ dài text, tính theo ký tự
+LENGTH_BUCKETS = (128, 512, 2048)
+
+PREFIXES = ("E", "e", "E ", "E-", "INS ", "INS", "ins ", "INS-")
+
+# bảng dinh dưỡng / nhãn: có số nhưng không phải mã
+DISTRACTORS = (
+    "Năng lượng: {n} kcal",
+    "Năng lượng {n}kJ",
+    "Protein {n} g",
+    "Chất béo {n} g",
+    "Carbohydrate {n} g",
+    "Natri {n} mg",
+    "Canxi {n}mg",
+    "Khối lượng tịnh: {n} g",
+    "Net wt {n} g",
+    "Giá trị dinh dưỡng trong 100 g",
+    "Thể tích thực {n} ml",
+    "Hàm lượng/100g: {n}",
+)
+
+FILLERS = (
+    "đường", "muối", "nước", "bột mì", "sữa bột", "dầu thực vật", "tinh bột sắn",
+    "hương vani tự nhiên", "trứng gà", "bơ", "ca cao", "men nở",
+)
+
+# chữ số -> các ký tự OCR hay nhầm (đảo ngược DIGITMAP)
+OCR_CONFUSIONS = {}
+for _ch, _d in DIGITMAP.items():
+    OCR_CONFUSIONS.setdefault(_d, []).append(_ch)
+
+
+# --------------------------------------------------------
+# SINH DỮ LIỆU
+# --------------------------------------------------------
+def load_rows(csv_path):
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def build_pools(rows):
+    """Chia mã theo loại để sinh text; chỉ giữ tên tiếng Việt trỏ về đúng 1 mã."""
+    plain, subcodes = [], []
+    name_owner = {}
+    for r in rows:
+        ins = canonical_ins(r.get("ins", ""))
+        if not ins:
+            continue
+        if re.fullmatch(r"\d{3,4}", ins):
+            plain.append(ins)
+        elif re.fullmatch(r"\d{3,4}[a-z]?(\([ivx]+\))?", ins) and not ins.isdigit():
+            subcodes.append(ins)
+        name = (r.get("name_vn") or "").strip()
+        if name and not re.search(r"\d", name):
+            name_owner.setdefault(name, set()).add(ins)
+    names = [(n, next(iter(s))) for n, s in name_owner.items() if len(s) == 1]
+    return plain, subcodes, names
+
+
+def _ocr_noise(rnd, code):
+    # thay 1 chữ số bằng ký tự dễ nhầm, giữ ít nhất 2 chữ số thật
+    idx = [i for i, ch in enumerate(code) if ch in OCR_CONFUSIONS]
+    if len(idx) < 3:
+        return code
+    i = rnd.choice(idx)
+    return code[:i] + rnd.choice(OCR_CONFUSIONS[code[i]]) + code[i + 1:]
+
+
+def make_item(rnd, kind, pools):
+    """Trả về (chuỗi chèn vào text, mã kỳ vọng hoặc None)."""
+    plain, subcodes, names = pools
+    if kind == "prefixed":
+        code = rnd.choice(plain)
+        return rnd.choice(PREFIXES) + code, code
+    if kind == "bare":
+        code = rnd.choice(plain)
+        return code, code
+    if kind == "roman":
+        code = rnd.choice(subcodes)
+        surface = code.replace("(", rnd.choice(("(", " ("))) if "(" in code else code
+        if rnd.random() < 0.3:
+            surface = surface.upper()
+        return rnd.choice(("E", "INS ", "")) + surface, code
+    if kind == "name":
+        name, code = rnd.choice(names)
+        return name, code
+    if kind == "ocr_noise":
+        code = rnd.choice(plain)
+        return "E" + _ocr_noise(rnd, code), code
+    if kind == "distractor":
+        return rnd.choice(DISTRACTORS).format(n=rnd.choice((100, 120, 150, 160, 200, 250, 330, 500, 1000))), None
+    return rnd.choice(FILLERS), None
+
+
+KIND_WEIGHTS = (
+    ("prefixed", 0.22),
+    ("bare", 0.10),
+    ("roman", 0.10),
+    ("name", 0.12),
+    ("ocr_noise", 0.08),
+    ("distractor", 0.15),
+    ("filler", 0.23),
+)
+
+
+def make_corpus(n, seed, pools, max_items):
+    """Mỗi mẫu: text + tập mã kỳ vọng + danh sách (loại, mã) đã chèn."""
+    rnd = random.Random(seed)
+    kinds = [k for k, _ in KIND_WEIGHTS]
+    weights = [w for _, w in KIND_WEIGHTS]
+    samples = []
+    for _ in range(n):
+        ingredients, nutrition, injected = [], [], []
+        for kind in rnd.choices(kinds, weights, k=rnd.randint(1, max_items)):
+            surface, code = make_item(rnd, kind, pools)
+            # bảng dinh dưỡng xuống dòng phía sau danh sách thành phần như nhãn thật
+            (nutrition if kind == "distractor" else ingredients).append(surface)
+            if code is not None:
+                injected.append((kind, code))
+        text = "Thành phần: " + rnd.choice((", ", "; ", ",")).join(ingredients)
+        if nutrition:
+            text += "\n" + "\n".join(nutrition)
+        samples.append({
+            "text": text,
+            "expected": {c for _, c in injected},
+            "injected": injected,
+        })
+    return samples
+
+
+# --------------------------------------------------------
+# ĐO
+# --------------------------------------------------------
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def bucket_name(length):
+    lo = 0
+    for hi in LENGTH_BUCKETS:
+        if length < hi:
+            return f"{lo}-{hi - 1}"
+        lo = hi
+    return f"{lo}+"
+
+
+def run_benchmark(samples, repeat, fuzzy):
+    latencies = {}
+    predictions = []
+    reset_prefilter_stats()
+    reset_fuzzy_stats()
+    t_total = time.perf_counter()
+    for _ in range(repeat):
+        predictions = []
+        for s in samples:
+            t0 = time.perf_counter()
+            codes = extract_ecodes_from_text(s["text"], fuzzy=fuzzy)
+            dt = (time.perf_counter() - t0) * 1000.0
+            latencies.setdefault(bucket_name(len(s["text"])), []).append(dt)
+            predictions.append(set(codes))
+    elapsed = time.perf_counter() - t_total
+    calls = len(samples) * repeat
+
+    latency = {}
+    for name in sorted(latencies, key=lambda b: int(b.split("-")[0].rstrip("+"))):
+        vals = latencies[name]
+        latency[name] = {
+            "count": len(vals),
+            "p50_ms": round(percentile(vals, 50), 4),
+            "p99_ms": round(percentile(vals, 99), 4),
+            "mean_ms": round(sum(vals) / len(vals), 4),
+        }
+
+    tp = fp = fn = 0
+    by_kind = {}
+    for s, pred in zip(samples, predictions):
+        exp = s["expected"]
+        tp += len(exp & pred)
+        fp += len(pred - exp)
+        fn += len(exp - pred)
+        for kind, code in s["injected"]:
+            k = by_kind.setdefault(kind, {"expected": 0, "found": 0})
+            k["expected"] += 1
+            k["found"] += code in pred
+    for k in by_kind.values():
+        k["recall"] = round(k["found"] / k["expected"], 4) if k["expected"] else None
+
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    return {
+        "throughput": {
+            "calls": calls,
+            "seconds": round(elapsed, 4),
+            "texts_per_sec": round(calls / elapsed, 2) if elapsed else None,
+        },
+        "latency_by_length": latency,
+        "accuracy": {
+            "precision": round(precision, 4),
+            "recall": round(recall, 4),
+            "f1": round(f1, 4),
+            "tp": tp,
+            "fp": fp,
+            "fn": fn,
+            "recall_by_kind": by_kind,
+        },
+        "prefilter": get_prefilter_stats(),
+        "fuzzy": get_fuzzy_stats(),
+    }
+
+
+def compare(report, baseline_path):
+    """In chênh lệch các chỉ số chính so với 1 file JSON của lần chạy trước."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    rows = [
+        ("texts_per_sec", ("throughput", "texts_per_sec")),
+        ("precision", ("accuracy", "precision")),
+        ("recall", ("accuracy", "recall")),
+        ("f1", ("accuracy", "f1")),
+    ]
+    for b in report["latency_by_length"]:
+        rows.append((f"p50_ms[{b}]", ("latency_by_length", b, "p50_ms")))
+        rows.append((f"p99_ms[{b}]", ("latency_by_length", b, "p99_ms")))
+
+    def dig(d, path):
+        for k in path:
+            if not isinstance(d, dict) or k not in d:
+                return None
+            d = d[k]
+        return d
+
+    print("\n📊 So với baseline:", baseline_path)
+    for label, path in rows:
+        old, new = dig(base, path), dig(report, path)
+        if old is None or new is None:
+            continue
+        delta = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {label:<20} {old:>12} -> {new:<12} ({delta})")
+
+
+# --------------------------------------------------------
+# MAIN
+# --------------------------------------------------------
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark trích xuất mã phụ gia")
+    ap.add_argument("--csv", default=str(CSV_PATH))
+    ap.add_argument("--n", type=int, default=2000, help="số text sinh ra")
+    ap.add_argument("--seed", type=int, default=13)
+    ap.add_argument("--max-items", type=int, default=30, help="số thành phần tối đa mỗi text")
+    ap.add_argument("--repeat", type=int, default=1, help="số lượt chạy lại cả corpus")
+    ap.add_argument("--fuzzy", action="store_true", help="bật so khớp mờ cho tên")
+    ap.add_argument("--out", default="bench_extractor.json")
+    ap.add_argument("--baseline", default=None, help="JSON của lần chạy trước để so sánh")
+    args = ap.parse_args()
+
+    log(f"Đọc dữ liệu từ {args.csv}")
+    pools = build_pools(load_rows(args.csv))
+    samples = make_corpus(args.n, args.seed, pools, args.max_items)
+
+    # dựng index trước để không tính vào độ trễ
+    nlp_module.MASTER_CSV_PATH = args.csv
+    get_extractor_index(args.csv)
+    extract_ecodes_from_text("E100", fuzzy=args.fuzzy)
+
+    log(f"Chạy {args.n} text x {args.repeat} lượt...")
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "csv": args.csv,
+            "n": args.n,
+            "seed": args.seed,
+            "max_items": args.max_items,
+            "repeat": args.repeat,
+            "fuzzy": args.fuzzy,
+        },
+    }
+    report.update(run_benchmark(samples, args.repeat, args.fuzzy))
+
+    save_json(report, args.out)
+    acc = report["accuracy"]
+    log(
+        f"✔ {report['throughput']['texts_per_sec']} text/s | "
+        f"P={acc['precision']} R={acc['recall']} F1={acc['f1']} -> {args.out}"
+    )
+    if args.baseline:
+        compare(report, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+============================================================
+E-CODE SAFETY - BENCHMARK OCR (OCRPipeline + extract_ecodes_from_text)
+============================================================
+Vẽ nhãn thành phần giả lập từ ecodes_master.csv bằng cv2 (mã có tiền tố, số trần,
+bảng dinh dưỡng gây nhiễu), làm xấu ảnh (blur, phối cảnh, nhiễu, nén JPEG) rồi chạy
+qua OCRPipeline + extract_ecodes_from_text. Ảnh thật trong data/sample_inputs cũng được
+chạy (không có ground truth -> chỉ đo thời gian + liệt kê mã tìm được).
+
+Báo cáo: ảnh/giây, độ trễ từng bước (decode, fast, full/tiled, nlp), RAM đỉnh (RSS),
+precision/recall mã trên ảnh giả lập; ghi ra JSON để so sánh giữa các cấu hình.
+
+    python benchmark_ocr.py --n 50 --out bench_ocr.json
+    python benchmark_ocr.py --mode full --mag-ratio 1.0
+    python benchmark_ocr.py --preprocess clahe     # thử nghiệm, API không dùng bước này
+    python benchmark_ocr.py --baseline bench_ocr.json          # so với lần chạy trước
+    python benchmark_ocr.py --render-only --save-images tmp_labels   # chỉ vẽ ảnh để xem
+
+Font Hershey của cv2.putText không có dấu tiếng Việt nên nhãn được vẽ dạng bỏ dấu.
+--preprocess clahe/binary là tiền xử lý THỬ NGHIỆM chỉ có trong benchmark (pipeline thật chỉ
+chuyển xám): số đo khi bật không phản ánh API, báo cáo ghi "experimental": true.
+"""
+
+import argparse
+import json
+import platform
+import random
+import time
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from benchmark_extractor import (
+    CSV_PATH,
+    DISTRACTORS,
+    FILLERS,
+    PREFIXES,
+    build_pools,
+    load_rows,
+    percentile,
+)
+from src import nlp_module
+from src.nlp_module import extract_ecodes_from_text, get_extractor_index
+from src.ocr_module import OCRBackendUnavailable, OCRPipeline, prepare_image
+from src.utils import save_json, log
+
+
+# --------------------------------------------------------
+# CONFIG
+# --------------------------------------------------------
+ROOT = Path(__file__).resolve().parent
+SAMPLE_DIR = ROOT / "data" / "sample_inputs"
+
+STAGES = ("decode", "fast", "full", "nlp", "total")
+FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_COMPLEX)
+TITLES = ("BANH QUY BO", "KEO DEO TRAI CAY", "NUOC GIAI KHAT", "SNACK KHOAI TAY", "MI AN LIEN")
+
+
+def ascii_fold(text):
+    """Bỏ dấu tiếng Việt để vẽ được bằng font Hershey."""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+# --------------------------------------------------------
+# VẼ NHÃN GIẢ LẬP
+# --------------------------------------------------------
+def wrap_words(words, font, scale, thick, max_w):
+    lines, cur = [], ""
+    for w in words:
+        cand = f"{cur} {w}".strip()
+        if cur and cv2.getTextSize(cand, font, scale, thick)[0][0] > max_w:
+            lines.append(cur)
+            cur = w
+        else:
+            cur = cand
+    if cur:
+        lines.append(cur)
+    return lines
+
+
+def render_label(rnd, pools, max_codes):
+    """Trả về (ảnh BGR sạch, tập mã kỳ vọng)."""
+    plain = pools[0]
+    codes = rnd.sample(plain, k=min(len(plain), rnd.randint(1, max_codes)))
+    items = [rnd.choice(PREFIXES).strip() + c if rnd.random() < 0.8 else c for c in codes]
+    items += [ascii_fold(f) for f in rnd.sample(FILLERS, k=rnd.randint(2, 6))]
+    rnd.shuffle(items)
+
+    w, h = rnd.choice(((1200, 900), (1000, 1000), (1400, 1000)))
+    img = np.full((h, w, 3), rnd.randint(225, 255), dtype=np.uint8)
+    font = rnd.choice(FONTS)
+    scale = rnd.uniform(0.8, 1.1)
+    thick = 2
+    line_h = int(cv2.getTextSize("Ag", font, scale, thick)[0][1] * 2.0)
+    ink = (rnd.randint(0, 60),) * 3
+    x, y = 40, 60
+
+    cv2.putText(img, rnd.choice(TITLES), (x, y), font, scale * 1.6, ink, thick + 1, cv2.LINE_AA)
+    y += int(line_h * 1.8)
+    text = rnd.choice(("Thanh phan: ", "Ingredients: ")) + ", ".join(items) + "."
+    for line in wrap_words(text.split(" "), font, scale, thick, w - 2 * x):
+        cv2.putText(img, line, (x, y), font, scale, ink, thick, cv2.LINE_AA)
+        y += line_h
+
+    y += line_h // 2
+    cv2.putText(img, "Gia tri dinh duong trong 100 g", (x, y), font, scale, ink, thick, cv2.LINE_AA)
+    y += line_h
+    for d in rnd.sample(DISTRACTORS, k=4):
+        if y > h - 20:
+            break
+        n = rnd.choice((100, 120, 150, 250, 330, 500))
+        cv2.putText(img, ascii_fold(d.format(n=n)), (x, y), font, scale * 0.9, ink, thick, cv2.LINE_AA)
+        y += line_h
+    return img, set(codes)
+
+
+def degrade(rnd, img):
+    """Làm xấu ảnh như chụp điện thoại; trả về bytes JPEG + mô tả các bước đã áp dụng."""
+    h, w = img.shape[:2]
+    ops = {}
+
+    # phối cảnh: dịch 4 góc ngẫu nhiên tối đa 6% kích thước
+    j = 0.06
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    dst = src + np.float32([[rnd.uniform(-j, j) * w, rnd.uniform(-j, j) * h] for _ in range(4)])
+    m = cv2.getPerspectiveTransform(src, dst)
+    img = cv2.warpPerspective(img, m, (w, h), borderValue=(200, 200, 200))
+    ops["perspective"] = j
+
+    k = rnd.choice((0, 3, 5))
+    if k:
+        img = cv2.GaussianBlur(img, (k, k), 0)
+    ops["blur"] = k
+
+    sigma = rnd.uniform(0, 12)
+    noise = np.random.default_rng(rnd.randrange(1 << 30)).normal(0, sigma, img.shape)
+    img = np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    ops["noise_sigma"] = round(sigma, 2)
+
+    q = rnd.randint(40, 90)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, q])
+    ops["jpeg_quality"] = q
+    return buf.tobytes(), ops
+
+
+# --------------------------------------------------------
+# TIỀN XỬ LÝ THỬ NGHIỆM
+# --------------------------------------------------------
+def preprocess_variant(gray, name):
+    """
+    gray = như OCRPipeline (mặc định); clahe = cân bằng tương phản cục bộ; binary = Otsu.
+    clahe/binary chỉ có ở đây, không nằm trong OCRPipeline/API.
+    """
+    if name == "clahe":
+        return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    if name == "binary":
+        return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return gray
+
+
+# --------------------------------------------------------
+# ĐO
+# --------------------------------------------------------
+def peak_rss_mb():
+    """RAM đỉnh của process (MB); None nếu nền tảng không hỗ trợ."""
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux: KB, macOS: bytes
+        return round(rss / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def run_one(pipeline, data, args):
+    """OCR 1 ảnh (bytes) -> (mã tìm được, tầng OCR, độ trễ từng bước ms)."""
+    t0 = time.perf_counter()
+    gray = preprocess_variant(prepare_image(data), args.preprocess)
+    t_decode = time.perf_counter()
+
+    if args.mode == "tiered":
+        res = pipeline.ocr_tiered(gray)
+    else:
+        res = pipeline.ocr_full_pass(gray, args.mag_ratio)
+    text, tier = res["text"], res["tier"]
+    fast_ms, full_ms = res["fast_ms"], res["full_ms"]
+    t_ocr = time.perf_counter()
+
+    codes = set(extract_ecodes_from_text(text))
+    t_end = time.perf_counter()
+
+    lat = {
+        "decode": (t_decode - t0) * 1000.0,
+        "fast": fast_ms,
+        "full": full_ms,
+        "nlp": (t_end - t_ocr) * 1000.0,
+        "total": (t_end - t0) * 1000.0,
+    }
+    return codes, tier, lat, text
+
+
+def summarize(latencies):
+    out = {}
+    for stage in STAGES:
+        vals = latencies.get(stage, [])
+        if not vals:
+            continue
+        out[stage] = {
+            "p50_ms": round(percentile(vals, 50), 2),
+            "p99_ms": round(percentile(vals, 99), 2),
+            "mean_ms": round(sum(vals) / len(vals), 2),
+        }
+    return out
+
+
+def run_benchmark(pipeline, synthetic, samples, args):
+    latencies = {}
+    tiers = {}
+    tp = fp = fn = 0
+    per_sample = []
+
+    t_total = time.perf_counter()
+    for item in synthetic + samples:
+        codes, tier, lat, text = run_one(pipeline, item["data"], args)
+        for stage, v in lat.items():
+            latencies.setdefault(stage, []).append(v)
+        tiers[str(tier)] = tiers.get(str(tier), 0) + 1
+
+        exp = item.get("expected")
+        if exp is not None:
+            tp += len(exp & codes)
+            fp += len(codes - exp)
+            fn += len(exp - codes)
+        else:
+            per_sample.append({
+                "file": item["name"],
+                "tier": tier,
+                "codes": sorted(codes),
+                "total_ms": round(lat["total"], 2),
+                "text": text[:300],
+            })
+    elapsed = time.perf_counter() - t_total
+    images = len(synthetic) + len(samples)
+
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    return {
+        "throughput": {
+            "images": images,
+            "seconds": round(elapsed, 3),
+            "images_per_sec": round(images / elapsed, 3) if elapsed else None,
+        },
+        "latency_by_stage": summarize(latencies),
+        "tiers": tiers,
+        "peak_rss_mb": peak_rss_mb(),
+        "accuracy": {
+            "synthetic_images": len(synthetic),
+            "precision": round(precision, 4),
+            "recall": round(recall, 4),
+            "f1": round(f1, 4),
+            "tp": tp,
+            "fp": fp,
+            "fn": fn,
+        },
+        "samples": per_sample,
+    }
+
+
+def compare(report, baseline_path):
+    """In chênh lệch các chỉ số chính so với 1 file JSON của lần chạy trước."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    rows = [
+        ("images_per_sec", ("throughput", "images_per_sec")),
+        ("peak_rss_mb", ("peak_rss_mb",)),
+        ("precision", ("accuracy", "precision")),
+        ("recall", ("accuracy", "recall")),
+    ]
+    for stage in STAGES:
+        rows.append((f"p50_ms[{stage}]", ("latency_by_stage", stage, "p50_ms")))
+
+    def dig(d, path):
+        for k in path:
+            if not isinstance(d, dict) or k not in d:
+                return None
+            d = d[k]
+        return d
+
+    print("\n📊 So với baseline:", baseline_path)
+    for label, path in rows:
+        old, new = dig(base, path), dig(report, path)
+        if old is None or new is None:
+            continue
+        delta = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {label:<20} {old:>12} -> {new:<12} ({delta})")
+
+
+# --------------------------------------------------------
+# MAIN
+# --------------------------------------------------------
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark OCR nhãn phụ gia")
+    ap.add_argument("--csv", default=str(CSV_PATH))
+    ap.add_argument("--n", type=int, default=30, help="số nhãn giả lập")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--max-codes", type=int, default=6, help="số mã tối đa mỗi nhãn")
+    ap.add_argument("--samples", default=str(SAMPLE_DIR), help="thư mục ảnh thật ('' = bỏ qua)")
+    ap.add_argument("--mode", choices=("tiered", "full"), default="tiered",
+                    help="tiered = OCRPipeline.ocr_tiered; full = 1 lượt với --mag-ratio")
+    ap.add_argument("--mag-ratio", type=float, default=1.5, help="mag_ratio cho --mode full")
+    ap.add_argument("--preprocess", choices=("gray", "clahe", "binary"), default="gray",
+                    help="gray = như pipeline thật; clahe/binary = thử nghiệm, ngoài pipeline/API")
+    ap.add_argument("--gpu", action="store_true", help="bật GPU cho EasyOCR (mặc định tắt)")
+    ap.add_argument("--save-images", default=None, help="lưu ảnh giả lập (JPEG) vào thư mục này")
+    ap.add_argument("--render-only", action="store_true", help="chỉ vẽ ảnh, không chạy OCR")
+    ap.add_argument("--out", default="bench_ocr.json")
+    ap.add_argument("--baseline", default=None, help="JSON của lần chạy trước để so sánh")
+    args = ap.parse_args()
+
+    log(f"Đọc dữ liệu từ {args.csv}")
+    pools = build_pools(load_rows(args.csv))
+    rnd = random.Random(args.seed)
+
+    synthetic = []
+    for i in range(args.n):
+        img, expected = render_label(rnd, pools, args.max_codes)
+        data, ops = degrade(rnd, img)
+        synthetic.append({"name": f"synthetic_{i:03d}.jpg", "data": data, "expected": expected, "ops": ops})
+
+    if args.save_images:
+        out_dir = Path(args.save_images)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for s in synthetic:
+            (out_dir / s["name"]).write_bytes(s["data"])
+        log(f"Đã lưu {len(synthetic)} ảnh giả lập vào {out_dir}")
+    if args.render_only:
+        return
+
+    samples = []
+    if args.samples and Path(args.samples).is_dir():
+        for p in sorted(Path(args.samples).iterdir()):
+            if p.suffix.lower() in (".jpg", ".jpeg", ".png"):
+                samples.append({"name": p.name, "data": p.read_bytes()})
+
+    try:
+        t0 = time.perf_counter()
+        pipeline = OCRPipeline(use_gpu=args.gpu)
+        load_s = time.perf_counter() - t0
+    except OCRBackendUnavailable as e:
+        log(f"❌ {e}")
+        raise SystemExit(1)
+
+    # dựng index NLP + chạy nóng 1 ảnh để không tính vào độ trễ
+    nlp_module.MASTER_CSV_PATH = args.csv
+    get_extractor_index(args.csv)
+    if synthetic:
+        run_one(pipeline, synthetic[0]["data"], args)
+
+    if args.preprocess != "gray":
+        log(f"⚠ --preprocess {args.preprocess} là thử nghiệm, không nằm trong pipeline thật")
+    log(f"Chạy {len(synthetic)} ảnh giả lập + {len(samples)} ảnh thật ({args.mode}, {args.preprocess})...")
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "csv": args.csv,
+            "n": args.n,
+            "seed": args.seed,
+            "max_codes": args.max_codes,
+            "mode": args.mode,
+            "mag_ratio": args.mag_ratio if args.mode == "full" else None,
+            "preprocess": {
+                "variant": args.preprocess,
+                "experimental": args.preprocess != "gray",
+                "note": None if args.preprocess == "gray" else "chỉ có trong benchmark, OCRPipeline/API không dùng",
+            },
+            "gpu": args.gpu,
+            "reader_load_s": round(load_s, 2),
+        },
+    }
+    report.update(run_benchmark(pipeline, synthetic, samples, args))
+
+    save_json(report, args.out)
+    acc = report["accuracy"]
+    log(
+        f"✔ {report['throughput']['images_per_sec']} ảnh/s | RSS đỉnh {report['peak_rss_mb']} MB | "
+        f"P={acc['precision']} R={acc['recall']} F1={acc['f1']} -> {args.out}"
+    )
+    if args.baseline:
+        compare(report, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
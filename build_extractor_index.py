@@ -0,0 +1,42 @@
+"""
+============================================================
+E-CODE SAFETY - BUILD INDEX TRÍCH XUẤT (artifact cho worker)
+============================================================
+Build ExtractorIndex từ ecodes_master.csv và ghi ra file nhị phân cạnh CSV
+(ecodes_master.extractor.idx). Worker sẽ nạp file này thay vì đọc CSV;
+nếu CSV đổi nội dung (sha1 khác) thì tự build lại từ CSV như cũ.
+
+    python build_extractor_index.py [--csv path] [--out path]
+"""
+
+import argparse
+import time
+
+from src.nlp_module import (
+    MASTER_CSV_PATH,
+    build_index_artifact,
+    load_index_artifact,
+    _file_sha1,
+)
+from src.utils import log
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build index artifact cho nlp_module")
+    ap.add_argument("--csv", default=MASTER_CSV_PATH)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    out = build_index_artifact(args.csv, args.out)
+    log(f"✔ Đã ghi {out} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+
+    # đọc lại ngay để chắc chắn file dùng được
+    index = load_index_artifact(args.csv, _file_sha1(args.csv), artifact_path=out)
+    if index is None:
+        raise SystemExit("❌ Không nạp lại được artifact vừa build")
+    log(f"✔ Kiểm tra: {index!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,12 @@ import re
 from pathlib import Path
 from neo4j import Driver
 import sys
+import hashlib
+from datetime import datetime
 
 try:
-    from src.neo4j_connector import get_neo4j_driver
+    from src.neo4j_connector import get_neo4j_driver, close_neo4j_driver, set_catalog_version
+    from src.nlp_module import canonical_ins
 except ImportError:
     print("Không thể import neo4j_connector.py")
     print("Đảm bảo file neo4j_connector.py nằm cùng thư mục hoặc trong PYTHONPATH")
@@ -91,7 +94,8 @@ def import_data(driver: Driver):
 
     for idx, row in df.iterrows():
         try:
-            ins = str(row.get("ins", "")).strip().lower()
+            # cùng khoá với bảng alias của nlp_module (resolve_ins)
+            ins = canonical_ins(row.get("ins", ""))
             if not ins:
                 continue
 
@@ -195,17 +199,28 @@ def verify_import(driver: Driver):
     print("\nVerification complete.\n")
 
 
+def stamp_catalog_version(driver: Driver):
+    """
+    Ghi version mới cho catalog (sha1 CSV + thời điểm import) để các API process
+    thấy khác version và xoá fact cache của mình.
+    """
+    digest = hashlib.sha1(CSV_PATH.read_bytes()).hexdigest()[:12]
+    version = f"{digest}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    set_catalog_version(driver, version)
+    print(f"Catalog version: {version}\n")
+
+
 if __name__ == "__main__":
     print("=" * 60)
     print(" IMPORT DATASET TO NEO4J ".center(60, "="))
     print("=" * 60 + "\n")
 
-    driver = None
     try:
         driver = get_neo4j_driver()
         create_constraints(driver)
         import_data(driver)
         verify_import(driver)
+        stamp_catalog_version(driver)
 
         print("=" * 60)
         print(" COMPLETED ".center(60, "="))
@@ -216,6 +231,4 @@ if __name__ == "__main__":
 
         traceback.print_exc()
     finally:
-        if driver:
-            driver.close()
-            print("\nĐã đóng kết nối Neo4j.")
\ No newline at end of file
+        close_neo4j_driver()
\ No newline at end of file
@@ -5,7 +5,7 @@ echo ================================================
 echo.
 
 REM 1) Tạo môi trường ảo
-echo [1/5] Creating virtual environment...
+echo [1/6] Creating virtual environment...
 python -m venv venv
 if %ERRORLEVEL% NEQ 0 (
     echo ❌ Cannot create virtual environment
@@ -14,7 +14,7 @@ if %ERRORLEVEL% NEQ 0 (
 echo ✔ Virtual environment created.
 
 REM 2) Kích hoạt môi trường
-echo [2/5] Activating environment...
+echo [2/6] Activating environment...
 call venv\Scripts\activate
 if "%VIRTUAL_ENV%"=="" (
     echo ❌ Failed to activate virtual environment.
@@ -23,7 +23,7 @@ if "%VIRTUAL_ENV%"=="" (
 echo ✔ Environment activated.
 
 REM 3) Cài đặt thư viện
-echo [3/5] Installing dependencies...
+echo [3/6] Installing dependencies...
 pip install --upgrade pip
 pip install -r requirements.txt
 if %ERRORLEVEL% NEQ 0 (
@@ -33,7 +33,7 @@ if %ERRORLEVEL% NEQ 0 (
 echo ✔ Dependencies installed.
 
 REM 4) Chạy load_data.py
-echo [4/5] Running load_data.py...
+echo [4/6] Running load_data.py...
 python load_data.py
 if %ERRORLEVEL% NEQ 0 (
     echo ❌ load_data.py failed!
@@ -41,8 +41,15 @@ if %ERRORLEVEL% NEQ 0 (
 )
 echo ✔ load_data.py completed.
 
-REM 5) Chạy uvicorn
-echo [5/5] Starting API server...
+REM 5) Build index trích xuất (worker nạp file này thay vì đọc CSV)
+echo [5/6] Building extractor index...
+python build_extractor_index.py
+if %ERRORLEVEL% NEQ 0 (
+    echo ⚠ Index build failed, API will build from CSV at startup.
+)
+
+REM 6) Chạy uvicorn
+echo [6/6] Starting API server...
 uvicorn api.main:app --reload
 
 echo ================================================
@@ -1,100 +1,121 @@
-from src.ocr_module import extract_text_from_image
-from src.nlp_module import extract_ecodes_from_text
-from src.neo4j_connector import get_neo4j_driver, get_facts_from_neo4j
+from src.ocr_module import extract_text_tiered, sniff_image_file
+from src.ocr_cache import get_ocr_cache
+from src.nlp_module import extract_spans_from_text
+from src.fact_store import get_fact_store
 from src.rule_engine import evaluate_rules
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Union
 
+import numpy as np
 
-def analyze_ecode(ecode_or_text: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
+
+def analyze_ecode(
+    ecode_or_text: Union[str, bytes, bytearray, memoryview, np.ndarray],
+    context: Dict[str, Any] = None,
+) -> Dict[str, Any]:
     """
     Phân tích phụ gia theo INS/E-code.
+    Đầu vào: text, ảnh dạng bytes / ndarray (OCR trong RAM),
+    hoặc đường dẫn tới file ảnh (nhận diện theo nội dung file, không theo đuôi).
     """
     if context is None:
         context = {}
 
     source_text_used = ecode_or_text
+    ocr_tier = None
 
     # =====================================
     # 1) OCR nếu là ảnh
     # =====================================
-    if os.path.exists(ecode_or_text) and ecode_or_text.lower().endswith(('.jpg', '.jpeg', '.png')):
-        text = extract_text_from_image(ecode_or_text)
+    if isinstance(ecode_or_text, (bytes, bytearray, memoryview, np.ndarray)) or (
+        os.path.isfile(ecode_or_text) and sniff_image_file(ecode_or_text)
+    ):
+        cache = get_ocr_cache()
+        if cache is None or isinstance(ecode_or_text, np.ndarray):
+            ocr = extract_text_tiered(ecode_or_text)
+        else:
+            if isinstance(ecode_or_text, str):
+                with open(ecode_or_text, "rb") as f:
+                    ecode_or_text = f.read()
+            ocr = cache.get_or_compute(ecode_or_text, extract_text_tiered)
+        text = ocr["text"]
+        ocr_tier = ocr["tier"]
         source_text_used = text
     else:
         text = ecode_or_text.strip()
+        source_text_used = text  # span được tính trên text đã strip
 
     # =====================================
     # 2) NLP extract E-code
     # =====================================
-    ecodes = extract_ecodes_from_text(text)
+    # 1 lượt quét cho cả danh sách mã lẫn vị trí (để UI highlight)
+    spans = extract_spans_from_text(text)
+    ecodes = sorted({sp.code for sp in spans})
 
     if not ecodes:
         return {
             "source_text": source_text_used,
             "analysis_results": [],
+            "spans": [],
+            "ocr_tier": ocr_tier,
             "summary_warning": "Không tìm thấy mã phụ gia."
         }
 
     # =====================================
-    # 3) Query Neo4j bằng get_facts_from_neo4j()
+    # 3) Tra facts qua FactStore (Neo4j: 1 query UNWIND / fact cache; local: dict trong RAM)
     # =====================================
-    driver = None
     results = []
 
-    try:
-        driver = get_neo4j_driver()
-
-        for code in ecodes:
-            facts = get_facts_from_neo4j(driver, code)
-
-            if not facts:
-                results.append({
-                    "found": False,
-                    "ins": code,
-                    "message": "Không tìm thấy phụ gia trong cơ sở dữ liệu",
-                    "name": None,
-                    "name_vn": None,
-                    "function": [],
-                    "adi": None,
-                    "info": None,
-                    "status_vn": None,
-                    "level": None,
-                    "rule_risk": None,
-                    "rule_reason": None,
-                    "rule_name": None
-                })
-                continue
-
-            # merge thêm context
-            facts.update(context)
-
-            # rule engine
-            decision = evaluate_rules(facts)
+    facts_by_code = get_fact_store().get_facts_batch(ecodes)
+
+    for code in ecodes:
+        facts = facts_by_code.get(code)
 
+        if not facts:
             results.append({
-                "found": True,
-                "ins": facts.get("ins"),
-                "name": facts.get("name"),
-                "name_vn": facts.get("name_vn"),
-                "function": facts.get("function", []),
-                "adi": facts.get("adi"),
-                "info": facts.get("info"),
-                "status_vn": facts.get("status_vn"),
-                "level": facts.get("level"),  # TRUE label Neo4j
-
-                "rule_risk": decision.get("risk"),
-                "rule_reason": decision.get("reason"),
-                "rule_name": decision.get("rule"),
+                "found": False,
+                "ins": code,
+                "message": "Không tìm thấy phụ gia trong cơ sở dữ liệu",
+                "name": None,
+                "name_vn": None,
+                "function": [],
+                "adi": None,
+                "info": None,
+                "status_vn": None,
+                "level": None,
+                "rule_risk": None,
+                "rule_reason": None,
+                "rule_name": None
             })
+            continue
+
+        # merge thêm context
+        facts.update(context)
+
+        # rule engine
+        decision = evaluate_rules(facts)
+
+        results.append({
+            "found": True,
+            "ins": facts.get("ins"),
+            "name": facts.get("name"),
+            "name_vn": facts.get("name_vn"),
+            "function": facts.get("function", []),
+            "adi": facts.get("adi"),
+            "info": facts.get("info"),
+            "status_vn": facts.get("status_vn"),
+            "level": facts.get("level"),  # TRUE label Neo4j
 
-    finally:
-        if driver:
-            driver.close()
+            "rule_risk": decision.get("risk"),
+            "rule_reason": decision.get("reason"),
+            "rule_name": decision.get("rule"),
+        })
 
     return {
         "source_text": source_text_used,
-        "analysis_results": results
+        "analysis_results": results,
+        "spans": [sp.as_dict() for sp in spans],
+        "ocr_tier": ocr_tier,
     }
 
 
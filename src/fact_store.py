@@ -0,0 +1,693 @@
+# file: src/fact_store.py
+"""
+Lớp truy cập dữ liệu phụ gia + lịch sử, tách khỏi Cypher:
+  - Neo4jFactStore : dùng Neo4j như trước (driver dùng chung + fact cache)
+  - LocalFactStore : nạp ecodes_master.csv vào SQLite nhúng, không cần Neo4j server
+Chọn backend bằng biến môi trường FACT_STORE=neo4j|local (mặc định neo4j).
+
+Endpoint async def dùng AsyncFactStore (get_async_fact_store): Neo4j qua AsyncGraphDatabase,
+backend local chạy trong thread pool (asyncio.to_thread) để không chặn event loop.
+"""
+import os
+import re
+import csv
+import json
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.rule_engine import evaluate_rules
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+FACT_STORE = os.getenv("FACT_STORE", "neo4j").strip().lower()
+LOCAL_STORE_CSV = os.getenv(
+    "ECODES_MASTER_CSV",
+    str(ROOT_DIR / "data" / "processed" / "ecodes_master.csv"),
+)
+# ":memory:" cho test/benchmark; file thật để giữ lịch sử qua các lần khởi động
+LOCAL_STORE_DB = os.getenv("LOCAL_STORE_DB", str(ROOT_DIR / "data" / "local_store.sqlite3"))
+
+Facts = Dict[str, Any]
+
+
+class FactStore(ABC):
+    """
+    Giao diện chung cho mọi backend.
+    - facts   : dict như get_facts_from_neo4j (ins, name, name_vn, adi, info, function,
+                status_vn, level, sources, rule_risk, rule_reason, rule_name)
+    - row     : 1 dòng search/list (ins, name, name_vn, functions, adi, info,
+                status_vn, level, source)
+    - history : dict (at, ecodes, source_text, input_type, source_image_b64)
+    """
+
+    name = "base"
+
+    def warmup(self) -> None:
+        """Chuẩn bị kết nối/dữ liệu lúc startup (mặc định không làm gì)."""
+
+    def close(self) -> None:
+        """Giải phóng tài nguyên lúc shutdown."""
+
+    def get_facts(self, ins: str) -> Optional[Facts]:
+        return self.get_facts_batch([ins]).get(ins)
+
+    @abstractmethod
+    def get_facts_batch(self, codes: Iterable[str]) -> Dict[str, Optional[Facts]]:
+        """{ins: facts} cho mọi mã đã hỏi (bỏ trùng); mã không có -> None."""
+
+    @abstractmethod
+    def search(self, q: Optional[str], limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Tìm theo ins / name / name_vn (chứa q); trả về (rows của trang, tổng số khớp)."""
+
+    @abstractmethod
+    def list_page(self, limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Liệt kê theo thứ tự ins; trả về (rows của trang, tổng số phụ gia)."""
+
+    @abstractmethod
+    def upsert_user(self, google_id: str, email: Optional[str], name: Optional[str]) -> None:
+        ...
+
+    @abstractmethod
+    def save_history(
+        self,
+        google_id: str,
+        email: Optional[str],
+        name: Optional[str],
+        ecodes: List[str],
+        source_text: str,
+        input_type: str = "text",
+        source_image_b64: Optional[str] = None,
+    ) -> None:
+        ...
+
+    @abstractmethod
+    def get_history(self, google_id: str, limit: int, offset: int) -> List[Dict[str, Any]]:
+        """Lịch sử mới nhất trước."""
+
+
+# ============================================================
+# NEO4J
+# ============================================================
+
+class Neo4jFactStore(FactStore):
+    """Backend Neo4j: facts qua get_facts_batch (có fact cache), còn lại là Cypher."""
+
+    name = "neo4j"
+
+    _SEARCH_QUERY = """
+        MATCH (a:Additive)
+        OPTIONAL MATCH (a)-[:HAS_FUNCTION]->(f:Function)
+        OPTIONAL MATCH (a)-[:HAS_RISK]->(r:RiskLevel)
+        OPTIONAL MATCH (a)-[:HAS_STATUS]->(s:Status)
+        OPTIONAL MATCH (a)-[:HAS_SOURCE]->(src:Source)
+        WITH a,
+             collect(DISTINCT f.name) AS functions,
+             r.level AS level,
+             s.name AS status_vn,
+             collect(DISTINCT src.name) AS sources
+        WHERE $q IS NULL
+           OR $q = ""
+           OR a.ins CONTAINS $q
+           OR toLower(a.name) CONTAINS toLower($q)
+           OR toLower(a.name_vn) CONTAINS toLower($q)
+        RETURN a.ins AS ins,
+               a.name AS name,
+               a.name_vn AS name_vn,
+               a.adi AS adi,
+               a.info AS info,
+               functions AS functions,
+               status_vn AS status_vn,
+               level AS level,
+               sources[0] AS source
+        ORDER BY ins
+        SKIP $offset
+        LIMIT $limit
+    """
+
+    _SEARCH_COUNT_QUERY = """
+        MATCH (a:Additive)
+        WHERE $q IS NULL
+           OR $q = ""
+           OR a.ins CONTAINS $q
+           OR toLower(a.name) CONTAINS toLower($q)
+           OR toLower(a.name_vn) CONTAINS toLower($q)
+        RETURN count(a) AS total
+    """
+
+    _LIST_QUERY = """
+        MATCH (a:Additive)
+        OPTIONAL MATCH (a)-[:HAS_FUNCTION]->(f:Function)
+        OPTIONAL MATCH (a)-[:HAS_RISK]->(r:RiskLevel)
+        OPTIONAL MATCH (a)-[:HAS_STATUS]->(s:Status)
+        OPTIONAL MATCH (a)-[:HAS_SOURCE]->(src:Source)
+        WITH a,
+             collect(DISTINCT f.name) AS functions,
+             r.level AS risk_level,
+             s.name AS status_vn,
+             collect(DISTINCT src.name) AS sources
+        ORDER BY a.ins
+        SKIP $offset
+        LIMIT $limit
+        RETURN a.ins AS ins,
+               a.name AS name,
+               a.name_vn AS name_vn,
+               functions AS functions,
+               a.adi AS adi,
+               a.info AS info,
+               status_vn AS status_vn,
+               risk_level AS level,
+               sources[0] AS source
+    """
+
+    _UPSERT_USER_QUERY = """
+        MERGE (u:User {google_id: $gid})
+        SET u.email = $email,
+            u.name = $name
+    """
+
+    _SAVE_HISTORY_QUERY = """
+        MERGE (u:User {google_id: $gid})
+        SET u.email = $email,
+            u.name  = $name
+
+        CREATE (h:History {
+            at: datetime(),
+            ecodes: $ecodes,
+            source_text: $source_text,
+            input_type: $input_type,
+            source_image_b64: $source_image_b64
+        })
+
+        MERGE (u)-[:ANALYZED]->(h)
+    """
+
+    _HISTORY_QUERY = """
+        MATCH (u:User {google_id: $gid})-[:ANALYZED]->(h:History)
+        RETURN h.at AS at,
+               h.ecodes AS ecodes,
+               h.source_text AS source_text,
+               h.input_type AS input_type,
+               h.source_image_b64 AS source_image_b64
+        ORDER BY h.at DESC
+        SKIP $offset
+        LIMIT $limit
+    """
+
+    def __init__(self) -> None:
+        # import trễ: backend local không cần gói neo4j
+        from src import neo4j_connector
+        self._nc = neo4j_connector
+
+    def _driver(self):
+        return self._nc.get_neo4j_driver()
+
+    def warmup(self) -> None:
+        self._nc.init_neo4j_driver()
+        # nạp trọn catalog phụ gia vào RAM, tra facts sau đó không cần xuống Neo4j
+        self._nc.preload_fact_cache()
+
+    def close(self) -> None:
+        self._nc.close_neo4j_driver()
+
+    def get_facts_batch(self, codes: Iterable[str]) -> Dict[str, Optional[Facts]]:
+        return self._nc.get_facts_batch(self._driver(), codes)
+
+    def search(self, q, limit, offset):
+        with self._driver().session() as session:
+            rows = session.run(self._SEARCH_QUERY, {"q": q, "limit": limit, "offset": offset}).data()
+            total_record = session.run(self._SEARCH_COUNT_QUERY, {"q": q}).single()
+        return rows, total_record["total"] if total_record else 0
+
+    def list_page(self, limit, offset):
+        with self._driver().session() as session:
+            rows = session.run(self._LIST_QUERY, {"limit": limit, "offset": offset}).data()
+            total = session.run("MATCH (a:Additive) RETURN count(a) AS total").single()["total"]
+        return rows, total
+
+    def upsert_user(self, google_id, email, name):
+        with self._driver().session() as session:
+            session.run(self._UPSERT_USER_QUERY, {"gid": google_id, "email": email, "name": name})
+
+    def save_history(self, google_id, email, name, ecodes, source_text,
+                     input_type="text", source_image_b64=None):
+        with self._driver().session() as session:
+            session.run(
+                self._SAVE_HISTORY_QUERY,
+                {
+                    "gid": google_id,
+                    "email": email,
+                    "name": name,
+                    "ecodes": ecodes,
+                    "source_text": source_text,
+                    "input_type": input_type,
+                    "source_image_b64": source_image_b64,
+                },
+            )
+
+    def get_history(self, google_id, limit, offset):
+        with self._driver().session() as session:
+            return session.run(
+                self._HISTORY_QUERY, {"gid": google_id, "offset": offset, "limit": limit}
+            ).data()
+
+
+# ============================================================
+# LOCAL (SQLITE NHÚNG)
+# ============================================================
+
+def _split_functions(raw: str) -> List[str]:
+    # giống load_data.py
+    return [f.strip() for f in re.split(r"[.,]", raw or "") if f.strip()]
+
+
+class LocalFactStore(FactStore):
+    """
+    Backend nhúng cho máy đơn / test / benchmark:
+      - bảng additives nạp lại từ CSV mỗi lần warmup (cùng khoá ins với load_data.py)
+      - facts (kèm rule decision) giữ sẵn trong dict -> tra không qua mạng, không qua SQL
+      - users/history nằm trong SQLite (db_path=":memory:" thì mất khi tắt process)
+    """
+
+    name = "local"
+
+    def __init__(self, csv_path: str = LOCAL_STORE_CSV, db_path: str = LOCAL_STORE_DB) -> None:
+        self.csv_path = csv_path
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._facts: Dict[str, Facts] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS additives (
+                    ins TEXT PRIMARY KEY,
+                    name TEXT, name_vn TEXT, adi TEXT, info TEXT,
+                    functions TEXT, status_vn TEXT, level TEXT, source TEXT,
+                    name_lc TEXT, name_vn_lc TEXT
+                );
+                CREATE TABLE IF NOT EXISTS users (
+                    google_id TEXT PRIMARY KEY, email TEXT, name TEXT
+                );
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    google_id TEXT NOT NULL,
+                    at TEXT NOT NULL,
+                    ecodes TEXT NOT NULL,
+                    source_text TEXT,
+                    input_type TEXT,
+                    source_image_b64 TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_history_user_at ON history (google_id, at);
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    def warmup(self) -> None:
+        from src.nlp_module import canonical_ins
+
+        with open(self.csv_path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+        facts: Dict[str, Facts] = {}
+        records = []
+        for row in rows:
+            ins = canonical_ins(row.get("ins", ""))
+            if not ins or ins in facts:
+                continue
+            data = {
+                "ins": ins,
+                "name": (row.get("name") or "").strip(),
+                "name_vn": (row.get("name_vn") or "").strip(),
+                "adi": (row.get("adi") or "").strip(),
+                "info": (row.get("info") or "").strip(),
+                "functions": _split_functions(row.get("function", "")),
+                "status_vn": (row.get("status_vn") or "").strip() or None,
+                "level": (row.get("level") or "").strip() or None,
+                "source": (row.get("source") or "").strip() or None,
+            }
+            decision = evaluate_rules({
+                "status_vn": data["status_vn"],
+                "adi": data["adi"],
+                "info": data["info"],
+            })
+            facts[ins] = {
+                "ins": ins,
+                "name": data["name"],
+                "name_vn": data["name_vn"],
+                "adi": data["adi"],
+                "info": data["info"],
+                "function": data["functions"],
+                "status_vn": data["status_vn"],
+                "level": data["level"],
+                "sources": [data["source"]] if data["source"] else [],
+
+                "rule_risk": decision.get("risk"),
+                "rule_reason": decision.get("reason"),
+                "rule_name": decision.get("rule"),
+            }
+            records.append((
+                ins, data["name"], data["name_vn"], data["adi"], data["info"],
+                json.dumps(data["functions"], ensure_ascii=False),
+                data["status_vn"], data["level"], data["source"],
+                # SQLite lower() chỉ xử lý ASCII -> lưu sẵn bản lower() của Python
+                data["name"].lower(), data["name_vn"].lower(),
+            ))
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM additives")
+                conn.executemany(
+                    "INSERT INTO additives VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records
+                )
+            self._facts = facts
+        print(f"LocalFactStore: đã nạp {len(facts)} phụ gia từ {self.csv_path}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _ensure_loaded(self) -> None:
+        if not self._facts:
+            self.warmup()
+
+    def get_facts_batch(self, codes: Iterable[str]) -> Dict[str, Optional[Facts]]:
+        self._ensure_loaded()
+        facts = self._facts
+        result: Dict[str, Optional[Facts]] = {}
+        for c in dict.fromkeys(c for c in codes if c):
+            f = facts.get(c)
+            result[c] = dict(f) if f is not None else None
+        return result
+
+    @staticmethod
+    def _row(r: sqlite3.Row) -> Dict[str, Any]:
+        d = dict(r)
+        d["functions"] = json.loads(d["functions"] or "[]")
+        d.pop("name_lc", None)
+        d.pop("name_vn_lc", None)
+        return d
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def search(self, q, limit, offset):
+        self._ensure_loaded()
+        if not q:
+            return self.list_page(limit, offset)
+        where = "instr(ins, ?) > 0 OR instr(name_lc, ?) > 0 OR instr(name_vn_lc, ?) > 0"
+        ql = q.lower()
+        params = (q, ql, ql)
+        rows = self._query(
+            f"SELECT * FROM additives WHERE {where} ORDER BY ins LIMIT ? OFFSET ?",
+            params + (limit, offset),
+        )
+        total = self._query(f"SELECT count(*) FROM additives WHERE {where}", params)[0][0]
+        return [self._row(r) for r in rows], total
+
+    def list_page(self, limit, offset):
+        self._ensure_loaded()
+        rows = self._query("SELECT * FROM additives ORDER BY ins LIMIT ? OFFSET ?", (limit, offset))
+        total = self._query("SELECT count(*) FROM additives")[0][0]
+        return [self._row(r) for r in rows], total
+
+    def upsert_user(self, google_id, email, name):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO users (google_id, email, name) VALUES (?, ?, ?)
+                    ON CONFLICT(google_id) DO UPDATE SET email = excluded.email, name = excluded.name
+                    """,
+                    (google_id, email, name),
+                )
+
+    def save_history(self, google_id, email, name, ecodes, source_text,
+                     input_type="text", source_image_b64=None):
+        self.upsert_user(google_id, email, name)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO history (google_id, at, ecodes, source_text, input_type, source_image_b64)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        google_id,
+                        datetime.now(timezone.utc).isoformat(),
+                        json.dumps(list(ecodes), ensure_ascii=False),
+                        source_text,
+                        input_type,
+                        source_image_b64,
+                    ),
+                )
+
+    def get_history(self, google_id, limit, offset):
+        rows = self._query(
+            """
+            SELECT at, ecodes, source_text, input_type, source_image_b64
+            FROM history WHERE google_id = ?
+            ORDER BY at DESC, id DESC LIMIT ? OFFSET ?
+            """,
+            (google_id, limit, offset),
+        )
+        out = []
+        for r in rows:
+            d = dict(r)
+            d["at"] = datetime.fromisoformat(d["at"])
+            d["ecodes"] = json.loads(d["ecodes"] or "[]")
+            out.append(d)
+        return out
+
+
+# ============================================================
+# ASYNC
+# ============================================================
+
+class AsyncFactStore(ABC):
+    """Cùng các thao tác như FactStore nhưng là coroutine (cho endpoint async def)."""
+
+    name = "base"
+
+    async def warmup(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def get_facts(self, ins: str) -> Optional[Facts]:
+        return (await self.get_facts_batch([ins])).get(ins)
+
+    @abstractmethod
+    async def get_facts_batch(self, codes: Iterable[str]) -> Dict[str, Optional[Facts]]:
+        ...
+
+    @abstractmethod
+    async def search(self, q: Optional[str], limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        ...
+
+    @abstractmethod
+    async def list_page(self, limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        ...
+
+    @abstractmethod
+    async def upsert_user(self, google_id: str, email: Optional[str], name: Optional[str]) -> None:
+        ...
+
+    @abstractmethod
+    async def save_history(
+        self,
+        google_id: str,
+        email: Optional[str],
+        name: Optional[str],
+        ecodes: List[str],
+        source_text: str,
+        input_type: str = "text",
+        source_image_b64: Optional[str] = None,
+    ) -> None:
+        ...
+
+    @abstractmethod
+    async def get_history(self, google_id: str, limit: int, offset: int) -> List[Dict[str, Any]]:
+        ...
+
+
+class AsyncNeo4jFactStore(AsyncFactStore):
+    """Cypher giống Neo4jFactStore, chạy trên driver async; facts dùng chung fact cache."""
+
+    name = "neo4j"
+
+    def __init__(self) -> None:
+        from src import neo4j_connector
+        self._nc = neo4j_connector
+
+    async def _run(self, query: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        driver = await self._nc.get_async_neo4j_driver()
+        async with driver.session() as session:
+            result = await session.run(query, params)
+            return await result.data()
+
+    async def warmup(self) -> None:
+        await self._nc.init_async_neo4j_driver()
+
+    async def close(self) -> None:
+        await self._nc.close_async_neo4j_driver()
+
+    async def get_facts_batch(self, codes):
+        driver = await self._nc.get_async_neo4j_driver()
+        return await self._nc.get_facts_batch_async(driver, codes)
+
+    async def search(self, q, limit, offset):
+        # 2 query độc lập -> chạy song song trên 2 session của pool
+        rows, total = await asyncio.gather(
+            self._run(Neo4jFactStore._SEARCH_QUERY, {"q": q, "limit": limit, "offset": offset}),
+            self._run(Neo4jFactStore._SEARCH_COUNT_QUERY, {"q": q}),
+        )
+        return rows, total[0]["total"] if total else 0
+
+    async def list_page(self, limit, offset):
+        rows, total = await asyncio.gather(
+            self._run(Neo4jFactStore._LIST_QUERY, {"limit": limit, "offset": offset}),
+            self._run("MATCH (a:Additive) RETURN count(a) AS total", {}),
+        )
+        return rows, total[0]["total"]
+
+    async def upsert_user(self, google_id, email, name):
+        await self._run(
+            Neo4jFactStore._UPSERT_USER_QUERY, {"gid": google_id, "email": email, "name": name}
+        )
+
+    async def save_history(self, google_id, email, name, ecodes, source_text,
+                           input_type="text", source_image_b64=None):
+        await self._run(
+            Neo4jFactStore._SAVE_HISTORY_QUERY,
+            {
+                "gid": google_id,
+                "email": email,
+                "name": name,
+                "ecodes": ecodes,
+                "source_text": source_text,
+                "input_type": input_type,
+                "source_image_b64": source_image_b64,
+            },
+        )
+
+    async def get_history(self, google_id, limit, offset):
+        return await self._run(
+            Neo4jFactStore._HISTORY_QUERY, {"gid": google_id, "offset": offset, "limit": limit}
+        )
+
+
+class ThreadedAsyncFactStore(AsyncFactStore):
+    """Bọc 1 FactStore đồng bộ (vd LocalFactStore): mỗi lời gọi chạy qua asyncio.to_thread."""
+
+    def __init__(self, store: FactStore) -> None:
+        self._store = store
+        self.name = store.name
+
+    async def warmup(self) -> None:
+        await asyncio.to_thread(self._store.warmup)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._store.close)
+
+    async def get_facts_batch(self, codes):
+        return await asyncio.to_thread(self._store.get_facts_batch, list(codes))
+
+    async def search(self, q, limit, offset):
+        return await asyncio.to_thread(self._store.search, q, limit, offset)
+
+    async def list_page(self, limit, offset):
+        return await asyncio.to_thread(self._store.list_page, limit, offset)
+
+    async def upsert_user(self, google_id, email, name):
+        await asyncio.to_thread(self._store.upsert_user, google_id, email, name)
+
+    async def save_history(self, google_id, email, name, ecodes, source_text,
+                           input_type="text", source_image_b64=None):
+        await asyncio.to_thread(
+            self._store.save_history, google_id, email, name, ecodes, source_text,
+            input_type, source_image_b64,
+        )
+
+    async def get_history(self, google_id, limit, offset):
+        return await asyncio.to_thread(self._store.get_history, google_id, limit, offset)
+
+
+# ============================================================
+# CHỌN BACKEND
+# ============================================================
+
+_STORE: Optional[FactStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def create_fact_store(kind: Optional[str] = None) -> FactStore:
+    kind = (kind or FACT_STORE).strip().lower()
+    if kind == "neo4j":
+        return Neo4jFactStore()
+    if kind in ("local", "sqlite", "memory"):
+        return LocalFactStore(db_path=":memory:" if kind == "memory" else LOCAL_STORE_DB)
+    raise ValueError(f"FACT_STORE không hợp lệ: {kind!r} (neo4j | local | memory)")
+
+
+def get_fact_store() -> FactStore:
+    """FactStore dùng chung cho cả process, theo FACT_STORE."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = create_fact_store()
+    return _STORE
+
+
+def close_fact_store() -> None:
+    global _STORE
+    with _STORE_LOCK:
+        store, _STORE = _STORE, None
+    if store is not None:
+        store.close()
+
+
+_ASYNC_STORE: Optional[AsyncFactStore] = None
+
+
+def get_async_fact_store() -> AsyncFactStore:
+    """
+    AsyncFactStore dùng chung, theo FACT_STORE:
+      - neo4j : AsyncNeo4jFactStore
+      - khác  : bọc chính FactStore đồng bộ của get_fact_store() (cùng SQLite, cùng dữ liệu)
+    """
+    global _ASYNC_STORE
+    if _ASYNC_STORE is None:
+        if FACT_STORE == "neo4j":
+            store = AsyncNeo4jFactStore()
+        else:
+            store = ThreadedAsyncFactStore(get_fact_store())
+        with _STORE_LOCK:
+            if _ASYNC_STORE is None:
+                _ASYNC_STORE = store
+    return _ASYNC_STORE
+
+
+async def close_async_fact_store() -> None:
+    global _ASYNC_STORE
+    store, _ASYNC_STORE = _ASYNC_STORE, None
+    # bản bọc thread dùng chung FactStore đồng bộ -> close_fact_store() lo phần đóng
+    if isinstance(store, AsyncNeo4jFactStore):
+        await store.close()
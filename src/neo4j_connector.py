@@ -1,9 +1,11 @@
 # file: src/neo4j_connector.py
 import os
+import time
+import threading
 from dotenv import load_dotenv
-from neo4j import GraphDatabase, Driver
+from neo4j import AsyncDriver, AsyncGraphDatabase, GraphDatabase, Driver
 from neo4j.exceptions import ServiceUnavailable, AuthError
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 
 from src.rule_engine import evaluate_rules
 
@@ -14,37 +16,105 @@ NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USER = os.getenv("NEO4J_USER")
 NEO4J_PASS = os.getenv("NEO4J_PASSWORD")
 
-def get_neo4j_driver() -> Driver:
+# === NEW: 1 driver dùng chung cho cả process (pool kết nối Bolt) ===
+# Có thể chỉnh qua .env; thời gian tính bằng giây
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))
+NEO4J_MAX_CONN_LIFETIME = float(os.getenv("NEO4J_MAX_CONN_LIFETIME", "3600"))
+NEO4J_CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "15"))
+
+_DRIVER: Optional[Driver] = None
+_DRIVER_LOCK = threading.Lock()
+
+
+def init_neo4j_driver() -> Driver:
     """
-    Tạo và trả về một instance Driver MỚI mỗi lần gọi.
-    Người gọi có TRÁCH NHIỆM đóng driver sau khi sử dụng.
-    
-    Usage:
-        driver = get_neo4j_driver()
+    Tạo driver dùng chung (1 lần) và kiểm tra kết nối.
+    Gọi trong lifespan của FastAPI lúc khởi động; gọi lại khi đã có driver thì không làm gì.
+    """
+    global _DRIVER
+    if _DRIVER is not None:
+        return _DRIVER
+
+    with _DRIVER_LOCK:
+        if _DRIVER is not None:
+            return _DRIVER
+
+        if not NEO4J_URI or not NEO4J_USER or not NEO4J_PASS:
+            raise EnvironmentError("Thiếu thông tin kết nối NEO4J trong file .env")
+
+        print("Đang tạo kết nối Neo4j dùng chung...")
+        driver = GraphDatabase.driver(
+            NEO4J_URI,
+            auth=(NEO4J_USER, NEO4J_PASS),
+            max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+            connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+            max_connection_lifetime=NEO4J_MAX_CONN_LIFETIME,
+            connection_timeout=NEO4J_CONNECTION_TIMEOUT,
+        )
         try:
-            with driver.session() as session:
-                # ... your queries ...
-        finally:
+            driver.verify_connectivity()
+        except (ServiceUnavailable, AuthError) as e:
             driver.close()
-    """
-    print("Đang tạo kết nối Neo4j mới...")
-    
-    if not NEO4J_URI or not NEO4J_USER or not NEO4J_PASS:
-        raise EnvironmentError("Thiếu thông tin kết nối NEO4J trong file .env")
-    
-    try:
-        # Tạo driver mới
-        driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
-        
-        # Kiểm tra kết nối
-        driver.verify_connectivity()
+            print(f"Lỗi: Không thể kết nối tới Neo4j tại {NEO4J_URI}. Chi tiết: {e}")
+            raise
         print("Kết nối Neo4j thành công!")
-        
+
+        _DRIVER = driver
         return driver
-        
-    except (ServiceUnavailable, AuthError) as e:
-        print(f"Lỗi: Không thể kết nối tới Neo4j tại {NEO4J_URI}. Chi tiết: {e}")
-        raise
+
+
+def get_neo4j_driver() -> Driver:
+    """
+    Trả về driver DÙNG CHUNG của process (tạo lười ở lần gọi đầu nếu lifespan chưa tạo).
+    Người gọi KHÔNG được đóng driver này; chỉ mở/đóng session:
+
+        driver = get_neo4j_driver()
+        with driver.session() as session:
+            # ... your queries ...
+
+    Script chạy độc lập gọi close_neo4j_driver() khi kết thúc.
+    """
+    driver = _DRIVER
+    if driver is not None:
+        return driver
+    return init_neo4j_driver()
+
+
+def close_neo4j_driver() -> None:
+    """Đóng driver dùng chung (lúc shutdown app / cuối script)."""
+    global _DRIVER
+    with _DRIVER_LOCK:
+        driver, _DRIVER = _DRIVER, None
+    if driver is not None:
+        driver.close()
+        print("Đã đóng kết nối Neo4j.")
+
+
+def _facts_from_record(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Chuyển đổi format để dễ sử dụng
+    # Tính rule engine tại đây
+    decision = evaluate_rules({
+        "status_vn": data["status_vn"],
+        "adi": data["adi"],
+        "info": data["info"]
+    })
+
+    return {
+        "ins": data["ins"],
+        "name": data["name"],
+        "name_vn": data["name_vn"],
+        "adi": data["adi"],
+        "info": data["info"],
+        "function": data["functions"],
+        "status_vn": data["status_vn"],
+        "level": data["level"],
+        "sources": data["sources"],
+
+        "rule_risk": decision.get("risk"),
+        "rule_reason": decision.get("reason"),
+        "rule_name": decision.get("rule"),
+    }
 
 
 def get_facts_from_neo4j(driver: Driver, ins_code: str) -> Optional[Dict[str, Any]]:
@@ -63,6 +133,8 @@ def get_facts_from_neo4j(driver: Driver, ins_code: str) -> Optional[Dict[str, An
     if not driver:
         print("Lỗi: Neo4j driver chưa được khởi tạo.")
         return None
+    if FACT_CACHE_ENABLED:
+        return _FACT_CACHE.get_many(driver, [ins_code]).get(ins_code)
             
     try:
         with driver.session() as session:
@@ -85,30 +157,7 @@ def get_facts_from_neo4j(driver: Driver, ins_code: str) -> Optional[Dict[str, An
             res = session.run(query, {"ins": ins_code}).data()
             
             if res:
-                data = res[0]
-                # Chuyển đổi format để dễ sử dụng
-                # Tính rule engine tại đây
-                decision = evaluate_rules({
-                    "status_vn": data["status_vn"],
-                    "adi": data["adi"],
-                    "info": data["info"]
-                })
-
-                return {
-                    "ins": data["ins"],
-                    "name": data["name"],
-                    "name_vn": data["name_vn"],
-                    "adi": data["adi"],
-                    "info": data["info"],
-                    "function": data["functions"],
-                    "status_vn": data["status_vn"],
-                    "level": data["level"],
-                    "sources": data["sources"],
-
-                    "rule_risk": decision.get("risk"),
-                    "rule_reason": decision.get("reason"),
-                    "rule_name": decision.get("rule"),
-                }
+                return _facts_from_record(res[0])
 
             return None
             
@@ -120,10 +169,380 @@ def get_facts_from_neo4j(driver: Driver, ins_code: str) -> Optional[Dict[str, An
         return None
 
 
+# === NEW: tra nhiều mã trong 1 query (UNWIND) thay cho vòng lặp get_facts_from_neo4j ===
+_FACTS_RETURN = """
+            RETURN code,
+                   a.ins AS ins,
+                   a.name AS name,
+                   a.name_vn AS name_vn,
+                   a.adi AS adi,
+                   a.info AS info,
+                   collect(DISTINCT f.name) AS functions,
+                   s.name AS status_vn,
+                   r.level AS level,
+                   collect(DISTINCT src.name) AS sources
+"""
+
+_FACTS_MATCH = """
+            OPTIONAL MATCH (a)-[:HAS_FUNCTION]->(f:Function)
+            OPTIONAL MATCH (a)-[:HAS_STATUS]->(s:Status)
+            OPTIONAL MATCH (a)-[:HAS_RISK]->(r:RiskLevel)
+            OPTIONAL MATCH (a)-[:HAS_SOURCE]->(src:Source)
+"""
+
+
+_BATCH_QUERY = (
+    "UNWIND $codes AS code\n"
+    "            MATCH (a:Additive {ins: code})"
+    + _FACTS_MATCH + _FACTS_RETURN
+)
+
+
+def _run_facts_query(driver: Driver, query: str, params: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    with driver.session() as session:
+        for data in session.run(query, params).data():
+            # giữ dòng đầu tiên cho mỗi mã như bản tra từng mã (res[0])
+            if data["code"] not in out:
+                out[data["code"]] = _facts_from_record(data)
+    return out
+
+
+def _query_facts_batch(driver: Driver, codes: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+    # None = lỗi truy vấn (khác với "không tìm thấy"), để cache không ghi nhớ nhầm
+    try:
+        return _run_facts_query(driver, _BATCH_QUERY, {"codes": codes})
+    except ServiceUnavailable as e:
+        print(f"Lỗi dịch vụ Neo4j khi truy vấn {len(codes)} mã: {e}")
+    except Exception as e:
+        print(f"Lỗi không xác định khi truy vấn {len(codes)} mã: {e}")
+    return None
+
+
+def get_facts_batch(driver: Driver, codes: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Truy vấn facts cho nhiều INS code bằng 1 session + 1 query UNWIND
+    (qua fact cache nếu bật: chỉ các mã chưa có trong cache mới xuống Neo4j).
+
+    Returns:
+        Dict {ins_code: facts} có đủ mọi mã đã hỏi (theo thứ tự, bỏ trùng);
+        mã không có trong DB -> None (giống get_facts_from_neo4j).
+    """
+    codes = list(dict.fromkeys(c for c in codes if c))
+    if not codes:
+        return {}
+    if not driver:
+        print("Lỗi: Neo4j driver chưa được khởi tạo.")
+        return {c: None for c in codes}
+    if FACT_CACHE_ENABLED:
+        return _FACT_CACHE.get_many(driver, codes)
+
+    found = _query_facts_batch(driver, codes) or {}
+    return {c: found.get(c) for c in codes}
+
+
+# === NEW: cache facts trong RAM, vô hiệu hoá theo version catalog do load_data.py ghi ===
+# Catalog nhỏ (vài trăm mã) và chỉ đổi khi chạy load_data.py, nên có thể nạp trọn lúc startup.
+# Mỗi FACT_CACHE_CHECK_INTERVAL giây đọc lại (:CatalogVersion) 1 lần; version đổi -> xoá cache.
+FACT_CACHE_ENABLED = os.getenv("FACT_CACHE", "1") != "0"
+FACT_CACHE_CHECK_INTERVAL = float(os.getenv("FACT_CACHE_CHECK_INTERVAL", "30"))
+CATALOG_VERSION_NAME = "additives"
+
+
+def get_catalog_version(driver: Driver) -> Optional[str]:
+    with driver.session() as session:
+        rec = session.run(
+            "MATCH (v:CatalogVersion {name: $name}) RETURN v.version AS version",
+            {"name": CATALOG_VERSION_NAME},
+        ).single()
+    return rec["version"] if rec else None
+
+
+def set_catalog_version(driver: Driver, version: str) -> None:
+    """Ghi version catalog mới (gọi sau khi import xong) để các process xoá fact cache."""
+    with driver.session() as session:
+        session.run(
+            """
+            MERGE (v:CatalogVersion {name: $name})
+            SET v.version = $version,
+                v.updated_at = datetime()
+            """,
+            {"name": CATALOG_VERSION_NAME, "version": version},
+        )
+
+
+_PRELOAD_QUERY = "MATCH (a:Additive)\n            WITH a, a.ins AS code" + _FACTS_MATCH + _FACTS_RETURN
+
+
+class FactCache:
+    """
+    Cache read-through cho facts của Additive (đã tính sẵn rule decision).
+    - preload(): nạp toàn bộ catalog bằng 1 query; sau đó mã không có trong cache = không có trong DB
+    - get_many(): trả về bản sao facts (caller được phép sửa), mã thiếu mới truy vấn Neo4j
+    """
+
+    def __init__(self, check_interval: float = FACT_CACHE_CHECK_INTERVAL) -> None:
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # (facts, complete) đổi cùng lúc bằng 1 phép gán: _lookup đọc không khoá
+        # nên không bao giờ thấy bảng mới đi với cờ complete cũ (hoặc ngược lại)
+        self._state: Tuple[Dict[str, Optional[Dict[str, Any]]], bool] = ({}, False)
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._state = ({}, False)
+            self._version = None
+            self._checked_at = 0.0
+
+    # --- các bước thuần RAM, dùng chung cho bản sync và async ---
+
+    def _install(self, facts: Dict[str, Dict[str, Any]], version: Optional[str]) -> int:
+        with self._lock:
+            self._state = (dict(facts), True)
+            self._version = version
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+        print(f"Fact cache: đã nạp {len(facts)} phụ gia (version={version})")
+        return len(facts)
+
+    def _due(self) -> bool:
+        # tới lúc đọc lại version catalog chưa (mỗi check_interval giây 1 lần)
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        return True
+
+    def _on_version(self, version: Optional[str]) -> bool:
+        """Version đổi -> xoá cache; trả về True nếu trước đó đã nạp trọn (cần nạp lại)."""
+        if version == self._version:
+            return False
+        with self._lock:
+            was_complete = self._state[1]
+            self._state = ({}, False)
+            self._version = version
+        return was_complete
+
+    def _lookup(self, codes: List[str]):
+        facts, complete = self._state
+        result: Dict[str, Optional[Dict[str, Any]]] = {}
+        missing: List[str] = []
+        for c in codes:
+            if c in facts or complete:
+                f = facts.get(c)
+                result[c] = dict(f) if f is not None else None
+            else:
+                result[c] = None
+                missing.append(c)
+
+        with self._lock:
+            self.hits += len(codes) - len(missing)
+            self.misses += len(missing)
+        return result, missing, facts
+
+    def _fill(self, snapshot, missing, found, result) -> None:
+        if found is not None:
+            with self._lock:
+                # không ghi vào bảng cũ nếu cache vừa bị xoá/nạp lại trong lúc truy vấn
+                if self._state[0] is snapshot:
+                    for c in missing:
+                        snapshot[c] = found.get(c)
+        found = found or {}
+        for c in missing:
+            f = found.get(c)
+            result[c] = dict(f) if f is not None else None
+
+    # --- driver đồng bộ ---
+
+    def preload(self, driver: Driver) -> int:
+        """Nạp trọn catalog; trả về số mã đã nạp."""
+        version = get_catalog_version(driver)
+        return self._install(_run_facts_query(driver, _PRELOAD_QUERY, {}), version)
+
+    def _revalidate(self, driver: Driver) -> None:
+        if not self._due():
+            return
+        try:
+            version = get_catalog_version(driver)
+        except Exception as e:
+            print(f"Không đọc được version catalog, giữ cache hiện tại: {e}")
+            return
+        if self._on_version(version):
+            try:
+                self.preload(driver)
+            except Exception as e:
+                print(f"Không nạp lại được fact cache: {e}")
+
+    def get_many(self, driver: Driver, codes: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        self._revalidate(driver)
+        result, missing, snapshot = self._lookup(codes)
+        if missing:
+            self._fill(snapshot, missing, _query_facts_batch(driver, missing), result)
+        return result
+
+    # --- driver async (AsyncGraphDatabase) ---
+
+    async def apreload(self, driver: AsyncDriver) -> int:
+        version = await aget_catalog_version(driver)
+        return self._install(await _arun_facts_query(driver, _PRELOAD_QUERY, {}), version)
+
+    async def _arevalidate(self, driver: AsyncDriver) -> None:
+        if not self._due():
+            return
+        try:
+            version = await aget_catalog_version(driver)
+        except Exception as e:
+            print(f"Không đọc được version catalog, giữ cache hiện tại: {e}")
+            return
+        if self._on_version(version):
+            try:
+                await self.apreload(driver)
+            except Exception as e:
+                print(f"Không nạp lại được fact cache: {e}")
+
+    async def aget_many(self, driver: AsyncDriver, codes: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        await self._arevalidate(driver)
+        result, missing, snapshot = self._lookup(codes)
+        if missing:
+            self._fill(snapshot, missing, await _aquery_facts_batch(driver, missing), result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": FACT_CACHE_ENABLED,
+                "size": sum(1 for f in self._state[0].values() if f is not None),
+                "complete": self._state[1],
+                "version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+                "reloads": self.reloads,
+            }
+
+
+_FACT_CACHE = FactCache()
+
+
+def preload_fact_cache(driver: Optional[Driver] = None) -> int:
+    """Nạp trọn catalog vào fact cache (gọi lúc startup)."""
+    if not FACT_CACHE_ENABLED:
+        return 0
+    return _FACT_CACHE.preload(driver or get_neo4j_driver())
+
+
+def get_fact_cache_stats() -> Dict[str, Any]:
+    return _FACT_CACHE.stats()
+
+
+# === NEW: driver async (AsyncGraphDatabase) cho các endpoint async def của FastAPI ===
+# Cùng cấu hình pool với driver đồng bộ; tạo/đóng trong lifespan (cùng event loop với request).
+_ASYNC_DRIVER: Optional[AsyncDriver] = None
+
+
+async def init_async_neo4j_driver() -> AsyncDriver:
+    global _ASYNC_DRIVER
+    if _ASYNC_DRIVER is not None:
+        return _ASYNC_DRIVER
+
+    if not NEO4J_URI or not NEO4J_USER or not NEO4J_PASS:
+        raise EnvironmentError("Thiếu thông tin kết nối NEO4J trong file .env")
+
+    driver = AsyncGraphDatabase.driver(
+        NEO4J_URI,
+        auth=(NEO4J_USER, NEO4J_PASS),
+        max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+        connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+        max_connection_lifetime=NEO4J_MAX_CONN_LIFETIME,
+        connection_timeout=NEO4J_CONNECTION_TIMEOUT,
+    )
+    try:
+        await driver.verify_connectivity()
+    except (ServiceUnavailable, AuthError) as e:
+        await driver.close()
+        print(f"Lỗi: Không thể kết nối tới Neo4j tại {NEO4J_URI}. Chi tiết: {e}")
+        raise
+    # 2 coroutine cùng tạo thì giữ bản đầu tiên
+    if _ASYNC_DRIVER is not None:
+        await driver.close()
+        return _ASYNC_DRIVER
+    _ASYNC_DRIVER = driver
+    print("Kết nối Neo4j (async) thành công!")
+    return driver
+
+
+async def get_async_neo4j_driver() -> AsyncDriver:
+    """Driver async dùng chung; người gọi KHÔNG đóng, chỉ mở/đóng session."""
+    driver = _ASYNC_DRIVER
+    if driver is not None:
+        return driver
+    return await init_async_neo4j_driver()
+
+
+async def close_async_neo4j_driver() -> None:
+    global _ASYNC_DRIVER
+    driver, _ASYNC_DRIVER = _ASYNC_DRIVER, None
+    if driver is not None:
+        await driver.close()
+
+
+async def aget_catalog_version(driver: AsyncDriver) -> Optional[str]:
+    async with driver.session() as session:
+        result = await session.run(
+            "MATCH (v:CatalogVersion {name: $name}) RETURN v.version AS version",
+            {"name": CATALOG_VERSION_NAME},
+        )
+        rec = await result.single()
+    return rec["version"] if rec else None
+
+
+async def _arun_facts_query(driver: AsyncDriver, query: str, params: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    async with driver.session() as session:
+        result = await session.run(query, params)
+        for data in await result.data():
+            if data["code"] not in out:
+                out[data["code"]] = _facts_from_record(data)
+    return out
+
+
+async def _aquery_facts_batch(driver: AsyncDriver, codes: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+    try:
+        return await _arun_facts_query(driver, _BATCH_QUERY, {"codes": codes})
+    except ServiceUnavailable as e:
+        print(f"Lỗi dịch vụ Neo4j khi truy vấn {len(codes)} mã: {e}")
+    except Exception as e:
+        print(f"Lỗi không xác định khi truy vấn {len(codes)} mã: {e}")
+    return None
+
+
+async def get_facts_batch_async(driver: AsyncDriver, codes: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Bản async của get_facts_batch (cùng fact cache, cùng định dạng kết quả)."""
+    codes = list(dict.fromkeys(c for c in codes if c))
+    if not codes:
+        return {}
+    if FACT_CACHE_ENABLED:
+        return await _FACT_CACHE.aget_many(driver, codes)
+
+    found = await _aquery_facts_batch(driver, codes) or {}
+    return {c: found.get(c) for c in codes}
+
+
+async def preload_fact_cache_async(driver: Optional[AsyncDriver] = None) -> int:
+    if not FACT_CACHE_ENABLED:
+        return 0
+    return await _FACT_CACHE.apreload(driver or await get_async_neo4j_driver())
+
+
 # Test code
 if __name__ == "__main__":
     print("--- Chạy thử nghiệm neo4j_connector.py ---")
-    driver = None
     try:
         # 1. Lấy kết nối
         driver = get_neo4j_driver()
@@ -149,6 +568,4 @@ if __name__ == "__main__":
         print(f"Lỗi trong quá trình chạy thử: {e}")
     finally:
         # 3. Luôn đóng kết nối
-        if driver:
-            driver.close()
-            print("\nĐã đóng kết nối Neo4j.")
\ No newline at end of file
+        close_neo4j_driver()
\ No newline at end of file
@@ -1,12 +1,29 @@
 # === nlp_module.py / ecode_extractor.py ===
-import re, os, csv, unicodedata
+import re, os, io, csv, pickle, struct, hashlib, threading, unicodedata
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import List, Tuple, Dict, Optional
+from typing import (
+    List, Tuple, Dict, Optional, FrozenSet, Iterable, Iterator, Mapping, NamedTuple, Sequence, Union,
+)
+from types import MappingProxyType
 
 USE_CSV_SYNONYMS = True  # có thể bật nếu muốn dùng synonyms CSV
+USE_FUZZY_NAMES = False  # bật để khớp gần đúng name/synonym (chịu lỗi OCR như "tartrazln")
+FUZZY_MAX_TOKENS = 256   # trần số vị trí token được fuzzy trên mỗi text (~35 ms; xác định, không phụ thuộc tải máy)
 
 # === NEW (theo yêu cầu): chỉ đọc 1 file CSV cố định ===
-MASTER_CSV_PATH = r"D:\Hk7\KhoaLuan\ECODESAFETY\data\processed\ecodes_master.csv"
+# Mặc định tính theo vị trí repo, có thể ghi đè bằng biến môi trường ECODES_MASTER_CSV
+ROOT_DIR = Path(__file__).resolve().parent.parent
+MASTER_CSV_PATH = os.getenv(
+    "ECODES_MASTER_CSV",
+    str(ROOT_DIR / "data" / "processed" / "ecodes_master.csv"),
+)
+# File index đã build sẵn (xem build_index_artifact); cạnh CSV, có thể tắt bằng ECODES_INDEX_ARTIFACT=0
+USE_INDEX_ARTIFACT = os.getenv("ECODES_INDEX_ARTIFACT", "1") != "0"
 
 def norm(s: str) -> str:
     s = (s or "").lower()
@@ -23,6 +40,90 @@ def tokenize_norm(s: str) -> List[str]:
     return [t for t in collapse_non_alnum_to_space(norm(s)).split() if t]
 
 
+# === NEW: chuẩn hoá 1 lần + bảng ánh xạ vị trí ===
+
+class _NormCharTable(dict):
+    # bảng cho str.translate: ký tự -> norm(ký tự), tính lười và nhớ lại
+    def __missing__(self, ch_ord: int) -> str:
+        piece = norm(chr(ch_ord))
+        self[ch_ord] = piece
+        return piece
+
+
+_NORM_CHAR_TABLE = _NormCharTable()
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+
+class NormalizedText:
+    """
+    Văn bản được norm() đúng 1 lần (theo từng ký tự) kèm bảng offsets:
+    offsets[i] = vị trí trong `buf` ứng với ký tự thứ i của `text` gốc
+    (offsets có len(text) + 1 phần tử). Các kiểm tra ngữ cảnh đơn vị chạy
+    trực tiếp trên `buf` bằng pos/endpos của regex, không cắt chuỗi và
+    không chuẩn hoá lại từng cửa sổ như is_unit_context cũ.
+    """
+
+    __slots__ = ("text", "buf", "offsets")
+
+    def __init__(self, text: str) -> None:
+        text = text or ""
+        self.text = text
+        if text.isascii():
+            self.buf = text.lower()
+            self.offsets = range(len(text) + 1)
+            return
+
+        table = _NORM_CHAR_TABLE
+        buf = text.translate(table)
+        self.buf = buf
+        # trường hợp phổ biến (tiếng Việt có dấu): mỗi ký tự -> đúng 1 ký tự.
+        # Không suy ra từ len(buf) == len(text): 1 ký tự bị xoá + 1 ký tự thành 2 vẫn cùng độ dài.
+        if all(len(table[ord(ch)]) == 1 for ch in set(text)):
+            self.offsets = range(len(text) + 1)
+            return
+
+        offsets = [0] * (len(text) + 1)
+        pos = 0
+        for i, ch in enumerate(text):
+            offsets[i] = pos
+            pos += len(table[ord(ch)])
+        offsets[len(text)] = pos
+        self.offsets = offsets
+
+    def tokens(self) -> List[str]:
+        # tương đương tokenize_norm(text)
+        return _TOKEN_RE.findall(self.buf)
+
+    def token_spans(self) -> List[Tuple[str, int, int]]:
+        # (token, start, end) theo toạ độ của buf
+        return [(m.group(), m.start(), m.end()) for m in _TOKEN_RE.finditer(self.buf)]
+
+    def original_span(self, buf_start: int, buf_end: int) -> Tuple[int, int]:
+        """Đổi đoạn [buf_start, buf_end) của buf về toạ độ trong text gốc."""
+        off = self.offsets
+        if isinstance(off, range):
+            return buf_start, buf_end
+        return bisect_right(off, buf_start) - 1, bisect_left(off, buf_end)
+
+    def unit_context(self, start_idx: int, end_idx: int) -> bool:
+        """Giống is_unit_context(text, start_idx, end_idx) nhưng dùng buffer đã chuẩn hoá."""
+        buf, off, n = self.buf, self.offsets, len(self.text)
+        b_start = off[start_idx]
+        b_end = off[end_idx]
+        if _UNIT_NEAR_RE.search(buf, off[max(0, start_idx - 28)], b_start):
+            return True
+        if _SPACE_UNIT_AFTER_RE.match(buf, b_end, off[min(n, end_idx + 8)]):
+            return True
+        if _NOSPACE_UNIT_AFTER_RE.match(buf, b_end, off[min(n, end_idx + 10)]):
+            return True
+        if _PER_100G_RE.search(buf, off[max(0, start_idx - 12)], off[min(n, end_idx + 12)]):
+            return True
+        return False
+
+    def norm_slice(self, start_idx: int, end_idx: int) -> str:
+        return self.buf[self.offsets[start_idx] : self.offsets[end_idx]]
+
+
 def load_mapping(csv_path: str, list_delim: str = ",") -> Tuple[Dict[str, str], List[str]]:
     mapping, synonyms_raw = {}, []
     with open(csv_path, encoding="utf-8-sig", newline="") as f:
@@ -67,34 +168,286 @@ def max_allowed_dist(term: str) -> int:
     return 1 if len(term) <= 6 else 2
 
 
-def fuzzy_find_synonyms(text: str, mapping_norm: Dict[str, str]) -> List[Tuple[str, str, int]]:
+# === NEW: Aho–Corasick mức token cho name/name_vn/synonym ===
+
+class PhraseMatcher:
     """
-    EXACT MATCH VERSION — đọc đúng hoàn toàn synonym từ CSV.
-    Không fuzzy, không khoảng cách, chỉ nhận khi khớp 100%.
-    dist = 0 luôn.
+    Automaton Aho–Corasick trên TOKEN (không phải ký tự), build từ các phrase
+    đã chuẩn hoá bằng _canon_phrase. find_all() duyệt danh sách token đúng 1 lần
+    và trả về mọi phrase (1 từ hay nhiều từ) khớp trọn vẹn theo ranh giới từ,
+    nên chi phí không phụ thuộc vào số lượng phrase trong từ điển.
     """
-    res = []
-    text_norm = norm(text)
 
-    # tách từ đã chuẩn hoá
-    words = tokenize_norm(text_norm)
-    if not words:
-        return res
+    __slots__ = ("_goto", "_fail", "_out", "size")
 
-    text_join = " ".join(words)
+    def __init__(self, entries: Iterable[Tuple[str, object]]) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[Tuple[int, str, object], ...]] = [()]
+        size = 0
+        for phrase, payload in entries:
+            toks = phrase.split()
+            if not toks:
+                continue
+            node = 0
+            for t in toks:
+                nxt = goto[node].get(t)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][t] = nxt
+                    goto.append({})
+                    out.append(())
+                node = nxt
+            out[node] = out[node] + ((len(toks), phrase, payload),)
+            size += 1
+
+        # failure links theo BFS, gộp output của trạng thái fail vào trạng thái hiện tại
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            r = queue.popleft()
+            for t, s in goto[r].items():
+                queue.append(s)
+                f = fail[r]
+                while f and t not in goto[f]:
+                    f = fail[f]
+                nxt = goto[f].get(t, 0)
+                fail[s] = nxt if nxt != s else 0
+                if out[fail[s]]:
+                    out[s] = out[s] + out[fail[s]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+        self.size = size
+
+    @property
+    def first_tokens(self) -> Mapping[str, int]:
+        # token đầu của mọi phrase (cạnh ra từ gốc) — dùng như tập băm cho bộ lọc nhanh
+        return self._goto[0]
+
+    def find_all(self, tokens: List[str]) -> Iterator[Tuple[int, int, str, object]]:
+        """Yield (tok_start, tok_end, phrase, payload); tok_end là vị trí sau token cuối."""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, t in enumerate(tokens):
+            while node and t not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(t, 0)
+            if out[node]:
+                for n, phrase, payload in out[node]:
+                    yield i + 1 - n, i + 1, phrase, payload
+
+
+# === NEW: khớp gần đúng kiểu SymSpell (chỉ mục xoá ký tự) ===
+
+FUZZY_MIN_LEN = 5       # phrase/cửa sổ ngắn hơn thì không fuzzy (quá nhiều nhiễu)
+FUZZY_PREFIX_LEN = 7    # như SymSpell: chỉ sinh biến thể xoá trên tiền tố
+
+
+@lru_cache(maxsize=65536)
+def _delete_variants(term: str, max_dist: int) -> FrozenSet[str]:
+    out = {term}
+    frontier = {term}
+    for _ in range(max_dist):
+        nxt = set()
+        for w in frontier:
+            if len(w) > 1:
+                for i in range(len(w)):
+                    nxt.add(w[:i] + w[i + 1 :])
+        nxt -= out
+        out |= nxt
+        frontier = nxt
+    return frozenset(out)
+
+
+_FUZZY_LOCK = threading.Lock()
+_FUZZY_STATS = {"texts": 0, "truncated": 0}
+
+
+class FuzzyPhraseIndex:
+    """
+    Chỉ mục xoá ký tự (symmetric delete, SymSpell) trên các phrase đã chuẩn hoá.
+    Mỗi phrase chỉ được băm theo biến thể xoá của tiền tố FUZZY_PREFIX_LEN ký tự,
+    nên tra cứu 1 cửa sổ token chỉ tốn vài chục lần tra dict, không phụ thuộc
+    kích thước từ điển; ứng viên sau đó được xác nhận bằng damerau_lev.
+    """
 
-    for syn_norm, ecode in mapping_norm.items():
-        toks = syn_norm.split()
+    __slots__ = ("_entries", "_deletes", "_sizes", "max_dist", "prefix_len", "min_len")
+
+    def __init__(
+        self,
+        entries: Iterable[Tuple[str, object]],
+        max_dist: int = 2,
+        prefix_len: int = FUZZY_PREFIX_LEN,
+        min_len: int = FUZZY_MIN_LEN,
+    ) -> None:
+        self.max_dist = max_dist
+        self.prefix_len = prefix_len
+        self.min_len = min_len
+        self._entries: List[Tuple[str, object, int]] = []
+        self._deletes: Dict[str, List[int]] = {}
+        sizes = set()
+        for phrase, payload in entries:
+            if len(phrase) < min_len:
+                continue
+            pid = len(self._entries)
+            ntok = phrase.count(" ") + 1
+            self._entries.append((phrase, payload, ntok))
+            sizes.add(ntok)
+            for v in _delete_variants(phrase[:prefix_len], max_dist):
+                self._deletes.setdefault(v, []).append(pid)
+        self._sizes = tuple(sorted(sizes))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def find_all(
+        self,
+        tokens: List[str],
+        max_tokens: Optional[int] = None,
+        skip: Optional[set] = None,
+    ) -> Iterator[Tuple[int, int, str, object, int]]:
+        """
+        Yield (tok_start, tok_end, phrase, payload, dist) cho các cửa sổ token
+        khớp GẦN ĐÚNG (0 < dist <= max_allowed_dist) với một phrase cùng số token.
+        - max_tokens: chỉ fuzzy tối đa bấy nhiêu vị trí token đầu tiên (chưa khớp chính xác);
+                      phần sau bị bỏ qua và được đếm vào get_fuzzy_stats()["truncated"]
+        - skip      : các vị trí token đã khớp chính xác, không cần fuzzy lại
+        Kết quả fuzzy là best-effort nhưng xác định: cùng text -> cùng kết quả, bất kể tải máy.
+        """
+        truncated = False
+        probed = 0
+        entries, deletes = self._entries, self._deletes
+        size_set = set(self._sizes)
+        max_size = self._sizes[-1] if self._sizes else 0
+        plen, min_len = self.prefix_len, self.min_len
+        n_tokens = len(tokens)
+
+        for i in range(n_tokens):
+            if skip and i in skip:
+                continue
+            if max_tokens is not None and probed >= max_tokens:
+                truncated = True
+                break
+            probed += 1
+
+            # truy vấn theo tiền tố: các cửa sổ dài >= prefix_len dùng chung 1 tiền tố,
+            # cửa sổ ngắn hơn thì tra nguyên chuỗi
+            windows: Dict[int, str] = {}
+            queries = set()
+            w = tokens[i]
+            n = 1
+            while True:
+                if n in size_set:
+                    windows[n] = w
+                    if len(w) >= min_len - self.max_dist:
+                        queries.add(w[:plen])
+                if len(w) >= plen or i + n >= n_tokens or n >= max_size:
+                    break
+                w = w + " " + tokens[i + n]
+                n += 1
+            if len(w) >= plen:
+                queries.add(w[:plen])
+
+            cand = set()
+            for q in queries:
+                for v in _delete_variants(q, self.max_dist):
+                    ids = deletes.get(v)
+                    if ids:
+                        cand.update(ids)
+
+            for pid in cand:
+                phrase, payload, ntok = entries[pid]
+                if i + ntok > n_tokens:
+                    continue
+                w = windows.get(ntok)
+                if w is None:
+                    w = windows[ntok] = " ".join(tokens[i : i + ntok])
+                if w == phrase or abs(len(w) - len(phrase)) > self.max_dist:
+                    continue
+                d = min(max_allowed_dist(w), max_allowed_dist(phrase))
+                dist = damerau_lev(w, phrase, d)
+                if 0 < dist <= d:
+                    yield i, i + ntok, phrase, payload, dist
+
+        with _FUZZY_LOCK:
+            _FUZZY_STATS["texts"] += 1
+            if truncated:
+                _FUZZY_STATS["truncated"] += 1
+
+
+def get_fuzzy_stats() -> Dict[str, float]:
+    """Số text đã chạy fuzzy và số text bị cắt bớt vì vượt FUZZY_MAX_TOKENS."""
+    with _FUZZY_LOCK:
+        texts = _FUZZY_STATS["texts"]
+        truncated = _FUZZY_STATS["truncated"]
+    return {
+        "texts": texts,
+        "truncated": truncated,
+        "truncated_ratio": (truncated / texts) if texts else 0.0,
+        "max_tokens": FUZZY_MAX_TOKENS,
+    }
+
+
+def reset_fuzzy_stats() -> None:
+    with _FUZZY_LOCK:
+        _FUZZY_STATS["texts"] = 0
+        _FUZZY_STATS["truncated"] = 0
+
+
+def _phrase_hits(
+    words: List[str],
+    matcher: PhraseMatcher,
+    fuzzy_index: Optional[FuzzyPhraseIndex] = None,
+    max_tokens: Optional[int] = None,
+) -> List[Tuple[int, int, str, object, int]]:
+    # khớp chính xác bằng Aho–Corasick, sau đó (nếu có) fuzzy trên phần token chưa khớp
+    hits = [(s, e, phrase, payload, 0) for s, e, phrase, payload in matcher.find_all(words)]
+    if fuzzy_index is not None and len(fuzzy_index):
+        covered = {i for s, e, _, _, _ in hits for i in range(s, e)}
+        hits.extend(fuzzy_index.find_all(words, max_tokens=max_tokens, skip=covered))
+    return hits
+
+
+def fuzzy_find_synonyms(
+    text: Union[str, List[str]],
+    mapping_norm: Union[Mapping[str, str], PhraseMatcher],
+    fuzzy_index: Optional[FuzzyPhraseIndex] = None,
+    max_tokens: Optional[int] = FUZZY_MAX_TOKENS,
+    kinds: Tuple[str, ...] = ("synonym", "name"),
+) -> List[Tuple[str, str, int]]:
+    """
+    Tìm synonym / tên phụ gia trong text, trả về (phrase, code, dist).
+    - Mặc định: khớp chính xác theo ranh giới từ, dist = 0.
+    - Có fuzzy_index (ExtractorIndex.fuzzy_matcher()): thêm các khớp gần đúng
+      0 < dist <= max_allowed_dist, chỉ trên max_tokens vị trí token đầu mỗi text (best-effort,
+      text dài hơn bị cắt bớt và được đếm trong get_fuzzy_stats()).
+
+    Những gì được tra (theo `kinds`):
+      - "synonym": cột synonyms (code = cột ecode, vd "E102"); ecodes_master.csv hiện
+        KHÔNG có cột này nên phần này rỗng với dữ liệu trong repo
+      - "name"   : cột name + name_vn (code = "E" + canonical_ins, vd "E102", "E160a(ii)")
+
+    `text` có thể là chuỗi thô hoặc danh sách token đã tokenize_norm.
+    `mapping_norm` nên là PhraseMatcher build sẵn (ExtractorIndex.matcher);
+    truyền dict synonym -> ecode vẫn được nhưng phải build automaton mỗi lần (chỉ có synonym).
+    """
+    words = tokenize_norm(text) if isinstance(text, str) else text
+    if not words:
+        return []
 
-        # synonym có nhiều từ → match chuỗi
-        if len(toks) >= 2:
-            if syn_norm in text_join:
-                res.append((syn_norm, ecode, 0))
-        else:
-            # synonym 1 từ → match từng token
-            if syn_norm in words:
-                res.append((syn_norm, ecode, 0))
+    if isinstance(mapping_norm, PhraseMatcher):
+        matcher = mapping_norm
+    else:
+        matcher = PhraseMatcher(
+            (_canon_phrase(syn), ("synonym", ecode)) for syn, ecode in mapping_norm.items()
+        )
 
+    res = []
+    for _, _, phrase, (kind, code), dist in _phrase_hits(words, matcher, fuzzy_index, max_tokens):
+        if kind not in kinds:
+            continue
+        res.append((phrase, code if kind == "synonym" else "E" + canonical_ins(code), dist))
     return res
 
 
@@ -168,125 +521,780 @@ UNIT_NEAR = [
 ]
 
 
+_UNIT_NEAR_RE = re.compile("|".join(re.escape(kw) for kw in UNIT_NEAR))
+_SPACE_UNIT_AFTER_RE = re.compile(rf"\s+{SPACE_UNITS}")
+_NOSPACE_UNIT_AFTER_RE = re.compile(rf"\s*{NOSPACE_UNITS}")
+_PER_100G_RE = re.compile(r"(?:per|/)\s*100\s*g\b")
+
+_UNITS_SPACE_RE = re.compile(rf"\b\d+\s+{SPACE_UNITS}")
+_UNITS_NOSPACE_RE = re.compile(rf"\b\d+\s*{NOSPACE_UNITS}")
+_UNITS_FILLER_RE = re.compile(r"[0-9\s;:.,()/]+")
+_BARE_CODE_LINE_RE = re.compile(
+    r"\s*[0-9]{3,4}[a-z]*(\((?:i|ii|iii|iv|v|vi|vii|viii|ix)\))?\s*", re.IGNORECASE
+)
+
+
 def is_unit_context(text: str, start_idx: int, end_idx: int) -> bool:
-    before = norm(text[max(0, start_idx - 28) : start_idx])
-    if any(kw in before for kw in UNIT_NEAR):
-        return True
-    after = norm(text[end_idx : end_idx + 8])
-    if re.match(rf"^\s+{SPACE_UNITS}", after):
-        return True
-    after_long = norm(text[end_idx : end_idx + 10])
-    if re.match(rf"^\s*{NOSPACE_UNITS}", after_long):
-        return True
-    around = norm(text[max(0, start_idx - 12) : min(len(text), end_idx + 12)])
-    if re.search(r"(?:per|/)\s*100\s*g\b", around):
-        return True
-    return False
+    # giữ lại cho code cũ; trong extract_codes dùng NormalizedText.unit_context để khỏi chuẩn hoá lại
+    return NormalizedText(text).unit_context(start_idx, end_idx)
 
 
-def is_units_only_line(text: str) -> bool:
-    t = norm(text)
-    t = re.sub(rf"\b\d+\s+{SPACE_UNITS}", "", t)
-    t = re.sub(rf"\b\d+\s*{NOSPACE_UNITS}", "", t)
-    t = re.sub(r"[0-9\s;:.,()/]+", "", t)
+def _is_units_only_norm(t: str) -> bool:
+    t = _UNITS_SPACE_RE.sub("", t)
+    t = _UNITS_NOSPACE_RE.sub("", t)
+    t = _UNITS_FILLER_RE.sub("", t)
     return t.strip() == ""
 
 
+def is_units_only_line(text: str) -> bool:
+    return _is_units_only_norm(norm(text))
+
+
+# === NEW: bộ quét mã hợp nhất — 1 regex biên dịch sẵn, 1 lượt qua text ===
+# Mỗi mẫu cũ (pat_prefixed, pat_letter_roman, pat_roman, pat_plain, pat_digit_letters)
+# được bọc trong 1 lookahead có tên; regex tổng chỉ dừng ở các vị trí đầu từ và
+# ghi lại mẫu nào khớp tại đó. Thứ tự ưu tiên khi trùng vị trí = thứ tự của _SCAN_RULES.
+_SCAN_RULES = ("prefixed", "letter_roman", "roman", "plain", "digit_letters")
+
+_SCAN_PATTERNS = {
+    "prefixed": (
+        rf"\b(?P<p_prefix>E|INS)\s*-?\s*(?P<p_d>{DIGITLIKE})(?P<p_let>[A-Za-z]?)\s*"
+        rf"(?:\((?P<p_rom>{ROMAN_OK})\))?(?=$|[^A-Za-z0-9])"
+    ),
+    "letter_roman": rf"(?P<lr_d>{DIGITLIKE})(?P<lr_let>[A-Za-z])\s*\(\s*(?P<lr_rom>{ROMAN_OK})\s*\)",
+    "roman": rf"(?P<r_d>{DIGITLIKE})\s*\(\s*(?P<r_rom>{ROMAN_OK})\s*\)",
+    "plain": rf"(?P<pl_d>{DIGITLIKE})(?![A-Za-z])(?!\s*\()(?=$|[^A-Za-z0-9])",
+    "digit_letters": (
+        rf"(?P<dl_d>{DIGITLIKE})(?P<dl_letters>[A-Za-z]+)\b"
+        rf"(?!\s*\(\s*{ROMAN_OK}\s*\))"
+    ),
+}
+
+
+def _build_scan_regex() -> "re.Pattern":
+    # ưu tiên mẫu sau nếu mẫu trước không khớp: (?(a)|(?(b)|...(?!)))
+    guard = "(?!)"
+    for rule in reversed(_SCAN_RULES):
+        guard = f"(?({rule})|{guard})"
+    body = "".join(f"(?:(?=(?P<{rule}>{_SCAN_PATTERNS[rule]}))|)" for rule in _SCAN_RULES)
+    return re.compile(rf"(?<![A-Za-z0-9])(?=[0-9A-Za-z|!]){body}{guard}", re.IGNORECASE)
+
+
+_SCAN_RE = _build_scan_regex()
+_NOSPACE_UNITS_PREFIX_RE = re.compile(NOSPACE_UNITS)
+
+
+def _scan_code_candidates(
+    text: str,
+    ntext: Optional[NormalizedText] = None,
+) -> Iterator[Tuple[int, int, str, str]]:
+    """
+    Quét text đúng 1 lần, yield (start, end, rule, code) theo thứ tự vị trí.
+    Cho kết quả giống hệt việc chạy lần lượt 5 mẫu cũ bằng finditer: mỗi mẫu
+    vẫn giữ ngữ nghĩa không chồng lấn của chính nó (bỏ qua vị trí bắt đầu
+    nằm trong match trước đó của cùng mẫu), còn giữa các mẫu khác nhau thì
+    chồng lấn được giữ lại như trước.
+    Kiểm tra ngữ cảnh đơn vị dùng chung 1 NormalizedText (truyền vào hoặc tạo khi cần).
+    """
+    last_end = dict.fromkeys(_SCAN_RULES, 0)
+
+    if ntext is None:
+        ntext = NormalizedText(text)
+
+    for m in _SCAN_RE.finditer(text):
+        pos = m.start()
+
+        # 2) E / INS + số
+        if m.group("prefixed") is not None and pos >= last_end["prefixed"]:
+            last_end["prefixed"] = m.end("prefixed")
+            code = _code_from_prefixed(m)
+            if code:
+                yield pos, m.end("prefixed"), "prefixed", code
+
+        # 3a) số + chữ + roman (160a(i))
+        if m.group("letter_roman") is not None and pos >= last_end["letter_roman"]:
+            last_end["letter_roman"] = m.end("letter_roman")
+            d = _digits_for_bare(m.group("lr_d"))
+            if d and not ntext.unit_context(m.start("lr_d"), m.end("lr_rom")):
+                yield pos, m.end("letter_roman"), "letter_roman", (
+                    f"INS{d}{m.group('lr_let').lower()}({m.group('lr_rom').lower()})"
+                )
+
+        # 3b) số + roman (211(ii))
+        if m.group("roman") is not None and pos >= last_end["roman"]:
+            last_end["roman"] = m.end("roman")
+            d = _digits_for_bare(m.group("r_d"))
+            if d and not ntext.unit_context(m.start("r_d"), m.end("r_rom")):
+                yield pos, m.end("roman"), "roman", f"INS{d}({m.group('r_rom').lower()})"
+
+        # 4) số trần
+        if m.group("plain") is not None and pos >= last_end["plain"]:
+            last_end["plain"] = m.end("plain")
+            d = _digits_for_bare(m.group("pl_d"))
+            if d and not ntext.unit_context(m.start("pl_d"), m.end("pl_d")):
+                yield pos, m.end("plain"), "plain", f"INS{d}"
+
+        # 5) số + chữ dính liền (160d, 407a, 551i...)
+        if m.group("digit_letters") is not None and pos >= last_end["digit_letters"]:
+            last_end["digit_letters"] = m.end("digit_letters")
+            d = _digits_for_bare(m.group("dl_d"))
+            if d and not _NOSPACE_UNITS_PREFIX_RE.match(
+                ntext.buf, ntext.offsets[m.start("dl_letters")], ntext.offsets[m.end("dl_letters")]
+            ):
+                letters = m.group("dl_letters").lower()
+                yield pos, m.end("digit_letters"), "digit_letters", f"INS{d}{letters}"
+
+
+def _code_from_prefixed(m: "re.Match") -> Optional[str]:
+    dlike = m.group("p_d")
+    if count_real_digits(dlike) < 1:
+        return None
+
+    d = to_digits(dlike)
+    let = (m.group("p_let") or "").lower()
+
+    # === FIX: xử lý case INS160a(iv) khi dlike = "160a" và let rỗng ===
+    if not d:
+        if (not let) and dlike and dlike[-1].isalpha():
+            d2 = to_digits(dlike[:-1])
+            if d2:
+                d = d2
+                let = dlike[-1].lower()
+        if not d:
+            return None
+    # === END FIX ===
+
+    if not in_range(d):
+        return None
+
+    prefix = m.group("p_prefix").upper()
+    rom = (m.group("p_rom") or "").lower()
+    code = f"{prefix}{d}{let}"
+    if rom:
+        code += f"({rom})"
+    return code
+
+
+def _digits_for_bare(dlike: str) -> str:
+    # số không có tiền tố E/INS: cần ít nhất 2 chữ số thật và nằm trong khoảng hợp lệ
+    if count_real_digits(dlike) < 2:
+        return ""
+    d = to_digits(dlike)
+    if not d or not in_range(d):
+        return ""
+    return d
+
+
 def _strip_prefix_and_flatten(code: str) -> str:
     # Bỏ E/INS ở đầu, giữ phần số + chữ + (roman)
     core = re.sub(r"^(?:E|INS)\s*-?", "", code, flags=re.IGNORECASE)
     return core
 
 
-# === NEW (theo yêu cầu): đọc cột ins để lọc kết quả cuối ===
-_ALLOWED_INS_CACHE: Optional[set] = None
-
 def _canon_ins(s: str) -> str:
     # chuẩn hoá để so khớp: lower + bỏ khoảng trắng
     return re.sub(r"\s+", "", (s or "").strip().lower())
 
-def _load_allowed_ins_set(csv_path: str) -> set:
-    global _ALLOWED_INS_CACHE
-    if _ALLOWED_INS_CACHE is not None:
-        return _ALLOWED_INS_CACHE
 
-    allowed = set()
-    try:
-        with open(csv_path, encoding="utf-8-sig", newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                ins_val = row.get("ins")
-                if ins_val is None:
-                    continue
-                ins_norm = _canon_ins(ins_val)
-                if ins_norm:
-                    allowed.add(ins_norm)
-    except:
-        allowed = set()
+def _canon_phrase(s: str) -> str:
+    # chuẩn hoá phrase để match trong text (bỏ dấu + ký tự lạ + chuẩn hoá khoảng trắng)
+    return " ".join(tokenize_norm(s))
 
-    _ALLOWED_INS_CACHE = allowed
-    return allowed
 
+# === NEW: bảng alias INS chuẩn (1 lần tra dict thay cho nhiều lượt regex) ===
 
-# === NEW (theo yêu cầu): đọc cột name + name_vn -> trả về ins ===
-_NAME_INS_CACHE: Optional[Dict[str, str]] = None
+def canonical_ins(s: str) -> str:
+    """Khoá ins chuẩn — đúng dạng load_data.py ghi vào Neo4j (strip + lower)."""
+    return str(s or "").strip().lower()
 
-def _canon_phrase(s: str) -> str:
-    # chuẩn hoá phrase để match trong text (bỏ dấu + ký tự lạ + chuẩn hoá khoảng trắng)
-    return " ".join(tokenize_norm(s))
 
-def _load_name_ins_map(csv_path: str) -> Dict[str, str]:
-    global _NAME_INS_CACHE
-    if _NAME_INS_CACHE is not None:
-        return _NAME_INS_CACHE
+_ALIAS_DROP = {ord(ch): None for ch in " \t\r\n\f\v-"}
+_ALIAS_PREFIXES = ("", "e", "ins")
+_ROMAN_SUFFIX_RE = re.compile(r"(?P<base>[0-9]+[a-z]*)\((?P<rom>[ivx]+)\)")
+_LETTER_SUFFIX_RE = re.compile(r"(?P<base>[0-9]+)[a-z]")
+# nhầm lẫn OCR chữ -> số (suy ra từ DIGITMAP, bỏ các chữ mơ hồ khi lowercase như b/B)
+_DIGIT_CONFUSIONS: Dict[str, Tuple[str, ...]] = {}
+for _ch, _dg in DIGITMAP.items():
+    if DIGITMAP.get(_ch.lower(), _dg) == _dg and _ch.lower() not in _DIGIT_CONFUSIONS.get(_dg, ()):
+        _DIGIT_CONFUSIONS[_dg] = _DIGIT_CONFUSIONS.get(_dg, ()) + (_ch.lower(),)
+
+
+def _alias_key(s: str) -> str:
+    # khoá tra bảng alias: lower + bỏ khoảng trắng và '-' (E-100, INS 100, 1100 (i) ...)
+    return (s or "").lower().translate(_ALIAS_DROP)
+
+
+def _build_alias_table(
+    ins_values: Iterable[str],
+) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, Tuple[str, ...]]]:
+    """
+    Sinh sẵn mọi dạng bề mặt chấp nhận được -> ins chuẩn, trả về 3 bảng:
+      - aliases    : dạng chính xác, có/không tiền tố E, INS (khoảng trắng và '-'
+                     đã bị _alias_key bỏ): E100, INS 100, 1100(i) -> 1100 (i)
+      - ocr_aliases: dạng biến thể (không trùng dạng chính xác nào):
+                     sub-code roman mất ngoặc 100ii, 1 chữ số bị OCR đọc nhầm l00, 1O0
+      - children   : mã cha -> mã con trực tiếp: 100 -> (100(i), 100(ii)), 160 -> (160a, ...)
+    """
+    aliases: Dict[str, str] = {}
+    ocr_aliases: Dict[str, str] = {}
+    cores: List[Tuple[str, str]] = []
+    children: Dict[str, List[str]] = {}
+
+    for raw in ins_values:
+        canon = canonical_ins(raw)
+        if not canon:
+            continue
+        core = _alias_key(canon)
+        cores.append((core, canon))
+        for p in _ALIAS_PREFIXES:
+            aliases.setdefault(p + core, canon)
+
+    for core, canon in cores:
+        variants = []
+        m = _ROMAN_SUFFIX_RE.fullmatch(core)
+        if m:
+            variants.append(m.group("base") + m.group("rom"))
+            parent = m.group("base")
+        else:
+            m = _LETTER_SUFFIX_RE.fullmatch(core)
+            parent = m.group("base") if m else None
+        if parent:
+            children.setdefault(parent, []).append(canon)
+            # 160a(i) -> cha 160a -> ông 160 (kể cả khi 160a không có dòng riêng trong CSV)
+            m2 = _LETTER_SUFFIX_RE.fullmatch(parent)
+            if m2 and parent not in children.setdefault(m2.group("base"), []):
+                children[m2.group("base")].append(parent)
+
+        n_digits = len(core) - len(core.lstrip("0123456789"))
+        for i in range(n_digits):
+            for alt in _DIGIT_CONFUSIONS.get(core[i], ()):
+                variants.append(core[:i] + alt + core[i + 1 :])
+
+        for v in variants:
+            for p in _ALIAS_PREFIXES:
+                if p + v not in aliases:
+                    ocr_aliases.setdefault(p + v, canon)
 
-    mp: Dict[str, str] = {}
+    return aliases, ocr_aliases, {k: tuple(v) for k, v in children.items()}
+
+
+# === NEW: chỉ mục trích xuất build 1 lần từ CSV master ===
+
+class ExtractorIndex:
+    """
+    Chỉ mục BẤT BIẾN build một lần từ ecodes_master.csv, gồm:
+      - synonyms   : synonym đã norm() -> ecode (cột ecode/synonyms, nếu có)
+      - names      : phrase chuẩn hoá của cột name + name_vn -> ins
+      - allowed_ins: tập ins hợp lệ (đã _canon_ins) để lọc kết quả cuối
+      - matcher    : PhraseMatcher (Aho–Corasick) trên cả synonyms và names,
+                     payload là ("synonym", ecode) hoặc ("name", ins)
+      - aliases    : _alias_key(dạng bề mặt) -> ins chuẩn (canonical_ins)
+      - ocr_aliases: như aliases nhưng cho dạng biến thể/nhầm lẫn OCR (chỉ dùng cho tra cứu)
+      - children   : ins cha -> các sub-code trực tiếp
+
+    Kèm theo dấu vết file nguồn (mtime/size/sha1) để biết khi nào cần build lại.
+    Dùng get_extractor_index() thay vì tự tạo để tận dụng cache.
+    """
+
+    __slots__ = (
+        "csv_path", "mtime_ns", "size", "digest",
+        "synonyms", "names", "allowed_ins", "matcher", "_fuzzy",
+        "aliases", "ocr_aliases", "children",
+    )
+
+    def __init__(
+        self,
+        csv_path: str,
+        synonyms: Dict[str, str],
+        names: Dict[str, str],
+        allowed_ins: FrozenSet[str],
+        mtime_ns: int = 0,
+        size: int = 0,
+        digest: str = "",
+        aliases: Optional[Dict[str, str]] = None,
+        ocr_aliases: Optional[Dict[str, str]] = None,
+        children: Optional[Dict[str, Tuple[str, ...]]] = None,
+        matcher: Optional[PhraseMatcher] = None,
+    ) -> None:
+        object.__setattr__(self, "csv_path", csv_path)
+        object.__setattr__(self, "mtime_ns", mtime_ns)
+        object.__setattr__(self, "size", size)
+        object.__setattr__(self, "digest", digest)
+        object.__setattr__(self, "synonyms", MappingProxyType(dict(synonyms)))
+        object.__setattr__(self, "names", MappingProxyType(dict(names)))
+        object.__setattr__(self, "allowed_ins", frozenset(allowed_ins))
+        if matcher is None:
+            entries = [(_canon_phrase(k), ("synonym", v)) for k, v in self.synonyms.items()]
+            entries.extend((k, ("name", v)) for k, v in self.names.items())
+            matcher = PhraseMatcher(entries)
+        object.__setattr__(self, "matcher", matcher)
+        object.__setattr__(self, "_fuzzy", None)
+        object.__setattr__(self, "aliases", MappingProxyType(dict(aliases or {})))
+        object.__setattr__(self, "ocr_aliases", MappingProxyType(dict(ocr_aliases or {})))
+        object.__setattr__(self, "children", MappingProxyType(dict(children or {})))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ExtractorIndex là bất biến")
+
+    def __repr__(self) -> str:
+        return (
+            f"ExtractorIndex(csv_path={self.csv_path!r}, names={len(self.names)}, "
+            f"synonyms={len(self.synonyms)}, allowed_ins={len(self.allowed_ins)}, "
+            f"digest={self.digest[:12]!r})"
+        )
+
+    @classmethod
+    def from_csv(cls, csv_path: str, list_delim: str = ",") -> "ExtractorIndex":
+        """Đọc CSV đúng 1 lần và build cả 3 bảng."""
+        st = os.stat(csv_path)
+        with open(csv_path, "rb") as f:
+            raw = f.read()
+        return cls.from_bytes(raw, csv_path, st.st_mtime_ns, st.st_size, list_delim)
+
+    @classmethod
+    def from_bytes(
+        cls,
+        raw: bytes,
+        csv_path: str = "",
+        mtime_ns: int = 0,
+        size: int = 0,
+        list_delim: str = ",",
+    ) -> "ExtractorIndex":
+        synonyms: Dict[str, str] = {}
+        names: Dict[str, str] = {}
+        allowed = set()
+        ins_values: List[str] = []
+
+        reader = csv.DictReader(io.StringIO(raw.decode("utf-8-sig"), newline=""))
+        for row in reader:
+            # synonyms (giống load_mapping)
+            ecode = (row.get("ecode") or "").strip().upper()
+            for kw in (row.get("synonyms") or "").split(list_delim):
+                kw = kw.strip()
+                if kw:
+                    synonyms[norm(kw)] = ecode
+
+            ins_raw = row.get("ins")
+            if ins_raw is None:
+                continue
+            ins_norm = _canon_ins(ins_raw)
+            if ins_norm:
+                allowed.add(ins_norm)
+                ins_values.append(ins_raw)
+
+            ins_val = ins_raw.strip()
+            if not ins_val:
+                continue
+            # đọc 2 cột name và name_vn
+            for nm in ((row.get("name") or "").strip(), (row.get("name_vn") or "").strip()):
+                k = _canon_phrase(nm)
+                # nếu trùng key, giữ ins đầu tiên
+                if k and k not in names:
+                    names[k] = ins_val
+
+        aliases, ocr_aliases, children = _build_alias_table(ins_values)
+        return cls(
+            csv_path,
+            synonyms,
+            names,
+            frozenset(allowed),
+            mtime_ns=mtime_ns,
+            size=size,
+            digest=hashlib.sha1(raw).hexdigest(),
+            aliases=aliases,
+            ocr_aliases=ocr_aliases,
+            children=children,
+        )
+
+    def fuzzy_matcher(self) -> FuzzyPhraseIndex:
+        """FuzzyPhraseIndex trên cùng các phrase của matcher; build lười ở lần dùng đầu."""
+        fz = self._fuzzy
+        if fz is None:
+            entries = [(_canon_phrase(k), ("synonym", v)) for k, v in self.synonyms.items()]
+            entries.extend((k, ("name", v)) for k, v in self.names.items())
+            fz = FuzzyPhraseIndex(entries)
+            object.__setattr__(self, "_fuzzy", fz)
+        return fz
+
+    def _restamped(self, mtime_ns: int, size: int) -> "ExtractorIndex":
+        # file bị "touch" nhưng nội dung không đổi -> giữ nguyên dữ liệu, chỉ đổi dấu vết
+        return ExtractorIndex(
+            self.csv_path, self.synonyms, self.names, self.allowed_ins,
+            mtime_ns=mtime_ns, size=size, digest=self.digest,
+            aliases=self.aliases, ocr_aliases=self.ocr_aliases, children=self.children,
+            matcher=self.matcher,
+        )
+
+    def _artifact_state(self) -> Dict[str, object]:
+        # chỉ gồm kiểu dựng sẵn (dict/frozenset/tuple) + PhraseMatcher đã compile
+        return {
+            "synonyms": dict(self.synonyms),
+            "names": dict(self.names),
+            "allowed_ins": self.allowed_ins,
+            "aliases": dict(self.aliases),
+            "ocr_aliases": dict(self.ocr_aliases),
+            "children": dict(self.children),
+            "matcher": self.matcher,
+        }
+
+
+# === NEW: file index build sẵn để worker khởi động nhanh ===
+# Bố cục: MAGIC | version (uint16) | sha1 của CSV nguồn (40 byte ascii) | pickle.
+# Đọc header (47 byte) trước nên kiểm tra "cũ/mới" không phải đọc + giải nén phần thân.
+# Chỉ nạp file do chính build_index_artifact ghi ra (pickle không an toàn với file lạ).
+
+INDEX_ARTIFACT_MAGIC = b"ECIDX"
+INDEX_ARTIFACT_VERSION = 1  # tăng khi đổi cấu trúc ExtractorIndex / PhraseMatcher / bảng alias
+_ARTIFACT_HEADER = struct.Struct("<5sH40s")
+
+
+def index_artifact_path(csv_path: Optional[str] = None) -> str:
+    """data/processed/ecodes_master.csv -> data/processed/ecodes_master.extractor.idx"""
+    base, _ = os.path.splitext(os.path.abspath(csv_path or MASTER_CSV_PATH))
+    return base + ".extractor.idx"
+
+
+def build_index_artifact(
+    csv_path: Optional[str] = None,
+    out_path: Optional[str] = None,
+) -> str:
+    """Build ExtractorIndex từ CSV và ghi ra file artifact (ghi file tạm rồi os.replace)."""
+    csv_path = os.path.abspath(csv_path or MASTER_CSV_PATH)
+    out_path = out_path or index_artifact_path(csv_path)
+    index = ExtractorIndex.from_csv(csv_path)
+    header = _ARTIFACT_HEADER.pack(
+        INDEX_ARTIFACT_MAGIC, INDEX_ARTIFACT_VERSION, index.digest.encode("ascii")
+    )
+    body = pickle.dumps(index._artifact_state(), protocol=pickle.HIGHEST_PROTOCOL)
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(body)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def load_index_artifact(
+    csv_path: str,
+    digest: str,
+    artifact_path: Optional[str] = None,
+    mtime_ns: int = 0,
+    size: int = 0,
+) -> Optional[ExtractorIndex]:
+    """
+    Nạp index từ artifact nếu khớp version và sha1 của CSV hiện tại.
+    Đọc header trước, chỉ đọc phần thân (pickle) khi header khớp.
+    Trả về None nếu không có file / sai version / đã cũ / hỏng (kể cả pickle trỏ tới class
+    đã đổi chỗ hay thiếu khoá) -> caller build từ CSV.
+    """
+    path = artifact_path or index_artifact_path(csv_path)
     try:
-        with open(csv_path, encoding="utf-8-sig", newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                ins_val = (row.get("ins") or "").strip()
-                if not ins_val:
-                    continue
+        with open(path, "rb") as f:
+            header = f.read(_ARTIFACT_HEADER.size)
+            if len(header) < _ARTIFACT_HEADER.size:
+                return None
+            magic, version, src_digest = _ARTIFACT_HEADER.unpack(header)
+            if (
+                magic != INDEX_ARTIFACT_MAGIC
+                or version != INDEX_ARTIFACT_VERSION
+                or src_digest.decode("ascii", "replace") != digest
+            ):
+                return None
+            state = pickle.loads(f.read())
+
+        return ExtractorIndex(
+            csv_path,
+            state["synonyms"],
+            state["names"],
+            state["allowed_ins"],
+            mtime_ns=mtime_ns,
+            size=size,
+            digest=digest,
+            aliases=state["aliases"],
+            ocr_aliases=state["ocr_aliases"],
+            children=state["children"],
+            matcher=state["matcher"],
+        )
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # artifact hỏng / cũ / không khớp code hiện tại không được làm hỏng trích mã
+        print(f"Bỏ qua index artifact {path}: {type(e).__name__}: {e}")
+        return None
+
+
+_INDEX_LOCK = threading.Lock()
+_INDEXES: Dict[str, ExtractorIndex] = {}
+
+
+def _file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_extractor_index(csv_path: Optional[str] = None) -> Optional[ExtractorIndex]:
+    """
+    Trả về ExtractorIndex đã cache cho csv_path (mặc định MASTER_CSV_PATH).
+    - mtime/size không đổi  -> trả về ngay index cũ (chỉ tốn 1 os.stat)
+    - mtime/size đổi        -> so sha1; nội dung khác thì build lại
+    - build lại: ưu tiên nạp artifact cùng sha1 (build_index_artifact), không có thì đọc CSV
+    Index mới được build xong hoàn toàn rồi mới thay thế index cũ (atomic),
+    nên các request đang chạy vẫn dùng bản cũ nhất quán.
+    Trả về None nếu file không tồn tại.
+    """
+    path = os.path.abspath(csv_path or MASTER_CSV_PATH)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    current = _INDEXES.get(path)
+    if current is not None and current.mtime_ns == st.st_mtime_ns and current.size == st.st_size:
+        return current
+
+    with _INDEX_LOCK:
+        current = _INDEXES.get(path)
+        if current is not None and current.mtime_ns == st.st_mtime_ns and current.size == st.st_size:
+            return current
+        try:
+            digest = _file_sha1(path)
+            if current is not None and digest == current.digest:
+                fresh = current._restamped(st.st_mtime_ns, st.st_size)
+            else:
+                fresh = None
+                if USE_INDEX_ARTIFACT:
+                    fresh = load_index_artifact(path, digest, mtime_ns=st.st_mtime_ns, size=st.st_size)
+                if fresh is None:
+                    fresh = ExtractorIndex.from_csv(path)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            # file đang được ghi dở / lỗi đọc -> tiếp tục dùng bản cũ nếu có
+            print(f"Không thể build lại ExtractorIndex từ {path}: {e}")
+            return current
+        _INDEXES[path] = fresh
+        return fresh
+
+
+def resolve_ins(
+    surface: str,
+    index: Optional[ExtractorIndex] = None,
+    ocr: bool = True,
+) -> Optional[str]:
+    """
+    'E100', 'INS 100', 'e-160a (iv)', '1100(i)' ... -> ins chuẩn trong CSV
+    ('100', '160a(iv)', '1100 (i)'), hoặc None nếu không phải mã có trong CSV.
+    ocr=True thì nhận thêm dạng biến thể như 'l00', '100ii'.
+    """
+    if index is None:
+        index = get_extractor_index(MASTER_CSV_PATH)
+    if index is None:
+        return None
+    key = _alias_key(surface)
+    ins = index.aliases.get(key)
+    if ins is None and ocr:
+        ins = index.ocr_aliases.get(key)
+    return ins
+
+
+def ins_children(ins: str, index: Optional[ExtractorIndex] = None) -> Tuple[str, ...]:
+    """Các sub-code trực tiếp của 1 mã cha: '100' -> ('100(i)', '100(ii)')."""
+    if index is None:
+        index = get_extractor_index(MASTER_CSV_PATH)
+    if index is None:
+        return ()
+    key = _alias_key(ins)
+    for p in ("ins", "e"):
+        if key.startswith(p) and key[len(p) : len(p) + 1].isdigit():
+            key = key[len(p) :]
+            break
+    return index.children.get(key, ())
+
+
+# === NEW: lọc nhanh các text chắc chắn không có mã ===
+# Mọi mã dạng số cần ít nhất 1 chữ số ASCII thật (DIGITLIKE chỉ gồm [0-9A-Za-z|!]),
+# mọi khớp tên/synonym chính xác cần token đầu của phrase có trong text.
+
+_ASCII_DIGIT_RE = re.compile(r"[0-9]")
+_PREFILTER_LOCK = threading.Lock()
+_PREFILTER_STATS = {"checked": 0, "rejected": 0}
+
+
+def _prefilter(
+    text: str,
+    index: Optional[ExtractorIndex],
+    fuzzy: bool,
+) -> Tuple[bool, Optional[NormalizedText]]:
+    # trả về (có thể có mã?, NormalizedText nếu đã phải tạo) để extract_spans dùng lại
+    ntext = None
+    ok = _ASCII_DIGIT_RE.search(text or "") is not None
+    if not ok and index is not None:
+        ntext = NormalizedText(text)
+        if fuzzy:
+            ok = _TOKEN_RE.search(ntext.buf) is not None
+        else:
+            first = index.matcher.first_tokens
+            ok = any(t in first for t in ntext.tokens())
+    with _PREFILTER_LOCK:
+        _PREFILTER_STATS["checked"] += 1
+        if not ok:
+            _PREFILTER_STATS["rejected"] += 1
+    return ok, ntext
+
+
+def could_contain_codes(
+    text: str,
+    index: Optional[ExtractorIndex] = None,
+    fuzzy: Optional[bool] = None,
+) -> bool:
+    """False nghĩa là extract_* chắc chắn trả về rỗng cho text này."""
+    if index is None:
+        index = get_extractor_index(MASTER_CSV_PATH)
+    return _prefilter(text, index, USE_FUZZY_NAMES if fuzzy is None else fuzzy)[0]
+
+
+def get_prefilter_stats() -> Dict[str, float]:
+    """Số text đã qua bộ lọc nhanh và số text bị chặn sớm (không chạy regex/từ điển)."""
+    with _PREFILTER_LOCK:
+        checked = _PREFILTER_STATS["checked"]
+        rejected = _PREFILTER_STATS["rejected"]
+    return {
+        "checked": checked,
+        "rejected": rejected,
+        "rejected_ratio": (rejected / checked) if checked else 0.0,
+    }
+
+
+def reset_prefilter_stats() -> None:
+    with _PREFILTER_LOCK:
+        _PREFILTER_STATS["checked"] = 0
+        _PREFILTER_STATS["rejected"] = 0
+
+
+# === NEW: kết quả mức span (vị trí + luật khớp) ===
+
+class CodeSpan:
+    """
+    Một lần khớp mã trong text gốc:
+      - code : mã cuối cùng như extract_codes trả về ('100', '160a(iv)')
+      - start/end: vị trí [start, end) trong text gốc
+      - rule : luật khớp — 'prefixed', 'letter_roman', 'roman', 'plain',
+               'digit_letters' (quét số) hoặc 'name', 'synonym' (từ điển)
+      - norm : đoạn text đã chuẩn hoá (norm()) tương ứng
+    """
 
-                # đọc 2 cột name và name_vn
-                n1 = (row.get("name") or "").strip()
-                n2 = (row.get("name_vn") or "").strip()
-
-                for nm in (n1, n2):
-                    k = _canon_phrase(nm)
-                    if not k:
-                        continue
-                    # nếu trùng key, giữ ins đầu tiên (không thay đổi logic khác)
-                    if k not in mp:
-                        mp[k] = ins_val.strip()
-    except:
-        mp = {}
+    __slots__ = ("code", "start", "end", "rule", "norm")
 
-    _NAME_INS_CACHE = mp
-    return mp
+    def __init__(self, code: str, start: int, end: int, rule: str, norm: str) -> None:
+        self.code = code
+        self.start = start
+        self.end = end
+        self.rule = rule
+        self.norm = norm
 
+    def __repr__(self) -> str:
+        return f"CodeSpan({self.code!r}, {self.start}, {self.end}, {self.rule!r}, {self.norm!r})"
 
-def extract_codes(text: str, csv_path: Optional[str] = None) -> List[str]:
-    # === UPDATE (theo yêu cầu): chỉ loại "100 g" (có space), còn "100g" vẫn cho đi tiếp để lọc bằng CSV(ins) ===
-    if is_units_only_line(text) and not re.fullmatch(
-        r"\s*[0-9]{3,4}[a-z]*(\((?:i|ii|iii|iv|v|vi|vii|viii|ix)\))?\s*",
-        text,
-        re.IGNORECASE,
-    ):
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CodeSpan):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    def __hash__(self) -> int:
+        return hash(self.as_tuple())
+
+    def as_tuple(self) -> Tuple[str, int, int, str, str]:
+        return (self.code, self.start, self.end, self.rule, self.norm)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "code": self.code,
+            "start": self.start,
+            "end": self.end,
+            "rule": self.rule,
+            "norm": self.norm,
+        }
+
+
+_FINAL_CODE_RE = re.compile(r"[0-9]{3,4}[a-z]*(\((?:i|ii|iii|iv|v|vi|vii|viii|ix)\))?")
+
+
+def extract_spans(
+    text: str,
+    csv_path: Optional[str] = None,
+    index: Optional[ExtractorIndex] = None,
+    fuzzy: Optional[bool] = None,
+) -> List[CodeSpan]:
+    """
+    Trích mã phụ gia kèm vị trí trong text gốc, luật khớp và dạng chuẩn hoá.
+    Một mã có thể xuất hiện ở nhiều span (vd vừa khớp tên vừa khớp số).
+    Kết quả sắp theo (start, end).
+    """
+    if index is None:
+        if csv_path is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            c1 = os.path.join(script_dir, "ecode_dict_clean.csv")
+            csv_path = c1 if os.path.exists(c1) else None
+        if csv_path:
+            index = get_extractor_index(csv_path)
+    if fuzzy is None:
+        fuzzy = USE_FUZZY_NAMES
+
+    # lọc nhanh: không có chữ số và không có từ nào trong từ điển -> dừng sớm
+    ok, ntext = _prefilter(text, index, fuzzy)
+    if not ok:
         return []
 
-    if csv_path is None:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        c1 = os.path.join(script_dir, "ecode_dict_clean.csv")
-        csv_path = c1 if os.path.exists(c1) else None
+    # chuẩn hoá 1 lần, dùng chung cho kiểm tra đơn vị, tách token và quét mã
+    if ntext is None:
+        ntext = NormalizedText(text)
+
+    # === UPDATE (theo yêu cầu): chỉ loại "100 g" (có space), còn "100g" vẫn cho đi tiếp để lọc bằng CSV(ins) ===
+    if _is_units_only_norm(ntext.buf) and not _BARE_CODE_LINE_RE.fullmatch(text):
+        return []
 
-    found = set()
+    # === NEW (theo yêu cầu): lọc theo cột ins của CSV (exact match) ===
+    # Có CSV: 1 lần tra bảng alias vừa bỏ E/INS vừa lọc vừa trả về đúng khoá ins trong DB
+    aliases = index.aliases if index is not None else None
+
+    def final_code(raw: str) -> Optional[str]:
+        if aliases:
+            return aliases.get(_alias_key(raw))
+        # Không có CSV: bỏ E/INS, còn lại dạng '100', '160a(iv)'
+        c = _strip_prefix_and_flatten(raw)
+        if not _FINAL_CODE_RE.fullmatch(c):
+            return None
+        return c.lower()
+
+    spans: List[CodeSpan] = []
+    tok_spans = ntext.token_spans() if index is not None else []
+    words = [t for t, _, _ in tok_spans]
+
+    phrase_hits = []
+    if words:
+        phrase_hits = _phrase_hits(
+            words,
+            index.matcher,
+            index.fuzzy_matcher() if fuzzy else None,
+            FUZZY_MAX_TOKENS,
+        )
+
+    def phrase_span(tok_start: int, tok_end: int, raw: str, rule: str) -> None:
+        code = final_code(raw)
+        if code is None:
+            return
+        b_start, b_end = tok_spans[tok_start][1], tok_spans[tok_end - 1][2]
+        start, end = ntext.original_span(b_start, b_end)
+        spans.append(CodeSpan(code, start, end, rule, ntext.buf[b_start:b_end]))
 
     # 1) Synonyms (nếu bật)
-    if USE_CSV_SYNONYMS and csv_path and os.path.exists(csv_path):
-        mapping_norm, _ = load_mapping(csv_path)
-        fuzzy_hits = fuzzy_find_synonyms(text, mapping_norm)
+    if USE_CSV_SYNONYMS and phrase_hits:
+        fuzzy_hits = [
+            (phrase, e, dist)
+            for _, _, phrase, (kind, e), dist in phrase_hits
+            if kind == "synonym"
+        ]
         best_by_code = {}
         for syn_norm, e, dist in fuzzy_hits:
             if not (isinstance(e, str) and e.upper().startswith("E")):
@@ -299,149 +1307,159 @@ def extract_codes(text: str, csv_path: Optional[str] = None) -> List[str]:
                 best_by_code[e] = (syn_norm, dist)
         if best_by_code:
             best_dist = min(dist for (_, dist) in best_by_code.values())
-            for e, (syn_norm, dist) in best_by_code.items():
-                if dist <= best_dist + 1:
-                    found.add("E" + e[1:].lower())
+            accepted = {e for e, (_, dist) in best_by_code.items() if dist <= best_dist + 1}
+            for s, e_tok, _, (kind, e), _ in phrase_hits:
+                if kind == "synonym" and e in accepted:
+                    phrase_span(s, e_tok, "E" + e[1:].lower(), "synonym")
 
     # === NEW (theo yêu cầu): match theo cột name + name_vn, nếu trùng thì trả về ins tương ứng ===
-    if csv_path and os.path.exists(csv_path):
-        name_map = _load_name_ins_map(csv_path)
-        if name_map:
-            words = tokenize_norm(text)
-            if words:
-                text_join = " ".join(words)
-                for k, ins_val in name_map.items():
-                    toks = k.split()
-                    if len(toks) >= 2:
-                        if k in text_join:
-                            found.add("INS" + ins_val.strip().lower())
-                    else:
-                        if k in words:
-                            found.add("INS" + ins_val.strip().lower())
-
-    # 2) E / INS + số
-    pat_prefixed = re.compile(
-        rf"\b(?P<prefix>E|INS)\s*-?\s*(?P<d>{DIGITLIKE})(?P<let>[A-Za-z]?)\s*(?:\((?P<rom>{ROMAN_OK})\))?(?=$|[^A-Za-z0-9])",
-        re.IGNORECASE,
-    )
-    for m in pat_prefixed.finditer(text):
-        dlike = m.group("d")
-        if count_real_digits(dlike) < 1:
+    # (1 lượt Aho–Corasick trên token, khớp trọn từ cho cả phrase 1 từ và nhiều từ)
+    # (fuzzy bật thì gồm cả các khớp gần đúng trên phần token chưa khớp chính xác)
+    for s, e_tok, _, (kind, ins_val), _ in phrase_hits:
+        if kind == "name":
+            phrase_span(s, e_tok, "INS" + ins_val.strip().lower(), "name")
+
+    # 2)–5) E/INS + số, số + chữ + roman, số + roman, số trần, số + chữ dính liền
+    # (1 lượt quét duy nhất, xem _scan_code_candidates)
+    for start, end, rule, raw in _scan_code_candidates(text, ntext):
+        code = final_code(raw)
+        if code is None:
             continue
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        spans.append(CodeSpan(code, start, end, rule, ntext.norm_slice(start, end)))
+
+    spans.sort(key=lambda sp: (sp.start, sp.end))
+    return spans
+
+
+def extract_codes(
+    text: str,
+    csv_path: Optional[str] = None,
+    index: Optional[ExtractorIndex] = None,
+    fuzzy: Optional[bool] = None,
+) -> List[str]:
+    """Danh sách mã (đã bỏ E/INS, sắp xếp, không trùng) — chiếu từ extract_spans."""
+    return sorted({sp.code for sp in extract_spans(text, csv_path=csv_path, index=index, fuzzy=fuzzy)})
+
+
+def extract_ecodes_from_text(
+    text: str,
+    csv_path: Optional[str] = None,
+    index: Optional[ExtractorIndex] = None,
+    fuzzy: Optional[bool] = None,
+) -> List[str]:
+    # === NEW (theo yêu cầu): bỏ candidates, đọc duy nhất 1 file cố định ===
+    # Index được build 1 lần và tự build lại khi file master thay đổi
+    if index is None:
+        index = get_extractor_index(MASTER_CSV_PATH)
+    return extract_codes(text, csv_path=MASTER_CSV_PATH, index=index, fuzzy=fuzzy)
 
-        d = to_digits(dlike)
-        let = (m.group("let") or "").lower()
 
-        # === FIX: xử lý case INS160a(iv) khi dlike = "160a" và let rỗng ===
-        if not d:
-            if (not let) and dlike and dlike[-1].isalpha():
-                d2 = to_digits(dlike[:-1])
-                if d2:
-                    d = d2
-                    let = dlike[-1].lower()
-            if not d:
-                continue
-        # === END FIX ===
+def extract_spans_from_text(
+    text: str,
+    index: Optional[ExtractorIndex] = None,
+    fuzzy: Optional[bool] = None,
+) -> List[CodeSpan]:
+    # giống extract_ecodes_from_text nhưng trả về span (dùng cho highlight / đối soát)
+    if index is None:
+        index = get_extractor_index(MASTER_CSV_PATH)
+    return extract_spans(text, csv_path=MASTER_CSV_PATH, index=index, fuzzy=fuzzy)
 
-        if not in_range(d):
-            continue
 
-        prefix = m.group("prefix").upper()
-        rom = (m.group("rom") or "").lower()
-        code = f"{prefix}{d}{let}"
-        if rom:
-            code += f"({rom})"
-        found.add(code)
+# === NEW: trích xuất theo lô (quét lại kho nhãn cũ khi từ điển thay đổi) ===
 
-
-    # 3a) số + chữ + roman (160a(i))
-    pat_letter_roman = re.compile(
-        rf"(?<![A-Za-z0-9])(?P<d>{DIGITLIKE})(?P<let>[A-Za-z])\s*\(\s*(?P<rom>{ROMAN_OK})\s*\)",
-        re.IGNORECASE,
-    )
-    for m in pat_letter_roman.finditer(text):
-        dlike = m.group("d")
-        if count_real_digits(dlike) < 2:
-            continue
-        d = to_digits(dlike)
-        if not d or not in_range(d):
-            continue
-        if is_unit_context(text, m.start("d"), m.end("rom")):
-            continue
-        found.add(f"INS{d}{m.group('let').lower()}({m.group('rom').lower()})")
-
-    # 3b) số + roman (211(ii))
-    pat_roman = re.compile(
-        rf"(?<![A-Za-z0-9])(?P<d>{DIGITLIKE})\s*\(\s*(?P<rom>{ROMAN_OK})\s*\)",
-        re.IGNORECASE,
-    )
-    for m in pat_roman.finditer(text):
-        dlike = m.group("d")
-        if count_real_digits(dlike) < 2:
-            continue
-        d = to_digits(dlike)
-        if not d or not in_range(d):
-            continue
-        if is_unit_context(text, m.start("d"), m.end("rom")):
-            continue
-        found.add(f"INS{d}({m.group('rom').lower()})")
-
-    # 4) số trần
-    pat_plain = re.compile(
-        rf"(?<![A-Za-z0-9])(?P<d>{DIGITLIKE})(?![A-Za-z])(?!\s*\()(?=$|[^A-Za-z0-9])",
-        re.IGNORECASE,
-    )
-    for m in pat_plain.finditer(text):
-        dlike = m.group("d")
-        if count_real_digits(dlike) < 2:
-            continue
-        d = to_digits(dlike)
-        if not d or not in_range(d):
-            continue
-        if is_unit_context(text, m.start("d"), m.end("d")):
-            continue
-        found.add(f"INS{d}")
+class ExtractionResult(NamedTuple):
+    """Kết quả cho 1 text trong lô: codes như extract_codes, error != None nếu text đó lỗi."""
+    codes: List[str]
+    error: Optional[str] = None
 
 
+def _extract_one(text: str, index: Optional[ExtractorIndex], fuzzy: Optional[bool]) -> ExtractionResult:
+    try:
+        return ExtractionResult(extract_codes(text, index=index, fuzzy=fuzzy))
+    except Exception as e:
+        return ExtractionResult([], f"{type(e).__name__}: {e}")
 
-    # 5) số + chữ dính liền (160d, 407a, 551i...)
-    pat_digit_letters = re.compile(
-        rf"(?<![A-Za-z0-9])(?P<d>{DIGITLIKE})(?P<letters>[A-Za-z]+)\b"
-        rf"(?!\s*\(\s*{ROMAN_OK}\s*\))",
-        re.IGNORECASE,
-    )
-    for m in pat_digit_letters.finditer(text):
-        dlike = m.group("d")
-        if count_real_digits(dlike) < 2:
-            continue
-        d = to_digits(dlike)
-        if not d or not in_range(d):
-            continue
-        letters = m.group("letters")
-        if re.match(rf"^{NOSPACE_UNITS}", norm(letters)):
-            continue
-        found.add(f"INS{d}{letters.lower()}")
 
-    # Bỏ E/INS, còn lại dạng '100', '160a(iv)'
-    stripped = {_strip_prefix_and_flatten(c) for c in found}
+def _init_batch_worker(csv_path: str) -> None:
+    # mỗi process build/nạp index đúng 1 lần (với fork thì đã kế thừa sẵn từ process cha)
+    get_extractor_index(csv_path)
 
-    # === NEW (theo yêu cầu): lọc theo cột ins của CSV (exact match) ===
-    allowed_ins = set()
-    if csv_path and os.path.exists(csv_path):
-        allowed_ins = _load_allowed_ins_set(csv_path)
-
-    safe = []
-    for c in stripped:
-        if re.fullmatch(r"[0-9]{3,4}[a-z]*(\((?:i|ii|iii|iv|v|vi|vii|viii|ix)\))?", c):
-            # chỉ giữ nếu tồn tại trong cột ins
-            if allowed_ins and (_canon_ins(c) not in allowed_ins):
-                continue
-            safe.append(c.lower())
 
-    return sorted(set(safe))
+def _extract_chunk(texts: List[str], csv_path: str, fuzzy: Optional[bool]) -> List[ExtractionResult]:
+    index = get_extractor_index(csv_path)
+    return [_extract_one(t, index, fuzzy) for t in texts]
 
 
-def extract_ecodes_from_text(text: str, csv_path: Optional[str] = None) -> List[str]:
-    # === NEW (theo yêu cầu): bỏ candidates, đọc duy nhất 1 file cố định ===
-    csv_path = MASTER_CSV_PATH
-    return extract_codes(text, csv_path=csv_path)
+def iter_extract_codes(
+    texts: Iterable[str],
+    workers: Optional[int] = 1,
+    chunksize: int = 64,
+    csv_path: Optional[str] = None,
+    fuzzy: Optional[bool] = None,
+) -> Iterator[ExtractionResult]:
+    """
+    Generator: trích mã cho từng text trong `texts`, trả về ExtractionResult
+    ĐÚNG THỨ TỰ đầu vào. Đầu vào được đọc lười theo từng chunk và chỉ có tối đa
+    2 chunk/worker đang xử lý, nên có thể stream hàng triệu dòng mà không giữ
+    hết trong bộ nhớ.
+      - workers = 1 (mặc định): chạy tuần tự trong process hiện tại
+      - workers > 1           : chia chunk cho ProcessPoolExecutor (regex bị GIL giới hạn)
+      - workers = 0 / None    : dùng os.cpu_count()
+    Lỗi của từng text được ghi vào ExtractionResult.error, không làm dừng cả lô.
+    """
+    csv_path = csv_path or MASTER_CSV_PATH
+    # build index ở process cha trước khi tạo pool để worker fork dùng lại luôn
+    index = get_extractor_index(csv_path)
+    if not workers:
+        workers = os.cpu_count() or 1
+    chunksize = max(1, int(chunksize))
+    it = iter(texts)
+
+    if workers <= 1:
+        for text in it:
+            yield _extract_one(text, index, fuzzy)
+        return
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_batch_worker,
+        initargs=(csv_path,),
+    )
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < workers * 2:
+                chunk = list(islice(it, chunksize))
+                if not chunk:
+                    break
+                pending.append((executor.submit(_extract_chunk, chunk, csv_path, fuzzy), len(chunk)))
+            if not pending:
+                break
+            future, size = pending.popleft()
+            try:
+                results = future.result()
+            except Exception as e:
+                # worker chết (BrokenProcessPool, ...) -> đánh lỗi cả chunk
+                results = [ExtractionResult([], f"{type(e).__name__}: {e}")] * size
+            yield from results
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def extract_codes_many(
+    texts: Sequence[str],
+    workers: Optional[int] = 1,
+    chunksize: int = 64,
+    csv_path: Optional[str] = None,
+    fuzzy: Optional[bool] = None,
+    min_parallel: int = 256,
+) -> List[ExtractionResult]:
+    """
+    Trích mã cho cả danh sách texts, trả về list ExtractionResult cùng thứ tự.
+    Lô nhỏ hơn `min_parallel` chạy tuần tự (chi phí khởi tạo process không đáng).
+    """
+    if len(texts) < min_parallel:
+        workers = 1
+    return list(iter_extract_codes(texts, workers=workers, chunksize=chunksize, csv_path=csv_path, fuzzy=fuzzy))
@@ -0,0 +1,280 @@
+# file: src/ocr_cache.py
+"""
+Cache kết quả OCR trước tầng EasyOCR:
+  - khớp chính xác  : SHA-256 của bytes ảnh (người dùng tải lại đúng file cũ)
+  - khớp gần đúng   : MẶC ĐỊNH TẮT (OCR_CACHE_HAMMING=-1) vì 2 nhãn khác nhau cùng bố cục có thể
+                      chung dHash 64 bit mà khác mã phụ gia. Bật lên thì 1 near hit phải qua đủ:
+                        dHash 64 bit (ảnh xám thu nhỏ 9x8) cách <= OCR_CACHE_HAMMING,
+                        cùng kích thước ảnh,
+                        dHash mịn 256 bit (17x16) cách <= OCR_CACHE_FINE_HAMMING
+                      (nén lại / lưu lại cùng 1 ảnh; ảnh chụp lại hay đổi kích thước sẽ miss)
+  - không cache kết quả lỗi hoặc text rỗng (OCR trượt thì lần sau được đọc lại)
+  - LRU giới hạn OCR_CACHE_SIZE mục; OCR_CACHE_DB (tuỳ chọn) lưu SQLite để giữ qua lần khởi động sau.
+    Mỗi dòng SQLite kèm ocr_config_fingerprint(); lúc mở, dòng của cấu hình OCR khác bị xoá
+Cache nằm ở process API (trước pool OCR) nên mọi worker OCR dùng chung.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from src.ocr_module import ocr_config_fingerprint
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE", "1") != "0"
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "1024"))
+# ngưỡng Hamming trên 64 bit dHash; < 0 = tắt khớp gần đúng (mặc định), 0 = chỉ khớp dHash trùng hẳn
+OCR_CACHE_HAMMING = int(os.getenv("OCR_CACHE_HAMMING", "-1"))
+# ngưỡng xác nhận trên dHash mịn 256 bit (chỉ xét khi khớp gần đúng đang bật)
+OCR_CACHE_FINE_HAMMING = int(os.getenv("OCR_CACHE_FINE_HAMMING", "8"))
+# rỗng = chỉ giữ trong RAM; ví dụ data/ocr_cache.sqlite3 để giữ qua lần khởi động sau
+OCR_CACHE_DB = os.getenv("OCR_CACHE_DB", "")
+
+ImageBytes = Union[bytes, bytearray, memoryview]
+
+
+class ImageKey(NamedTuple):
+    sha256: str
+    dhash: Optional[int]                        # None nếu không giải mã được ảnh
+    size: Optional[Tuple[int, int]] = None      # (cao, rộng) của ảnh đã giải mã ở 1/8
+    fine: Optional[int] = None                  # dHash 256 bit để xác nhận near hit
+
+
+def dhash(gray: np.ndarray, size: int = 8) -> int:
+    """Difference hash: so sánh độ sáng 2 pixel kề nhau trên ảnh xám (size+1) x size."""
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for b in bits:
+        value = (value << 1) | int(b)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def image_key(data: ImageBytes) -> ImageKey:
+    """SHA-256 của bytes + dHash; giải mã ở 1/8 độ phân giải nên rẻ hơn nhiều so với imdecode đầy đủ."""
+    sha = hashlib.sha256(data).hexdigest()
+    small = cv2.imdecode(np.frombuffer(memoryview(data), dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return ImageKey(sha, None)
+    return ImageKey(sha, dhash(small), small.shape[:2], dhash(small, 16))
+
+
+class OCRCache:
+    def __init__(
+        self,
+        max_entries: int = OCR_CACHE_SIZE,
+        max_hamming: int = OCR_CACHE_HAMMING,
+        db_path: str = OCR_CACHE_DB,
+        max_fine_hamming: int = OCR_CACHE_FINE_HAMMING,
+        config: Optional[str] = None,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.max_hamming = max_hamming
+        self.max_fine_hamming = max_fine_hamming
+        self.db_path = db_path
+        # cấu hình OCR đã sinh ra các kết quả trong cache (xem ocr_config_fingerprint)
+        self.config = config or ocr_config_fingerprint()
+        self._lock = threading.Lock()
+        # sha256 -> (khoá ảnh, kết quả OCR); thứ tự = thứ tự dùng gần nhất (cuối = mới nhất)
+        self._entries: "OrderedDict[str, Tuple[ImageKey, Dict[str, Any]]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            self._open_db()
+
+    # ---------- SQLite (tuỳ chọn) ----------
+
+    def _open_db(self) -> None:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_cache ("
+            " sha256 TEXT PRIMARY KEY, dhash TEXT, result TEXT NOT NULL, last_used REAL NOT NULL,"
+            " fine TEXT, height INTEGER, width INTEGER, config TEXT)"
+        )
+        # file tạo trước khi có fine/height/width/config: thêm cột, các dòng cũ chỉ còn khớp chính xác
+        cols = {row[1] for row in conn.execute("PRAGMA table_info(ocr_cache)")}
+        for col, typ in (("fine", "TEXT"), ("height", "INTEGER"), ("width", "INTEGER"), ("config", "TEXT")):
+            if col not in cols:
+                conn.execute(f"ALTER TABLE ocr_cache ADD COLUMN {col} {typ}")
+        # kết quả của cấu hình OCR khác (hoặc không rõ cấu hình) không còn đúng -> bỏ
+        dropped = conn.execute(
+            "DELETE FROM ocr_cache WHERE config IS NULL OR config != ?", (self.config,)
+        ).rowcount
+        if dropped:
+            print(f"OCR cache: bỏ {dropped} kết quả của cấu hình OCR khác")
+        conn.commit()
+        rows = conn.execute(
+            "SELECT sha256, dhash, fine, height, width, result FROM ocr_cache ORDER BY last_used DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for sha, dh, fine, h, w, result in reversed(rows):
+            key = ImageKey(
+                sha,
+                int(dh, 16) if dh else None,
+                (h, w) if h is not None and w is not None else None,
+                int(fine, 16) if fine else None,
+            )
+            self._entries[sha] = (key, json.loads(result))
+        self._conn = conn
+
+    def _db_touch(self, sha: str) -> None:
+        if self._conn is not None:
+            self._conn.execute("UPDATE ocr_cache SET last_used = ? WHERE sha256 = ?", (time.time(), sha))
+            self._conn.commit()
+
+    def _db_put(self, key: ImageKey, result: Dict[str, Any], evicted: list) -> None:
+        if self._conn is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO ocr_cache (sha256, dhash, fine, height, width, config, result, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key.sha256,
+             f"{key.dhash:016x}" if key.dhash is not None else None,
+             f"{key.fine:064x}" if key.fine is not None else None,
+             key.size[0] if key.size else None,
+             key.size[1] if key.size else None,
+             self.config,
+             json.dumps(result, ensure_ascii=False), time.time()),
+        )
+        if evicted:
+            self._conn.executemany("DELETE FROM ocr_cache WHERE sha256 = ?", [(s,) for s in evicted])
+        self._conn.commit()
+
+    def _near(self, key: ImageKey) -> Optional[str]:
+        """sha256 của mục gần nhất qua đủ 3 điều kiện (dHash, cùng kích thước, dHash mịn), hoặc None."""
+        if self.max_hamming < 0 or key.dhash is None or key.fine is None:
+            return None
+        best = None
+        for s, (k, _) in self._entries.items():
+            if k.dhash is None or k.fine is None or k.size != key.size:
+                continue
+            d = hamming(k.dhash, key.dhash)
+            if d > self.max_hamming or hamming(k.fine, key.fine) > self.max_fine_hamming:
+                continue
+            if best is None or d < best[0]:
+                best = (d, s)
+        return best[1] if best is not None else None
+
+    # ---------- API ----------
+
+    def get(self, key: ImageKey) -> Optional[Dict[str, Any]]:
+        """Trả về bản sao kết quả kèm "cache": "exact"/"near", hoặc None nếu miss."""
+        with self._lock:
+            hit, kind = self._entries.get(key.sha256), "exact"
+            sha = key.sha256
+            if hit is None:
+                near = self._near(key)
+                if near is not None:
+                    sha, kind = near, "near"
+                    hit = self._entries[sha]
+            if hit is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(sha)
+            if kind == "exact":
+                self.exact_hits += 1
+            else:
+                self.near_hits += 1
+            self._db_touch(sha)
+            return dict(hit[1], cache=kind)
+
+    def put(self, key: ImageKey, result: Dict[str, Any]) -> None:
+        # không cache kết quả lỗi (backend OCR chưa sẵn sàng...) hay không đọc được chữ nào:
+        # lần sau gửi lại cùng ảnh vẫn được OCR lại thay vì nhận mãi text rỗng
+        if result.get("error") or not (result.get("text") or "").strip():
+            return
+        result = {k: v for k, v in result.items() if k != "cache"}
+        with self._lock:
+            self._entries[key.sha256] = (key, result)
+            self._entries.move_to_end(key.sha256)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            self.evictions += len(evicted)
+            self._db_put(key, result, evicted)
+
+    def get_or_compute(self, data: ImageBytes, compute: Callable[[ImageBytes], Dict[str, Any]]) -> Dict[str, Any]:
+        """Bản đồng bộ cho CLI / analyze_ecode: tra cache, miss thì compute(data) rồi lưu."""
+        key = image_key(data)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        result = compute(data)
+        self.put(key, result)
+        return dict(result, cache="miss")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_hamming": self.max_hamming,
+                "max_fine_hamming": self.max_fine_hamming,
+                "persistent": self._conn is not None,
+                "config": self.config,
+                "lookups": lookups,
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.exact_hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+                "exact_hit_rate": round(self.exact_hits / lookups, 4) if lookups else 0.0,
+                "near_hit_rate": round(self.near_hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_CACHE: Optional[OCRCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_ocr_cache() -> Optional[OCRCache]:
+    """Cache dùng chung trong process; None nếu OCR_CACHE=0."""
+    global _CACHE
+    if not OCR_CACHE_ENABLED:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = OCRCache()
+        return _CACHE
+
+
+def close_ocr_cache() -> None:
+    global _CACHE
+    with _CACHE_LOCK:
+        cache, _CACHE = _CACHE, None
+    if cache is not None:
+        cache.close()
+
+
+def get_ocr_cache_stats() -> Dict[str, Any]:
+    # đọc thẳng _CACHE: gọi get_ocr_cache() ở đây sẽ tạo lại cache (mở lại SQLite) sau close_ocr_cache()
+    cache = _CACHE
+    if cache is None:
+        return {"enabled": OCR_CACHE_ENABLED, "initialized": False}
+    return dict(cache.stats(), enabled=True, initialized=True)
@@ -1,10 +1,19 @@
 from __future__ import annotations
+import hashlib
+import json
 import logging
-from typing import Optional, List
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, List, Tuple, Union
 import unicodedata 
 import re 
 
 import cv2
+import numpy as np
 
 try:
     import easyocr
@@ -22,6 +31,269 @@ class OCRBackendUnavailable(Exception):
     pass
 
 
+# --- OCR 2 tầng: lượt nhanh (ảnh thu nhỏ, mag_ratio 1.0) rồi mới tới lượt đầy đủ ---
+
+OCR_TIERED = os.getenv("OCR_TIERED", "1") != "0"
+OCR_FAST_MAX_SIDE = int(os.getenv("OCR_FAST_MAX_SIDE", "1280"))
+# độ tin cậy trung bình (EasyOCR, 0..1) tối thiểu để chấp nhận kết quả lượt nhanh
+OCR_FAST_MIN_CONF = float(os.getenv("OCR_FAST_MIN_CONF", "0.5"))
+
+
+def _downscale(img, max_side: int):
+    """Thu nhỏ (INTER_AREA) sao cho cạnh dài <= max_side; ảnh đã nhỏ thì giữ nguyên."""
+    h, w = img.shape[:2]
+    scale = max_side / float(max(h, w))
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def _has_codes(text: str) -> bool:
+    # import muộn: worker OCR chỉ nạp index NLP khi thật sự chạy chế độ 2 tầng
+    from src.nlp_module import extract_ecodes_from_text
+    return bool(extract_ecodes_from_text(text))
+
+
+# --- Giới hạn độ phân giải + chia ô (tile) cho ảnh lớn ---
+# Ô là dải ngang rộng trọn ảnh: dòng chữ chạy ngang nên không có đường nối dọc cắt đôi
+# dòng/từ (vd. "E1" | "100"); chỉ còn đường nối ngang, bỏ trùng bằng vùng chồng.
+
+# cạnh dài tối đa của ảnh làm việc (ảnh điện thoại 12-50 MP được thu nhỏ trước khi OCR)
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2560"))
+OCR_TILING = os.getenv("OCR_TILING", "1") != "0"
+# chiều cao mỗi dải
+OCR_TILE_SIZE = int(os.getenv("OCR_TILE_SIZE", "1024"))
+# phần chồng giữa 2 dải kề nhau, phải lớn hơn chiều cao 1 dòng chữ để dòng ở mép dải không bị mất
+OCR_TILE_OVERLAP = int(os.getenv("OCR_TILE_OVERLAP", "128"))
+# chỉ chia ô khi cạnh dài ảnh làm việc >= ngưỡng này (và ảnh cao hơn 1 dải)
+OCR_TILE_MIN_SIDE = int(os.getenv("OCR_TILE_MIN_SIDE", "2048"))
+
+Tile = Tuple[int, int, Any]                 # (x, y, ảnh xám của ô); dải ngang nên x luôn = 0
+TileLine = Tuple[Tuple[float, float, float, float], str, float]   # ((x0, x1, y0, y1), text, conf)
+
+
+def needs_tiling(shape: Tuple[int, ...]) -> bool:
+    # ảnh thấp hơn 1 dải (ảnh ngang) thì chia cũng chỉ ra đúng 1 ô = cả ảnh
+    return OCR_TILING and max(shape[:2]) >= OCR_TILE_MIN_SIDE and shape[0] > OCR_TILE_SIZE
+
+
+def _tile_starts(length: int, tile: int, overlap: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    step = max(1, tile - overlap)
+    return list(range(0, length - tile, step)) + [length - tile]
+
+
+def split_tiles(gray, tile: int = None, overlap: int = None) -> List[Tile]:
+    """Chia ảnh xám thành các dải ngang rộng trọn ảnh, cao `tile`, chồng nhau `overlap` (view numpy, không copy)."""
+    tile = tile or OCR_TILE_SIZE
+    overlap = OCR_TILE_OVERLAP if overlap is None else overlap
+    return [(0, y, gray[y:y + tile]) for y in _tile_starts(gray.shape[0], tile, overlap)]
+
+
+def merge_tile_results(tiles: List[Tile], results: List[List[TileLine]]) -> List[TileLine]:
+    """
+    Dời box của từng ô về toạ độ ảnh gốc rồi bỏ bản trùng ở vùng chồng:
+    2 box của 2 ô khác nhau chồng > 50% diện tích box nhỏ hơn -> giữ box lớn hơn
+    (box bị mép ô cắt thì nhỏ hơn); 2 bản cùng cỡ (dòng nằm trọn trong vùng chồng,
+    diện tích lệch < 10%) thì giữ bản tin cậy cao hơn.
+    Trả về các dòng theo thứ tự đọc.
+    """
+    lines = []
+    for t, ((ox, oy, _), res) in enumerate(zip(tiles, results)):
+        for (x0, x1, y0, y1), text, conf in res:
+            lines.append((t, (x0 + ox, x1 + ox, y0 + oy, y1 + oy), text, conf))
+
+    def area(r):
+        return max(0.0, r[1] - r[0]) * max(0.0, r[3] - r[2])
+
+    lines.sort(key=lambda ln: (area(ln[1]), ln[3]), reverse=True)
+    kept: List[Tuple[int, Tuple[float, float, float, float], str, float]] = []
+    for ln in lines:
+        r = ln[1]
+        dup = False
+        for j, k in enumerate(kept):
+            if k[0] == ln[0]:
+                continue
+            kr = k[1]
+            inter = (max(0.0, min(r[1], kr[1]) - max(r[0], kr[0]))
+                     * max(0.0, min(r[3], kr[3]) - max(r[2], kr[2])))
+            if inter > 0.5 * max(1.0, min(area(r), area(kr))):
+                dup = True
+                if ln[3] > k[3] and area(r) >= 0.9 * area(kr):
+                    kept[j] = ln
+                break
+        if not dup:
+            kept.append(ln)
+
+    rects = [k[1] for k in kept]
+    return [(kept[i][1], kept[i][2], kept[i][3]) for i in _reading_order(rects, range(len(kept)))]
+
+
+def text_from_lines(lines: List[TileLine]) -> Tuple[str, float, str]:
+    """
+    Ghép các dòng (đã theo thứ tự đọc) -> (text, độ tin cậy TB, vùng).
+    OCR_INGREDIENT_REGION bật: chỉ giữ khối "Thành phần" nếu tìm thấy neo (text đầy đủ làm tiêu đề).
+    """
+    region = "full"
+    if OCR_INGREDIENT_REGION and lines:
+        block = find_ingredient_block([ln[0] for ln in lines], [ln[1] for ln in lines])
+        if block is not None:
+            lines = [lines[i] for i in block]
+            region = "ingredients"
+    if not lines:
+        return "", 0.0, region
+    conf = sum(ln[2] for ln in lines) / len(lines)
+    return OCRPipeline._postprocess_text([ln[1] for ln in lines]), conf, region
+
+
+# --- Vùng "Thành phần" (chỉ nhận dạng khối chữ danh sách thành phần) ---
+
+OCR_INGREDIENT_REGION = os.getenv("OCR_INGREDIENT_REGION", "1") != "0"
+# chiều rộng phần đầu box (tính theo chiều cao box) dùng để dò tiêu đề
+OCR_PROBE_WIDTH = float(os.getenv("OCR_PROBE_WIDTH", "12"))
+# khoảng trống dọc tối đa giữa 2 dòng trong cùng khối (tính theo chiều cao dòng)
+OCR_REGION_GAP = float(os.getenv("OCR_REGION_GAP", "1.5"))
+
+# so khớp trên text đã bỏ dấu + viết thường
+_ANCHOR_RE = re.compile(r"thanh\s*phan|ingredient|nguyen\s*lieu")
+_STOP_RE = re.compile(
+    r"gia\s*tri\s*dinh\s*duong|thong\s*tin\s*dinh\s*duong|nutrition|huong\s*dan|"
+    r"bao\s*quan|ngay\s*san\s*xuat|han\s*su\s*dung|\bnsx\b|\bhsd\b|khoi\s*luong|"
+    r"net\s*w|san\s*xuat\s*tai|xuat\s*xu|storage|directions"
+)
+
+
+def _fold(text: str) -> str:
+    """Bỏ dấu tiếng Việt + viết thường để so tiêu đề (OCR hay sai dấu)."""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn").lower()
+
+
+def _bbox(box) -> Tuple[float, float, float, float]:
+    """Box ngang [x_min, x_max, y_min, y_max] hoặc box xoay [[x, y] x4] -> (x0, x1, y0, y1)."""
+    if len(box) == 4 and not hasattr(box[0], "__len__"):
+        return float(box[0]), float(box[1]), float(box[2]), float(box[3])
+    xs = [float(p[0]) for p in box]
+    ys = [float(p[1]) for p in box]
+    return min(xs), max(xs), min(ys), max(ys)
+
+
+def _line_height(rects: List[Tuple[float, float, float, float]]) -> float:
+    heights = sorted(r[3] - r[2] for r in rects)
+    return max(1.0, heights[len(heights) // 2]) if heights else 1.0
+
+
+def _reading_order(rects: List[Tuple[float, float, float, float]], idxs: Iterable[int]) -> List[int]:
+    """Sắp chỉ số box theo thứ tự đọc: theo dòng (tâm dọc / chiều cao dòng) rồi trái -> phải."""
+    line_h = _line_height(rects)
+    return sorted(idxs, key=lambda i: (round((rects[i][2] + rects[i][3]) / 2 / line_h), rects[i][0]))
+
+
+def find_ingredient_block(boxes: List[Any], heads: List[str]) -> Optional[List[int]]:
+    """
+    Chọn các box thuộc khối "Thành phần" dựa trên hình học + text đầu box (heads, cùng thứ tự).
+    - box đầu tiên (từ trên xuống) có tiêu đề khớp _ANCHOR_RE là neo
+    - lấy các box cùng dòng bên phải neo, rồi đi xuống theo cột của neo
+      tới khi gặp khoảng trống > OCR_REGION_GAP dòng hoặc 1 tiêu đề khác (_STOP_RE)
+    Trả về chỉ số box theo thứ tự đọc, hoặc None nếu không có neo.
+    """
+    if not boxes:
+        return None
+    rects = [_bbox(b) for b in boxes]
+    folded = [_fold(h or "") for h in heads]
+    anchors = [i for i, h in enumerate(folded) if _ANCHOR_RE.search(h)]
+    if not anchors:
+        return None
+
+    line_h = _line_height(rects)
+    a = min(anchors, key=lambda i: (rects[i][2], rects[i][0]))
+    ax0, ax1, ay0, ay1 = rects[a]
+
+    # dòng chứa neo: tâm dọc nằm trong box neo, bắt đầu từ neo sang phải
+    block = [i for i, (x0, x1, y0, y1) in enumerate(rects)
+             if ay0 <= (y0 + y1) / 2 <= ay1 and x1 >= ax0 - line_h]
+    col_left = ax0 - 2 * line_h
+    col_right = max(rects[i][1] for i in block)
+    bottom = max(rects[i][3] for i in block)
+
+    below = sorted((i for i in range(len(rects)) if i not in block and rects[i][2] >= ay0),
+                   key=lambda i: rects[i][2])
+    for i in below:
+        x0, x1, y0, y1 = rects[i]
+        if x1 < col_left or x0 > col_right:
+            continue                        # cột khác
+        if y0 - bottom > OCR_REGION_GAP * line_h or _STOP_RE.search(folded[i]):
+            break
+        block.append(i)
+        bottom = max(bottom, y1)
+        col_right = max(col_right, x1)
+
+    return _reading_order(rects, block)
+
+
+# --- Đọc ảnh (đường dẫn / bytes / ndarray) ---
+
+ImageSource = Union[str, os.PathLike, bytes, bytearray, memoryview, np.ndarray]
+
+# chữ ký đầu file -> định dạng (nhận diện theo nội dung, không theo đuôi file)
+_IMAGE_MAGIC = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+
+
+def sniff_image_type(data: Union[bytes, bytearray, memoryview]) -> Optional[str]:
+    """Trả về định dạng ảnh theo magic bytes ("jpeg", "png", "webp", ...) hoặc None."""
+    head = bytes(data[:12])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for magic, kind in _IMAGE_MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def sniff_image_file(path: Union[str, os.PathLike]) -> Optional[str]:
+    """Như sniff_image_type nhưng đọc 12 byte đầu của file; None nếu không đọc được."""
+    try:
+        with open(path, "rb") as f:
+            return sniff_image_type(f.read(12))
+    except (OSError, ValueError):
+        return None
+
+
+def _source_label(source: ImageSource) -> str:
+    if isinstance(source, np.ndarray):
+        return f"<ndarray {source.shape}>"
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes>"
+    return os.fspath(source)
+
+
+def _load_image(source: ImageSource):
+    """
+    Trả về ảnh numpy từ ndarray (dùng luôn), buffer bytes (cv2.imdecode qua memoryview,
+    không ghi file tạm) hoặc đường dẫn (cv2.imread).
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        if sniff_image_type(source) is None:
+            raise ValueError(f"Unsupported image format: {_source_label(source)}")
+        img = cv2.imdecode(np.frombuffer(memoryview(source), dtype=np.uint8), cv2.IMREAD_COLOR)
+    else:
+        img = cv2.imread(os.fspath(source))
+    if img is None:
+        raise ValueError(f"Cannot read image: {_source_label(source)}")
+    return img
+
+
 class OCRPipeline:
     """
     Pipeline OCR sử dụng EasyOCR với các bước Tiền xử lý Ảnh (đơn giản)
@@ -46,14 +318,16 @@ class OCRPipeline:
 
     # --- Hậu xử lý Văn bản ---
     
-    def _normalize_vietnamese_unicode(self, text: str) -> str:
+    @staticmethod
+    def _normalize_vietnamese_unicode(text: str) -> str:
         """
         Chuẩn hóa Unicode tiếng Việt sang dạng Dựng sẵn (NFC).
         Giúp đảm bảo tính đồng nhất của văn bản cho mô-đun NLP.
         """
         return unicodedata.normalize("NFC", text)
 
-    def _postprocess_text(self, text_list: List[str]) -> str:
+    @staticmethod
+    def _postprocess_text(text_list: List[str]) -> str:
         """
         Thực hiện ghép các dòng, chuẩn hóa Unicode và làm sạch văn bản cơ bản.
         """
@@ -61,7 +335,7 @@ class OCRPipeline:
         raw_text = "\n".join(text_list) 
         
         # 2. Chuẩn hóa Unicode
-        normalized_text = self._normalize_vietnamese_unicode(raw_text)
+        normalized_text = OCRPipeline._normalize_vietnamese_unicode(raw_text)
         
         # 3. Làm sạch: Loại bỏ khoảng trắng thừa (nhiều dấu cách liền kề)
         cleaned_text = re.sub(r'\s+', ' ', normalized_text.strip())
@@ -71,11 +345,14 @@ class OCRPipeline:
 
     # --- Tiền xử lý Ảnh và OCR ---
     
-    def _preprocess_image(self, img):
+    @staticmethod
+    def _preprocess_image(img):
         """
         Tiền xử lý ảnh đơn giản: Chỉ chuyển sang ảnh xám (Grayscale).
         """
         # Nếu ảnh đã rõ, việc chuyển sang Grayscale là đủ.
+        if img.ndim == 2:
+            return img
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         return gray
 
@@ -104,6 +381,139 @@ class OCRPipeline:
             return ""
         return ""
 
+    def _working_image(self, image: ImageSource):
+        """Đọc ảnh -> xám -> thu nhỏ về OCR_MAX_SIDE (cạnh dài)."""
+        return prepare_image(image)
+
+    def read_tile(self, tile) -> List[TileLine]:
+        """OCR 1 ô (như lượt đầy đủ, mag_ratio 1.5); box trả về dạng (x0, x1, y0, y1) theo toạ độ ô."""
+        try:
+            result = self.reader.readtext(tile, detail=1, mag_ratio=1.5)
+        except Exception as e:
+            logger.error(f"EasyOCR readtext failed: {e}")
+            return []
+        return [(_bbox(box), text, float(conf)) for box, text, conf in result]
+
+    def _read_tiled(self, gray) -> Tuple[str, float, str]:
+        """Lượt đầy đủ cho ảnh lớn, chạy tuần tự từng ô trong process này (API thì chia ô qua pool)."""
+        tiles = split_tiles(gray)
+        return text_from_lines(merge_tile_results(tiles, [self.read_tile(t) for _, _, t in tiles]))
+
+    def _read_scored(self, gray, mag_ratio: float, canvas_size: Optional[int] = None) -> Tuple[str, float, str]:
+        """
+        -> (văn bản đã hậu xử lý, độ tin cậy trung bình các box, vùng đã đọc "ingredients"/"full").
+        OCR_INGREDIENT_REGION bật: detect 1 lần, chỉ recognize khối "Thành phần" (nếu tìm thấy).
+        """
+        kwargs = {"mag_ratio": mag_ratio}
+        if canvas_size:
+            kwargs["canvas_size"] = canvas_size
+        try:
+            if OCR_INGREDIENT_REGION:
+                result, region = self._read_ingredient_region(gray, **kwargs)
+            else:
+                result, region = self.reader.readtext(gray, detail=1, **kwargs), "full"
+        except Exception as e:
+            logger.error(f"EasyOCR readtext failed: {e}")
+            return "", 0.0, "full"
+        if not result:
+            return "", 0.0, region
+        conf = sum(float(r[2]) for r in result) / len(result)
+        return self._postprocess_text([r[1] for r in result]), conf, region
+
+    def _read_ingredient_region(self, gray, **detect_kwargs) -> Tuple[List[Any], str]:
+        """
+        1) detector -> box chữ (chưa nhận dạng)
+        2) nhận dạng phần đầu mỗi box ngang (rộng OCR_PROBE_WIDTH x chiều cao) để tìm tiêu đề
+        3) nhận dạng đầy đủ chỉ các box trong khối "Thành phần"; không có neo -> mọi box (= readtext)
+        """
+        horizontal, free = self.reader.detect(gray, **detect_kwargs)
+        horizontal, free = list(horizontal[0]), list(free[0])
+        if not horizontal and not free:
+            return [], "full"
+
+        probes = [[x0, min(x1, x0 + int(OCR_PROBE_WIDTH * (y1 - y0))), y0, y1]
+                  for x0, x1, y0, y1 in horizontal]
+        # box xoay không dò tiêu đề; kết quả recognize có thể đã bị sắp lại -> ghép theo toạ độ
+        heads = [""] * (len(horizontal) + len(free))
+        probe_rects = [_bbox(b) for b in probes]
+        for r in self.reader.recognize(gray, horizontal_list=probes, free_list=[], detail=1):
+            x0, _, y0, _ = _bbox(r[0])
+            i = min(range(len(probe_rects)),
+                    key=lambda k: abs(probe_rects[k][0] - x0) + abs(probe_rects[k][2] - y0))
+            heads[i] = r[1]
+
+        block = find_ingredient_block(horizontal + free, heads)
+        n = len(horizontal)
+        if block is None:
+            h_sel, f_sel, region = horizontal, free, "full"
+        else:
+            h_sel = [horizontal[i] for i in block if i < n]
+            f_sel = [free[i - n] for i in block if i >= n]
+            region = "ingredients"
+
+        result = self.reader.recognize(gray, horizontal_list=h_sel, free_list=f_sel, detail=1)
+        rects = [_bbox(r[0]) for r in result]
+        return [result[i] for i in _reading_order(rects, range(len(result)))], region
+
+    def ocr_tiered(
+        self,
+        image: ImageSource,
+        accept: Optional[Callable[[str], bool]] = None,
+        tile_here: bool = True,
+        fast: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        OCR 2 tầng:
+          - "fast": ảnh thu nhỏ về OCR_FAST_MAX_SIDE, mag_ratio=1.0
+          - "full": ảnh gốc, mag_ratio=1.5 (như ocr_region) — chỉ chạy khi lượt nhanh
+            không có chữ, độ tin cậy < OCR_FAST_MIN_CONF hoặc accept(text) trả về False
+            (mặc định: không trích được mã phụ gia nào).
+        Mỗi lượt chỉ nhận dạng khối "Thành phần" khi tìm thấy (OCR_INGREDIENT_REGION).
+        Ảnh lớn (needs_tiling) thì lượt đầy đủ chạy theo ô ("tiled"); tile_here=False -> không tự chạy
+        mà trả về tier None + "needs_tiling" để API chia ô qua pool OCR.
+        fast=False (OCR_TIERED=0): bỏ lượt nhanh, chạy thẳng lượt đầy đủ (ảnh lớn vẫn chia ô).
+        Trả về {"text", "tier", "region", "confidence", "fast_ms", "full_ms"}.
+        """
+        accept = accept or _has_codes
+        gray = self._working_image(image)
+
+        text, conf, region, fast_ms = "", 0.0, "full", 0.0
+        if fast:
+            t0 = time.perf_counter()
+            text, conf, region = self._read_scored(_downscale(gray, OCR_FAST_MAX_SIDE), 1.0, OCR_FAST_MAX_SIDE)
+            fast_ms = (time.perf_counter() - t0) * 1000.0
+            if text and conf >= OCR_FAST_MIN_CONF and accept(text):
+                return {"text": text, "tier": "fast", "region": region, "confidence": round(conf, 4),
+                        "fast_ms": round(fast_ms, 2), "full_ms": 0.0}
+
+        if needs_tiling(gray.shape) and not tile_here:
+            return {"text": text, "tier": None, "region": region, "confidence": round(conf, 4),
+                    "fast_ms": round(fast_ms, 2), "full_ms": 0.0, "needs_tiling": True}
+
+        t0 = time.perf_counter()
+        if needs_tiling(gray.shape):
+            (text, conf, region), tier = self._read_tiled(gray), "tiled"
+        else:
+            (text, conf, region), tier = self._read_scored(gray, 1.5), "full"
+        return {"text": text, "tier": tier, "region": region, "confidence": round(conf, 4),
+                "fast_ms": round(fast_ms, 2), "full_ms": round((time.perf_counter() - t0) * 1000.0, 2)}
+
+    def ocr_full_pass(
+        self,
+        image: ImageSource,
+        mag_ratio: float = 1.5,
+        canvas_size: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Chỉ 1 lượt đầy đủ (bỏ lượt nhanh, không chia ô) với mag_ratio / canvas_size tuỳ chọn,
+        dùng để so sánh cấu hình (benchmark_ocr.py --mode full). Cùng dạng kết quả với ocr_tiered.
+        """
+        gray = self._working_image(image)
+        t0 = time.perf_counter()
+        text, conf, region = self._read_scored(gray, mag_ratio, canvas_size)
+        return {"text": text, "tier": "full", "region": region, "confidence": round(conf, 4),
+                "fast_ms": 0.0, "full_ms": round((time.perf_counter() - t0) * 1000.0, 2)}
+
     def ocr_full_image(self, image_path: str) -> str:
         """Đọc và thực hiện OCR trên toàn bộ ảnh từ đường dẫn."""
         # Đọc ảnh. 
@@ -114,6 +524,49 @@ class OCRPipeline:
 
         return self.ocr_region(img)
 
+    def ocr_image(self, image: ImageSource) -> str:
+        """OCR toàn ảnh từ bytes / memoryview / ndarray (BGR hoặc xám) / đường dẫn."""
+        return self.ocr_region(self._working_image(image))
+
+    def ocr_batch(
+        self,
+        gray_images: List[Any],
+        batch_size: int = 8,
+        bucket: Optional[int] = None,
+    ) -> List[Tuple[str, Optional[str]]]:
+        """
+        OCR nhiều ảnh xám (đã qua _preprocess_image) trong 1 lần gọi -> [(text, lỗi hoặc None)].
+        readtext_batched chỉ nhận các ảnh cùng kích thước, nên mỗi ảnh được đệm thêm nền ở cạnh
+        dưới/phải lên bội số của `bucket` px (OCR_BATCH_BUCKET, 0 = không đệm): ảnh điện thoại
+        lệch nhau vài chục px rơi vào cùng 1 nhóm; nhóm chỉ có 1 ảnh thì đi qua readtext.
+        Lỗi của 1 nhóm được ghi vào mọi ảnh trong nhóm đó.
+        batch_size là số vùng chữ mỗi lô của recognizer.
+        """
+        bucket = OCR_BATCH_BUCKET if bucket is None else bucket
+        out: List[Tuple[str, Optional[str]]] = [("", None)] * len(gray_images)
+        groups: Dict[tuple, List[int]] = {}
+        padded = [_pad_to_bucket(img, bucket) for img in gray_images]
+        for i, img in enumerate(padded):
+            groups.setdefault(img.shape[:2], []).append(i)
+
+        for idxs in groups.values():
+            try:
+                if len(idxs) == 1:
+                    results = [self.reader.readtext(padded[idxs[0]], detail=0,
+                                                    mag_ratio=1.5, batch_size=batch_size)]
+                else:
+                    results = self.reader.readtext_batched([padded[i] for i in idxs],
+                                                           detail=0, mag_ratio=1.5,
+                                                           batch_size=batch_size)
+            except Exception as e:
+                logger.error(f"EasyOCR batch readtext failed: {e}")
+                for i in idxs:
+                    out[i] = ("", str(e))
+                continue
+            for i, res in zip(idxs, results):
+                out[i] = (self._postprocess_text(res) if res else "", None)
+        return out
+
 
 # --- Khởi tạo Pipeline Singleton ---
 
@@ -134,11 +587,220 @@ def _get_pipeline() -> OCRPipeline:
 
 # --- Hàm Chính (Public API) ---
 
-def extract_text_from_image(image_path: str) -> str:
-    """Hàm chính được UI gọi – OCR full ảnh và trả về văn bản đã xử lý."""
+def extract_text_from_image(image: ImageSource) -> str:
+    """
+    Hàm chính được UI gọi – OCR full ảnh và trả về văn bản đã xử lý.
+    Nhận đường dẫn, bytes (ảnh upload, giải mã trong RAM) hoặc ndarray.
+    """
+    try:
+        pipeline = _get_pipeline()
+        return pipeline.ocr_image(image)
+    except Exception as e:
+        logger.error(f"Fatal error during text extraction: {e}")
+        return "" # Trả về chuỗi rỗng nếu có lỗi nghiêm trọng
+
+
+def extract_text_tiered(image: ImageSource, tile_here: bool = True) -> Dict[str, Any]:
+    """
+    Như extract_text_from_image nhưng trả thêm tầng OCR đã trả lời ("fast" / "full" / "tiled").
+    OCR_TIERED=0 -> bỏ lượt nhanh, luôn chạy lượt đầy đủ ("full", ảnh lớn vẫn "tiled").
+    tile_here=False: xem OCRPipeline.ocr_tiered (API tự chia ô qua pool).
+    """
     try:
         pipeline = _get_pipeline()
-        return pipeline.ocr_full_image(image_path)
+        return pipeline.ocr_tiered(image, tile_here=tile_here, fast=OCR_TIERED)
     except Exception as e:
         logger.error(f"Fatal error during text extraction: {e}")
-        return "" # Trả về chuỗi rỗng nếu có lỗi nghiêm trọng
\ No newline at end of file
+        return {"text": "", "tier": None, "region": None, "confidence": None, "error": str(e)}
+
+
+def prepare_image(image: ImageSource):
+    """Ảnh làm việc (xám, đã giới hạn OCR_MAX_SIDE) — không cần nạp EasyOCR (dùng ở process API)."""
+    return _downscale(OCRPipeline._preprocess_image(_load_image(image)), OCR_MAX_SIDE)
+
+
+def ocr_tile(tile) -> List[TileLine]:
+    """Job cho pool OCR: nhận dạng 1 ô; lỗi -> [] (ô đó coi như không có chữ)."""
+    try:
+        return _get_pipeline().read_tile(tile)
+    except Exception as e:
+        logger.error(f"Fatal error during tile extraction: {e}")
+        return []
+
+
+def ocr_config_fingerprint() -> str:
+    """
+    Dấu vân tay các thiết lập quyết định text OCR trả về cho 1 ảnh (tầng, vùng, độ phân giải, chia ô).
+    Cache OCR lưu kèm giá trị này; đổi cấu hình thì kết quả cũ trong SQLite bị bỏ.
+    """
+    config = {
+        "tiered": OCR_TIERED,
+        "fast_max_side": OCR_FAST_MAX_SIDE,
+        "fast_min_conf": OCR_FAST_MIN_CONF,
+        "max_side": OCR_MAX_SIDE,
+        "tiling": OCR_TILING,
+        "tile_size": OCR_TILE_SIZE,
+        "tile_overlap": OCR_TILE_OVERLAP,
+        "tile_min_side": OCR_TILE_MIN_SIDE,
+        "ingredient_region": OCR_INGREDIENT_REGION,
+        "probe_width": OCR_PROBE_WIDTH,
+        "region_gap": OCR_REGION_GAP,
+    }
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# --- OCR theo lô (nhiều ảnh mỗi lần gọi) ---
+
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+# đệm ảnh lên bội số của bucket px để ảnh khác kích thước chút ít vẫn chung 1 lô detector
+OCR_BATCH_BUCKET = int(os.getenv("OCR_BATCH_BUCKET", "256"))
+OCR_DECODE_WORKERS = int(os.getenv("OCR_DECODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _pad_to_bucket(gray, bucket: int):
+    """Đệm cạnh dưới/phải bằng màu nền (trung vị mép ảnh) -> toạ độ chữ không đổi."""
+    if bucket <= 0:
+        return gray
+    h, w = gray.shape[:2]
+    ph, pw = -h % bucket, -w % bucket
+    if not ph and not pw:
+        return gray
+    bg = int(np.median(np.concatenate([gray[-1], gray[:, -1]])))
+    return cv2.copyMakeBorder(gray, 0, ph, 0, pw, cv2.BORDER_CONSTANT, value=bg)
+
+
+def _decode_and_preprocess(pipeline: OCRPipeline, source: ImageSource):
+    """Chạy trong thread pool (cv2 nhả GIL): đọc + chuyển xám, trả về (ảnh xám, lỗi, ms)."""
+    t0 = time.perf_counter()
+    try:
+        gray, error = pipeline._working_image(source), None
+    except Exception as e:
+        gray, error = None, str(e)
+    return gray, error, (time.perf_counter() - t0) * 1000.0
+
+
+def extract_text_from_images(
+    sources: Iterable[ImageSource],
+    batch_size: Optional[int] = None,
+    decode_workers: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    OCR nhiều ảnh (đường dẫn, bytes hoặc ndarray), yield kết quả theo thứ tự đầu vào ngay khi mỗi lô xong:
+        {"index", "source", "text", "error", "decode_ms", "ocr_ms", "total_ms"}
+    - Đọc + tiền xử lý chạy song song trên thread pool, đọc trước tối đa 2 lô
+      để decode lô sau chồng lên OCR lô trước.
+    - OCR theo lô qua OCRPipeline.ocr_batch; ocr_ms là thời gian lô chia đều cho số ảnh trong lô.
+    Lỗi từng ảnh (không đọc được, EasyOCR lỗi cả nhóm...) nằm ở "error" và text = "", không dừng cả lô.
+    """
+    batch_size = max(1, batch_size or OCR_BATCH_SIZE)
+    decode_workers = max(1, decode_workers or OCR_DECODE_WORKERS)
+    it = iter(sources)
+
+    try:
+        pipeline = _get_pipeline()
+    except Exception as e:
+        logger.error(f"Fatal error during batch text extraction: {e}")
+        for i, src in enumerate(it):
+            yield {"index": i, "source": _source_label(src), "text": "", "error": str(e),
+                   "decode_ms": 0.0, "ocr_ms": 0.0, "total_ms": 0.0}
+        return
+
+    with ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="ocr-decode") as pool:
+        pending: deque = deque()
+        index = 0
+
+        def fill() -> None:
+            nonlocal index
+            for src in islice(it, 2 * batch_size - len(pending)):
+                pending.append((index, src, pool.submit(_decode_and_preprocess, pipeline, src)))
+                index += 1
+
+        fill()
+        while pending:
+            batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+            fill()
+            decoded = [(i, src) + fut.result() for i, src, fut in batch]
+
+            ok = [d for d in decoded if d[2] is not None]
+            t0 = time.perf_counter()
+            outs = pipeline.ocr_batch([d[2] for d in ok], batch_size=batch_size) if ok else []
+            ocr_ms = (time.perf_counter() - t0) * 1000.0 / max(1, len(ok))
+            out_of = {d[0]: o for d, o in zip(ok, outs)}
+
+            for i, src, gray, error, decode_ms in decoded:
+                this_ocr = ocr_ms if gray is not None else 0.0
+                text, ocr_error = out_of.get(i, ("", None))
+                yield {
+                    "index": i,
+                    "source": _source_label(src),
+                    "text": text,
+                    "error": error or ocr_error,
+                    "decode_ms": round(decode_ms, 2),
+                    "ocr_ms": round(this_ocr, 2),
+                    "total_ms": round(decode_ms + this_ocr, 2),
+                }
+
+
+# --- Pool OCR nhiều process (mỗi process 1 EasyOCR Reader) ---
+
+# Mỗi Reader ~ vài trăm MB RAM -> mặc định dùng nửa số core
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+# Số thread torch (intra-op) cho mỗi worker: 0 = chia đều số core cho các worker, <0 = để torch tự chọn
+OCR_TORCH_THREADS = int(os.getenv("OCR_TORCH_THREADS", "0"))
+OCR_WARMUP_TIMEOUT = float(os.getenv("OCR_WARMUP_TIMEOUT", "300"))
+
+
+def _init_ocr_worker(torch_threads: int, use_gpu: bool) -> None:
+    """Chạy 1 lần trong mỗi process worker: ghim thread torch rồi nạp Reader."""
+    global _PIPELINE
+    if torch_threads > 0:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except Exception as e:
+            logger.warning(f"Không đặt được số thread torch: {e}")
+    try:
+        _PIPELINE = OCRPipeline(use_gpu=use_gpu)
+    except OCRBackendUnavailable as e:
+        # worker vẫn sống; extract_text_from_image sẽ thử lại và trả về "" như bản 1 process
+        logger.error(f"OCR worker {os.getpid()}: {e}")
+
+
+def _worker_ready() -> tuple:
+    return os.getpid(), _PIPELINE is not None
+
+
+def create_ocr_worker_pool(
+    workers: Optional[int] = None,
+    torch_threads: Optional[int] = None,
+    use_gpu: bool = False,
+    warm: bool = True,
+) -> ProcessPoolExecutor:
+    """
+    Tạo ProcessPoolExecutor cho OCR: mỗi process nạp EasyOCR Reader đúng 1 lần (initializer),
+    job gửi qua hàng đợi của pool và được chia cho process đang rảnh.
+    warm=True: khởi động đủ `workers` process và chờ Reader nạp xong trước khi trả về.
+    Dùng context "spawn" để không fork process đã nạp torch/OpenMP.
+    """
+    workers = max(1, workers or OCR_WORKERS)
+    if torch_threads is None:
+        torch_threads = OCR_TORCH_THREADS
+    if torch_threads == 0:
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_ocr_worker,
+        initargs=(torch_threads, use_gpu),
+    )
+    if warm:
+        # gửi cùng lúc `workers` job rỗng -> pool sinh đủ process, mỗi process chạy initializer
+        futures = [pool.submit(_worker_ready) for _ in range(workers)]
+        done, _ = wait(futures, timeout=OCR_WARMUP_TIMEOUT)
+        ready = [f.result() for f in done if f.exception() is None]
+        logger.info(
+            f"OCR worker pool: {workers} process, torch_threads={torch_threads}, "
+            f"reader sẵn sàng ở {sum(1 for _, ok in ready if ok)}/{len(ready)} process"
+        )
+    return pool
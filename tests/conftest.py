@@ -0,0 +1,7 @@
+# cho phép `import src...` / `import benchmark_extractor` khi chạy pytest từ bất kỳ thư mục nào
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,36 @@
+"""fuzzy_find_synonyms tra cả cột name/name_vn (ecodes_master.csv không có cột synonyms)."""
+from src.nlp_module import fuzzy_find_synonyms, get_extractor_index, get_fuzzy_stats, reset_fuzzy_stats
+
+
+def test_exact_name_hit():
+    ix = get_extractor_index()
+    hits = fuzzy_find_synonyms("Thành phần: đường, phẩm màu tartrazine", ix.matcher)
+    assert ("tartrazine", "E102", 0) in hits
+
+
+def test_fuzzy_name_hit_under_ocr_noise():
+    ix = get_extractor_index()
+    hits = fuzzy_find_synonyms("phẩm màu tartrazln", ix.matcher, ix.fuzzy_matcher())
+    assert any(code == "E102" and dist > 0 for _, code, dist in hits)
+
+
+def test_synonym_only_is_empty_without_synonyms_column():
+    ix = get_extractor_index()
+    assert not ix.synonyms
+    assert fuzzy_find_synonyms("tartrazine", ix.matcher, kinds=("synonym",)) == []
+
+
+def test_fuzzy_cap_is_by_tokens_and_counted():
+    # giới hạn theo số token (không theo thời gian) -> cùng text luôn cùng kết quả
+    ix = get_extractor_index()
+    text = "muối đường " * 20 + "phẩm màu tartrazln"
+    reset_fuzzy_stats()
+    capped = fuzzy_find_synonyms(text, ix.matcher, ix.fuzzy_matcher(), max_tokens=10)
+    assert not any(code == "E102" for _, code, _ in capped)
+    assert get_fuzzy_stats()["truncated"] == 1
+
+    full = [fuzzy_find_synonyms(text, ix.matcher, ix.fuzzy_matcher(), max_tokens=None) for _ in range(3)]
+    assert full[0] == full[1] == full[2]
+    assert any(code == "E102" for _, code, _ in full[0])
+    stats = get_fuzzy_stats()
+    assert stats["texts"] == 4 and stats["truncated"] == 1
@@ -0,0 +1,52 @@
+"""
+Artifact index cũ / không khớp code hiện tại phải trả về None (caller build lại từ CSV),
+không được làm hỏng trích mã.
+"""
+import os
+import pickle
+
+import pytest
+
+from src.nlp_module import (
+    MASTER_CSV_PATH,
+    _ARTIFACT_HEADER,
+    _file_sha1,
+    build_index_artifact,
+    load_index_artifact,
+)
+
+CSV = os.path.abspath(MASTER_CSV_PATH)
+
+
+@pytest.fixture
+def artifact(tmp_path):
+    path = str(tmp_path / "ecodes.extractor.idx")
+    build_index_artifact(CSV, path)
+    with open(path, "rb") as f:
+        header = f.read(_ARTIFACT_HEADER.size)
+        state = pickle.loads(f.read())
+    return path, header, state
+
+
+def _rewrite(path, header, body):
+    with open(path, "wb") as f:
+        f.write(header + body)
+
+
+def test_valid_artifact_loads(artifact):
+    path, _, _ = artifact
+    assert load_index_artifact(CSV, _file_sha1(CSV), path) is not None
+
+
+def test_missing_state_key_falls_back(artifact):
+    path, header, state = artifact
+    del state["aliases"]
+    _rewrite(path, header, pickle.dumps(state))
+    assert load_index_artifact(CSV, _file_sha1(CSV), path) is None
+
+
+def test_moved_class_falls_back(artifact):
+    path, header, state = artifact
+    body = pickle.dumps(state).replace(b"src.nlp_module", b"src.nlp_gone__")
+    _rewrite(path, header, body)
+    assert load_index_artifact(CSV, _file_sha1(CSV), path) is None
@@ -0,0 +1,64 @@
+"""
+Quyết định chia ô không phụ thuộc OCR_TIERED: tắt lượt nhanh thì ảnh lớn vẫn đi theo ô.
+Reader giả (không cần EasyOCR) ghi lại cách nó được gọi.
+"""
+import numpy as np
+import pytest
+
+from src import ocr_module
+from src.ocr_module import OCRPipeline, extract_text_tiered
+
+
+class FakeReader:
+    def __init__(self):
+        self.calls = []
+
+    def readtext(self, img, detail=1, **kw):
+        self.calls.append(("readtext", img.shape[:2]))
+        box = [[0, 0], [200, 0], [200, 40], [0, 40]]
+        return [(box, "E330", 0.9)] if detail else ["E330"]
+
+    def detect(self, img, **kw):
+        self.calls.append(("detect", img.shape[:2]))
+        return [[[0, 200, 0, 40]]], [[]]
+
+    def recognize(self, img, horizontal_list, free_list, detail=1):
+        self.calls.append(("recognize", img.shape[:2]))
+        return [([[b[0], b[2]], [b[1], b[2]], [b[1], b[3]], [b[0], b[3]]], "E330", 0.9)
+                for b in horizontal_list]
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    pipeline = OCRPipeline.__new__(OCRPipeline)
+    pipeline.use_gpu = False
+    pipeline.reader = FakeReader()
+    monkeypatch.setattr(ocr_module, "_PIPELINE", pipeline)
+    monkeypatch.setattr(ocr_module, "OCR_TIERED", False)
+    monkeypatch.setattr(ocr_module, "OCR_TILING", True)
+    return pipeline.reader
+
+
+def big_image():
+    return np.full((ocr_module.OCR_TILE_MIN_SIDE + 400, 1200), 255, np.uint8)
+
+
+def test_untiered_large_image_is_tiled(reader):
+    res = extract_text_tiered(big_image())
+    assert res["tier"] == "tiled"
+    assert res["fast_ms"] == 0.0
+    strips = [shape for name, shape in reader.calls if name == "readtext"]
+    assert len(strips) > 1 and all(h <= ocr_module.OCR_TILE_SIZE for h, _ in strips)
+
+
+def test_untiered_large_image_defers_tiling_to_api(reader):
+    res = extract_text_tiered(big_image(), tile_here=False)
+    assert res.get("needs_tiling") and res["tier"] is None
+    # không có lượt nhanh nào chạy trước
+    assert reader.calls == []
+
+
+def test_untiered_small_image_runs_single_full_pass(reader):
+    res = extract_text_tiered(np.full((800, 600), 255, np.uint8))
+    assert res["tier"] == "full" and res["text"] == "E330"
+    assert all(shape == (800, 600) for _, shape in reader.calls)
@@ -0,0 +1,180 @@
+"""
+_scan_code_candidates (1 regex gộp) phải cho đúng tập ứng viên như 5 mẫu cũ
+(pat_prefixed, pat_letter_roman, pat_roman, pat_plain, pat_digit_letters) chạy lần lượt.
+Các mẫu cũ được chép nguyên văn bên dưới (bản trước khi gộp) để làm chuẩn so sánh.
+"""
+import random
+import re
+
+import pytest
+
+from benchmark_extractor import CSV_PATH, build_pools, load_rows, make_corpus
+from src.nlp_module import (
+    DIGITLIKE,
+    NOSPACE_UNITS,
+    ROMAN_OK,
+    _scan_code_candidates,
+    count_real_digits,
+    in_range,
+    is_unit_context,
+    norm,
+    to_digits,
+)
+
+# --- bản đóng băng của 5 mẫu cũ ---
+OLD_PREFIXED = re.compile(
+    rf"\b(?P<prefix>E|INS)\s*-?\s*(?P<d>{DIGITLIKE})(?P<let>[A-Za-z]?)\s*(?:\((?P<rom>{ROMAN_OK})\))?(?=$|[^A-Za-z0-9])",
+    re.IGNORECASE,
+)
+OLD_LETTER_ROMAN = re.compile(
+    rf"(?<![A-Za-z0-9])(?P<d>{DIGITLIKE})(?P<let>[A-Za-z])\s*\(\s*(?P<rom>{ROMAN_OK})\s*\)",
+    re.IGNORECASE,
+)
+OLD_ROMAN = re.compile(
+    rf"(?<![A-Za-z0-9])(?P<d>{DIGITLIKE})\s*\(\s*(?P<rom>{ROMAN_OK})\s*\)",
+    re.IGNORECASE,
+)
+OLD_PLAIN = re.compile(
+    rf"(?<![A-Za-z0-9])(?P<d>{DIGITLIKE})(?![A-Za-z])(?!\s*\()(?=$|[^A-Za-z0-9])",
+    re.IGNORECASE,
+)
+OLD_DIGIT_LETTERS = re.compile(
+    rf"(?<![A-Za-z0-9])(?P<d>{DIGITLIKE})(?P<letters>[A-Za-z]+)\b"
+    rf"(?!\s*\(\s*{ROMAN_OK}\s*\))",
+    re.IGNORECASE,
+)
+
+
+def old_scan(text):
+    """Phần quét số của extract_codes cũ (bước 2 -> 5), trả về tập mã ứng viên."""
+    found = set()
+
+    for m in OLD_PREFIXED.finditer(text):
+        dlike = m.group("d")
+        if count_real_digits(dlike) < 1:
+            continue
+        d = to_digits(dlike)
+        let = (m.group("let") or "").lower()
+        if not d:
+            if (not let) and dlike and dlike[-1].isalpha():
+                d2 = to_digits(dlike[:-1])
+                if d2:
+                    d = d2
+                    let = dlike[-1].lower()
+            if not d:
+                continue
+        if not in_range(d):
+            continue
+        prefix = m.group("prefix").upper()
+        rom = (m.group("rom") or "").lower()
+        code = f"{prefix}{d}{let}"
+        if rom:
+            code += f"({rom})"
+        found.add(code)
+
+    for m in OLD_LETTER_ROMAN.finditer(text):
+        dlike = m.group("d")
+        if count_real_digits(dlike) < 2:
+            continue
+        d = to_digits(dlike)
+        if not d or not in_range(d):
+            continue
+        if is_unit_context(text, m.start("d"), m.end("rom")):
+            continue
+        found.add(f"INS{d}{m.group('let').lower()}({m.group('rom').lower()})")
+
+    for m in OLD_ROMAN.finditer(text):
+        dlike = m.group("d")
+        if count_real_digits(dlike) < 2:
+            continue
+        d = to_digits(dlike)
+        if not d or not in_range(d):
+            continue
+        if is_unit_context(text, m.start("d"), m.end("rom")):
+            continue
+        found.add(f"INS{d}({m.group('rom').lower()})")
+
+    for m in OLD_PLAIN.finditer(text):
+        dlike = m.group("d")
+        if count_real_digits(dlike) < 2:
+            continue
+        d = to_digits(dlike)
+        if not d or not in_range(d):
+            continue
+        if is_unit_context(text, m.start("d"), m.end("d")):
+            continue
+        found.add(f"INS{d}")
+
+    for m in OLD_DIGIT_LETTERS.finditer(text):
+        dlike = m.group("d")
+        if count_real_digits(dlike) < 2:
+            continue
+        d = to_digits(dlike)
+        if not d or not in_range(d):
+            continue
+        letters = m.group("letters")
+        if re.match(rf"^{NOSPACE_UNITS}", norm(letters)):
+            continue
+        found.add(f"INS{d}{letters.lower()}")
+
+    return found
+
+
+def new_scan(text):
+    return {code for _, _, _, code in _scan_code_candidates(text)}
+
+
+# các dạng khó: đơn vị dính liền / cách, roman có khoảng trắng, nhiễu OCR, tiền tố lạ
+EDGE_CASES = [
+    "",
+    "E100",
+    "e 330, INS-211, ins 160a(ii), E160A (iv)",
+    "INS160a(iv) E-950 E 1422",
+    "211(ii) 160a ( iii ) 150d 407a 551i 1400",
+    "Năng lượng 100g, Protein 250 mg, Natri 330mg, 500 ml",
+    "Giá trị dinh dưỡng trong 100 g: 1000 kJ / 250 kcal",
+    "Hàm lượng/100g: 160",
+    "E1OO, E33O, INS 2l1, El02, 62l",
+    "Thành phần: đường, E33O (iv), 16Oa(i), bột ngọt (621)",
+    "330\n211\n 100 g\n100g",
+    "E950-E951, E.330, 330/331, (330), [211], 330;331;332",
+    "Net wt 500 g — Khối lượng tịnh: 1000 g",
+    "1234567 9999 99 E99 E9999 INS 0000",
+]
+
+
+def _mutate(rnd, text):
+    # chèn ngẫu nhiên dấu câu / khoảng trắng / ký tự OCR hay nhầm để phủ thêm ranh giới
+    out = []
+    for ch in text:
+        r = rnd.random()
+        if r < 0.02:
+            out.append(rnd.choice(" -()/.,;\n"))
+        elif r < 0.03 and ch.isdigit():
+            out.append(rnd.choice("oOlI|!sSbBzZ"))
+            continue
+        out.append(ch)
+    return "".join(out)
+
+
+def _corpus():
+    pools = build_pools(load_rows(CSV_PATH))
+    rnd = random.Random(2024)
+    texts = list(EDGE_CASES)
+    for s in make_corpus(1500, seed=2024, pools=pools, max_items=25):
+        texts.append(s["text"])
+        texts.append(_mutate(rnd, s["text"]))
+    return texts
+
+
+CORPUS = _corpus()
+
+
+@pytest.mark.parametrize("text", EDGE_CASES)
+def test_edge_cases_match_old_scanner(text):
+    assert new_scan(text) == old_scan(text)
+
+
+def test_generated_corpus_matches_old_scanner():
+    mismatches = [t for t in CORPUS if new_scan(t) != old_scan(t)]
+    assert not mismatches, f"{len(mismatches)} / {len(CORPUS)} khác nhau, vd: {mismatches[0]!r}"
@@ -0,0 +1,103 @@
+"""
+Chia ô + ghép kết quả OCR cho ảnh lớn (split_tiles -> merge_tile_results): dòng chữ nằm
+vắt qua đường nối phải ra đúng 1 lần mỗi mã, không có mã giả từ từ bị cắt đôi.
+
+Ảnh được vẽ thật bằng cv2.putText; "reader" giả gộp các từ có mực trong ô của cùng 1 dòng
+thành 1 box như EasyOCR, từ bị mép ô cắt thì bị đọc cụt như OCR đọc phần còn lại.
+"""
+import re
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from src.ocr_module import merge_tile_results, split_tiles
+
+TILE, OVERLAP = 1024, 128
+FONT, SCALE, THICK = cv2.FONT_HERSHEY_SIMPLEX, 1.4, 3
+
+# (x, y baseline, dòng) — y=1010 nằm trong vùng chồng 896..1024 của 2 dải đầu,
+# các dòng trải từ x~600 tới x>1000 nên vắt qua đường nối dọc cũ của lưới ô 1024
+LINES = [
+    (80, 300, "Thanh phan: duong, E1100, muoi, E330, E621"),
+    (600, 700, "chat on dinh E412 E415 va E1422"),
+    (500, 1010, "mau E102 E110 E150d huong E950"),
+    (40, 1560, "chat bao quan E211 E202"),
+    (700, 1600, "chat nhu hoa E471 E322 E1520"),
+]
+
+
+def render():
+    img = np.full((2600, 2400), 255, np.uint8)
+    lines = []
+    for x, y, line in LINES:
+        words = []
+        for word in line.split():
+            (w, h), base = cv2.getTextSize(word, FONT, SCALE, THICK)
+            cv2.putText(img, word, (x, y), FONT, SCALE, 0, THICK)
+            words.append(((x, x + w, y - h - THICK, y + base), word))
+            x += w + cv2.getTextSize(" ", FONT, SCALE, THICK)[0][0]
+        lines.append(words)
+    return img, lines
+
+
+def fake_read(img, lines, ox, oy, tile):
+    th, tw = tile.shape[:2]
+    out = []
+    for words in lines:
+        boxes, texts, cut = [], [], False
+        for (x0, x1, y0, y1), word in words:
+            ink = int((img[y0:y1, x0:x1] < 128).sum())
+            cx0, cx1 = max(x0, ox), min(x1, ox + tw)
+            cy0, cy1 = max(y0, oy), min(y1, oy + th)
+            if cx0 >= cx1 or cy0 >= cy1:
+                continue
+            seen = int((tile[cy0 - oy:cy1 - oy, cx0 - ox:cx1 - ox] < 128).sum())
+            if not ink or seen < 0.5 * ink:
+                continue
+            text = word
+            if (cx0, cx1, cy0, cy1) != (x0, x1, y0, y1):
+                # phần bị cắt mất -> đọc cụt (vd. "E1100," -> "E11")
+                text, cut = word[:max(1, int(len(word) * seen / ink))], True
+            boxes.append((cx0 - ox, cx1 - ox, cy0 - oy, cy1 - oy))
+            texts.append(text)
+        if boxes:
+            box = (min(b[0] for b in boxes), max(b[1] for b in boxes),
+                   min(b[2] for b in boxes), max(b[3] for b in boxes))
+            out.append((box, " ".join(texts), 0.6 if cut else 0.9))
+    return out
+
+
+def codes(text):
+    return Counter(re.findall(r"E\d+[a-z]?", text))
+
+
+def merged_text(img, lines):
+    tiles = split_tiles(img, TILE, OVERLAP)
+    results = [fake_read(img, lines, x, y, t) for x, y, t in tiles]
+    return " ".join(text for _, text, _ in merge_tile_results(tiles, results))
+
+
+def test_tiles_are_full_width_strips():
+    img, _ = render()
+    tiles = split_tiles(img, TILE, OVERLAP)
+    assert len(tiles) > 1
+    assert all(x == 0 and t.shape[1] == img.shape[1] for x, _, t in tiles)
+    assert tiles[-1][1] + tiles[-1][2].shape[0] == img.shape[0]
+
+
+def test_lines_across_seams_keep_each_code_once():
+    img, lines = render()
+    expected = codes(" ".join(line for _, _, line in LINES))
+    got = codes(merged_text(img, lines))
+    assert got == expected
+    assert all(n == 1 for n in got.values())
+
+
+def test_equal_copies_keep_higher_confidence():
+    # cùng 1 dòng nằm trọn trong vùng chồng của 2 ô: giữ bản tin cậy cao hơn
+    tiles = [(0, 0, None), (0, 896, None)]
+    results = [[((10, 400, 950, 990), "E1O2 E11O", 0.4)],
+               [((10, 401, 54, 94), "E102 E110", 0.95)]]
+    lines = merge_tile_results(tiles, results)
+    assert [text for _, text, _ in lines] == ["E102 E110"]